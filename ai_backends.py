@@ -0,0 +1,147 @@
+import os
+import base64
+import logging
+from typing import Optional, Tuple
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GEMINI_MODEL = "gemini-3-pro-image-preview"
+
+
+class AIBackendError(Exception):
+    """Raised when an AI backend call fails."""
+
+
+class AIRateLimitError(AIBackendError):
+    """Raised when an AI backend rejects a call with a rate limit (HTTP 429)."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AIBackend:
+    """Interface for services that take a prompt plus an image and return an edited image."""
+
+    name = "base"
+    model_name = None
+
+    def generate_image(self, prompt: str, image_bytes: bytes, mime_type: str = "image/jpeg") -> Tuple[Optional[bytes], str]:
+        """Send prompt and image to the service.
+
+        Returns (image_bytes, response_text). image_bytes is None when the service
+        answered with text only. Raises on transport or service errors.
+        """
+        raise NotImplementedError
+
+
+class GeminiBackend(AIBackend):
+    """Google Gemini image model via the google-genai client."""
+
+    name = "gemini"
+
+    def __init__(self, api_key: str = None, model_name: str = None):
+        self.api_key = api_key or os.getenv('GEMINI_API_KEY') or os.getenv('GOOGLE_API_KEY')
+        if not self.api_key:
+            raise ValueError("GEMINI_API_KEY is required")
+        from google import genai
+        from google.genai import types
+        self._types = types
+        self.client = genai.Client(api_key=self.api_key)
+        self.model_name = model_name or DEFAULT_GEMINI_MODEL
+
+    def generate_image(self, prompt: str, image_bytes: bytes, mime_type: str = "image/jpeg") -> Tuple[Optional[bytes], str]:
+        image_part = self._types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
+        response = self.client.models.generate_content(
+            model=self.model_name,
+            contents=[
+                prompt,
+                image_part
+            ]
+        )
+
+        response_text = ""
+        image_data = None
+        if hasattr(response, 'parts'):
+            for part in response.parts or []:
+                if hasattr(part, 'inline_data') and part.inline_data:
+                    if image_data is None:
+                        image_data = part.inline_data.data
+                elif hasattr(part, 'text') and part.text:
+                    response_text += part.text
+        elif hasattr(response, 'text'):
+            response_text = response.text or ""
+
+        return image_data, response_text
+
+
+class LocalStubBackend(AIBackend):
+    """Client for the local stand-in server in ai_stub_server.py.
+
+    Sends the same base64 JSON payload size as a real image model call, so load tests
+    and benchmarks see realistic request/response encoding costs without spending money.
+    """
+
+    name = "stub"
+
+    def __init__(self, url: str = None, timeout: float = None, model_name: str = None):
+        self.url = (url or os.getenv('AI_STUB_URL', 'http://127.0.0.1:8765')).rstrip('/')
+        self.timeout = timeout or float(os.getenv('AI_STUB_TIMEOUT', '120'))
+        self.model_name = model_name or "local-stub"
+        self._session = requests.Session()
+
+    def generate_image(self, prompt: str, image_bytes: bytes, mime_type: str = "image/jpeg") -> Tuple[Optional[bytes], str]:
+        try:
+            response = self._session.post(
+                f"{self.url}/v1/generate",
+                json={
+                    'model': self.model_name,
+                    'prompt': prompt,
+                    'mime_type': mime_type,
+                    'image': base64.b64encode(image_bytes).decode('ascii')
+                },
+                timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            raise AIBackendError(f"Stub AI server unreachable: {e}") from e
+
+        if response.status_code == 429:
+            retry_after = response.headers.get('Retry-After')
+            raise AIRateLimitError(
+                "Stub AI server rate limited the request (429)",
+                retry_after=float(retry_after) if retry_after else None
+            )
+        if response.status_code >= 400:
+            raise AIBackendError(f"Stub AI server error {response.status_code}: {response.text[:200]}")
+
+        payload = response.json()
+        image_b64 = payload.get('image')
+        return (base64.b64decode(image_b64) if image_b64 else None), payload.get('text', '')
+
+
+def configured_backend(api_key: str = None) -> Tuple[str, str]:
+    """(backend name, model name) selected by AI_BACKEND / AI_MODEL, without building a client.
+
+    Raises ValueError for an unknown backend or a missing Gemini key, so misconfiguration
+    still fails at startup even though the client itself is created on first use.
+    """
+    backend_name = os.getenv('AI_BACKEND', 'gemini').strip().lower()
+    model_name = os.getenv('AI_MODEL') or None
+    if backend_name == 'stub':
+        return backend_name, model_name or "local-stub"
+    if backend_name != 'gemini':
+        raise ValueError(f"Unknown AI_BACKEND: {backend_name}")
+    if not (api_key or os.getenv('GEMINI_API_KEY') or os.getenv('GOOGLE_API_KEY')):
+        raise ValueError("GEMINI_API_KEY is required")
+    return backend_name, model_name or DEFAULT_GEMINI_MODEL
+
+
+def create_backend(api_key: str = None) -> AIBackend:
+    """Build the backend selected by AI_BACKEND ('gemini' by default, or 'stub')."""
+    backend_name, model_name = configured_backend(api_key)
+    if backend_name == 'stub':
+        logger.info("Using local stub AI backend")
+        return LocalStubBackend(model_name=model_name)
+    return GeminiBackend(api_key=api_key, model_name=model_name)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the AI image service, used by load tests and benchmarks.
+
+It accepts the JSON payload sent by ai_backends.LocalStubBackend and returns a
+lightly transformed copy of the image. Latency follows a log-normal distribution.
+A configurable share of calls fail with HTTP 500 or HTTP 429.
+
+Usage: python ai_stub_server.py --port 8765 --latency-median 20 --latency-sigma 0.4 \
+           --error-rate 0.02 --rate-limit-rate 0.05
+Then run the app with AI_BACKEND=stub AI_STUB_URL=http://127.0.0.1:8765
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import random
+import argparse
+import threading
+from io import BytesIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image, ImageEnhance, ImageOps
+
+
+class StubConfig:
+    """Behaviour knobs for the stand-in server."""
+
+    def __init__(self, latency_median=20.0, latency_sigma=0.4, latency_max=90.0,
+                 error_rate=0.0, rate_limit_rate=0.0, retry_after=5, seed=None):
+        self.latency_median = latency_median  # seconds
+        self.latency_sigma = latency_sigma    # log-normal shape
+        self.latency_max = latency_max        # hard cap, seconds
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample_latency(self):
+        if self.latency_median <= 0:
+            return 0.0
+        with self._lock:
+            latency = self.latency_median * self._random.lognormvariate(0, self.latency_sigma)
+        return min(latency, self.latency_max)
+
+    def sample_outcome(self):
+        """Return 'rate_limited', 'error' or 'ok'."""
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            return 'rate_limited'
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 'error'
+        return 'ok'
+
+
+def transform_image(image_bytes):
+    """Return a visibly 'enhanced' JPEG: auto-contrast plus a small colour boost."""
+    with Image.open(BytesIO(image_bytes)) as img:
+        img = img.convert('RGB')
+        img = ImageOps.autocontrast(img, cutoff=1)
+        img = ImageEnhance.Color(img).enhance(1.15)
+        output = BytesIO()
+        img.save(output, format='JPEG', quality=92)
+        return output.getvalue()
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    server_version = "AIStub/1.0"
+
+    def log_message(self, format, *args):
+        if not getattr(self.server, 'quiet', False):
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/healthz':
+            self._send_json(200, {'status': 'ok'})
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/v1/generate':
+            self._send_json(404, {'error': 'not found'})
+            return
+
+        config = self.server.config
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            payload = json.loads(self.rfile.read(length))
+            image_bytes = base64.b64decode(payload['image'])
+        except Exception as e:
+            self._send_json(400, {'error': f'invalid payload: {e}'})
+            return
+
+        outcome = config.sample_outcome()
+        if outcome == 'rate_limited':
+            # Rate limits are returned quickly, like the real service
+            self._send_json(429, {'error': 'RESOURCE_EXHAUSTED'},
+                            headers={'Retry-After': str(config.retry_after)})
+            return
+
+        time.sleep(config.sample_latency())
+
+        if outcome == 'error':
+            self._send_json(500, {'error': 'INTERNAL: simulated model failure'})
+            return
+
+        try:
+            result = transform_image(image_bytes)
+        except Exception as e:
+            self._send_json(200, {'text': f'Could not process image: {e}'})
+            return
+
+        self._send_json(200, {
+            'image': base64.b64encode(result).decode('ascii'),
+            'text': 'Enhanced by local stub'
+        })
+
+
+def start_stub_server(host='127.0.0.1', port=0, config=None, quiet=True):
+    """Start the stand-in server on a background thread. Returns the server; its URL is
+    f"http://{host}:{server.server_address[1]}". Call server.shutdown() to stop it."""
+    server = ThreadingHTTPServer((host, port), StubRequestHandler)
+    server.daemon_threads = True
+    server.config = config or StubConfig()
+    server.quiet = quiet
+    thread = threading.Thread(target=server.serve_forever, name='ai-stub-server', daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the AI image service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=int(os.getenv('AI_STUB_PORT', '8765')))
+    parser.add_argument('--latency-median', type=float, default=20.0, help='Median latency in seconds')
+    parser.add_argument('--latency-sigma', type=float, default=0.4, help='Log-normal sigma of the latency')
+    parser.add_argument('--latency-max', type=float, default=90.0, help='Latency cap in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of calls failing with HTTP 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Share of calls rejected with HTTP 429')
+    parser.add_argument('--retry-after', type=int, default=5, help='Retry-After seconds sent with 429s')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for reproducible runs')
+    parser.add_argument('--quiet', action='store_true', help='Do not log each request')
+    args = parser.parse_args()
+
+    config = StubConfig(
+        latency_median=args.latency_median,
+        latency_sigma=args.latency_sigma,
+        latency_max=args.latency_max,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), StubRequestHandler)
+    server.daemon_threads = True
+    server.config = config
+    server.quiet = args.quiet
+    print(f"AI stub server listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
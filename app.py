@@ -1,31 +1,55 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session, send_file
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session, send_file, stream_with_context, g
 from flask_cors import CORS
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_bcrypt import Bcrypt
-from authlib.integrations.flask_client import OAuth
 import os
 import base64
 import json
 import logging
 import re
 import time
+import functools
 import hashlib
-from datetime import datetime
+import hmac
+import importlib
+import shutil
+import threading
+from datetime import datetime, timedelta
 from io import BytesIO
 from werkzeug.utils import secure_filename
 from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.http import is_resource_modified
 from dotenv import load_dotenv
+
+# Load environment variables from .env file. Before the local modules below, which read
+# their settings when imported
+load_dotenv()
+
 from image_enhancer import ImageEnhancer
-from models import db, User, EnhancedImage, Payment
-import stripe
+from perceptual_hash import dhash, hamming_distance
+import chunked_uploads
+import cold_storage
+import image_pool
+import keyset
+import metrics
+import migrations
+import photo_listing
+import profiling
+import query_stats
+import renditions
+import request_timing
+import storage
+import upload_validation
+import zip_stream
+from request_timing import span
+from models import db, User, EnhancedImage, Payment, ArchivedPayload
+from sqlalchemy import text
+from sqlalchemy.orm import defer
 from sqlalchemy.exc import OperationalError
 from PIL import Image, ImageDraw, ImageFont, ImageOps
 import math
 import uuid
 
-# Load environment variables from .env file
-load_dotenv()
-
 # Configure logging
 log_handlers = [logging.StreamHandler()]
 # Only add file handler if not in production (controlled by environment)
@@ -74,6 +98,7 @@ def retry_db_operation(operation, max_retries=3, initial_delay=1, max_delay=10):
             
             if (is_recovery_mode or is_connection_error) and attempt < max_retries:
                 last_exception = e
+                metrics.DB_RETRIES.labels('recovery_mode' if is_recovery_mode else 'connection').inc()
                 logger.warning(
                     f"Database operation failed (attempt {attempt + 1}/{max_retries + 1}): {type(e).__name__}. "
                     f"Retrying in {delay}s..."
@@ -94,42 +119,6 @@ def retry_db_operation(operation, max_retries=3, initial_delay=1, max_delay=10):
     if last_exception:
         raise last_exception
 
-# Verify Stripe library is properly installed (after logger is initialized)
-try:
-    # Check if stripe module is actually the Stripe library
-    stripe_module_path = getattr(stripe, '__file__', None)
-    stripe_version = getattr(stripe, '__version__', None)
-    
-    logger.info(f"Stripe module path: {stripe_module_path}")
-    logger.info(f"Stripe library version: {stripe_version}")
-    
-    # Try to access checkout directly to see if it exists
-    try:
-        checkout_attr = getattr(stripe, 'checkout', None)
-        logger.info(f"stripe.checkout type: {type(checkout_attr)}")
-        logger.info(f"stripe.checkout value: {checkout_attr}")
-        
-        if checkout_attr is None:
-            logger.error("CRITICAL: stripe.checkout is None")
-            logger.error("Attempting to diagnose Stripe installation issue...")
-            # Try to check if it's a namespace issue
-            try:
-                import stripe.checkout as checkout_module
-                logger.info(f"Direct import of stripe.checkout successful: {checkout_module}")
-                # If direct import works, reassign it
-                stripe.checkout = checkout_module
-                logger.info("Fixed: Reassigned stripe.checkout from direct import")
-            except ImportError as ie:
-                logger.error(f"Direct import of stripe.checkout failed: {ie}")
-            except Exception as fix_error:
-                logger.error(f"Error trying to fix checkout: {fix_error}")
-        else:
-            logger.info("Stripe checkout module is available")
-    except AttributeError as ae:
-        logger.error(f"CRITICAL: Cannot access stripe.checkout: {ae}")
-except Exception as e:
-    logger.error(f"CRITICAL: Error verifying Stripe library: {e}", exc_info=True)
-
 app = Flask(__name__, static_folder='static', template_folder='.')
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-change-in-production')
 
@@ -138,6 +127,8 @@ IMAGE_MAX_EDGE = int(os.getenv('IMAGE_MAX_EDGE', '4096'))
 IMAGE_JPEG_QUALITY = int(os.getenv('IMAGE_JPEG_QUALITY', '92'))
 # Re-normalize JPEG quality into a safe range for Pillow.
 IMAGE_JPEG_QUALITY = max(60, min(98, IMAGE_JPEG_QUALITY))
+# Max Hamming distance (out of 64 bits) for two uploads to count as near-duplicates
+PHASH_MAX_DISTANCE = int(os.getenv('PHASH_MAX_DISTANCE', '6'))
 app.config['MAX_CONTENT_LENGTH'] = max(1, MAX_UPLOAD_MB) * 1024 * 1024
 
 # Database configuration - supports both PostgreSQL and SQLite
@@ -184,8 +175,9 @@ if database_url.startswith('postgresql://'):
     app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
         'pool_pre_ping': True,  # Verify connections before using (handles connection drops)
         'pool_recycle': 300,    # Recycle connections after 5 minutes
-        'pool_size': 5,         # Number of connections to maintain
-        'max_overflow': 10,     # Additional connections beyond pool_size
+        'pool_size': int(os.getenv('DB_POOL_SIZE', '5')),        # Number of connections to maintain
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '10')),  # Additional connections beyond pool_size
+        'poolclass': metrics.TimedQueuePool,  # Records checkout wait time for /metrics
     }
 
 # Google Tag Manager Configuration
@@ -200,40 +192,53 @@ app.config['STRIPE_PUBLISHABLE_KEY'] = os.getenv('STRIPE_PUBLISHABLE_KEY', '')
 app.config['STRIPE_SECRET_KEY'] = os.getenv('STRIPE_SECRET_KEY', '')
 app.config['STRIPE_WEBHOOK_SECRET'] = os.getenv('STRIPE_WEBHOOK_SECRET', '')
 
-# Initialize Stripe
-stripe_secret_key = os.getenv('STRIPE_SECRET_KEY', '')
-if stripe_secret_key:
+# Initialize Stripe. The library itself is imported on first use (see get_stripe)
+stripe_secret_key = os.getenv('STRIPE_SECRET_KEY', '').strip()
+app.config['STRIPE_SECRET_KEY'] = stripe_secret_key
+if not stripe_secret_key:
+    logger.warning("STRIPE_SECRET_KEY not set - payment features will not work")
+
+_stripe = None
+_stripe_lock = threading.Lock()
+
+
+def _verify_stripe(stripe_module):
+    """Check that the Stripe library exposes checkout.Session, repairing a missing namespace."""
+    logger.info(f"Stripe module path: {getattr(stripe_module, '__file__', None)}")
+    logger.info(f"Stripe library version: {getattr(stripe_module, '__version__', None)}")
     try:
-        # Sanitize the API key - remove whitespace, newlines, etc.
-        stripe_secret_key = stripe_secret_key.strip()
-        stripe.api_key = stripe_secret_key
-        app.config['STRIPE_SECRET_KEY'] = stripe_secret_key
-        # Verify Stripe is fully initialized and checkout is available
-        # Force access to checkout to ensure it's loaded
-        try:
-            # Check if checkout exists
-            if not hasattr(stripe, 'checkout'):
-                logger.error("Stripe module missing 'checkout' attribute - Stripe library may be corrupted")
-            elif stripe.checkout is None:
-                logger.error("stripe.checkout is None - Stripe library initialization failed")
-                logger.error(f"Stripe version: {getattr(stripe, '__version__', 'unknown')}")
-                logger.error("This may indicate a problem with the Stripe library installation")
-            else:
-                # Try to access Session to ensure it's available
-                if hasattr(stripe.checkout, 'Session'):
-                    logger.info(f"Stripe initialized successfully (key starts with: {stripe_secret_key[:7]}...)")
-                    logger.info(f"Stripe version: {getattr(stripe, '__version__', 'unknown')}")
-                else:
-                    logger.warning("Stripe checkout.Session not available - this may cause payment issues")
-        except Exception as init_error:
-            logger.error(f"Error verifying Stripe checkout: {init_error}")
-            logger.warning("Stripe API key set but checkout verification failed - this may cause payment issues")
+        if getattr(stripe_module, 'checkout', None) is None:
+            logger.error("CRITICAL: stripe.checkout is None")
+            try:
+                import stripe.checkout as checkout_module
+                stripe_module.checkout = checkout_module
+                logger.info("Fixed: Reassigned stripe.checkout from direct import")
+            except ImportError as ie:
+                logger.error(f"Direct import of stripe.checkout failed: {ie}")
+        elif hasattr(stripe_module.checkout, 'Session'):
+            logger.info("Stripe checkout module is available")
+        else:
+            logger.warning("Stripe checkout.Session not available - this may cause payment issues")
     except Exception as e:
-        logger.error(f"Error initializing Stripe: {e}")
-        app.config['STRIPE_SECRET_KEY'] = ''
-else:
-    logger.warning("STRIPE_SECRET_KEY not set - payment features will not work")
-    app.config['STRIPE_SECRET_KEY'] = ''
+        logger.error(f"CRITICAL: Error verifying Stripe library: {e}", exc_info=True)
+
+
+def get_stripe():
+    """The configured stripe module, imported and verified on first call (thread-safe).
+
+    Deferred so workers that never handle a payment do not pay for the import.
+    """
+    global _stripe
+    if _stripe is None:
+        with _stripe_lock:
+            if _stripe is None:
+                import stripe
+                if app.config['STRIPE_SECRET_KEY']:
+                    stripe.api_key = app.config['STRIPE_SECRET_KEY']
+                    logger.info(f"Stripe initialized (key starts with: {app.config['STRIPE_SECRET_KEY'][:7]}...)")
+                _verify_stripe(stripe)
+                _stripe = stripe
+    return _stripe
 
 # Price per photo in cents ($0.9 = 90 cents)
 PHOTO_PRICE_CENTS = 90
@@ -241,6 +246,9 @@ ANONYMOUS_TRIAL_LIMIT = int(os.getenv('ANONYMOUS_TRIAL_LIMIT', '5'))
 ANONYMOUS_BROWSER_COOKIE = 'anon_browser_id'
 
 CORS(app)
+request_timing.init_app(app)
+query_stats.init_app(app)
+profiling.init_app(app, lambda: current_user.is_authenticated and is_admin_user(current_user))
 
 
 @app.errorhandler(RequestEntityTooLarge)
@@ -249,6 +257,34 @@ def handle_request_entity_too_large(_exc):
         'error': f'File too large. Maximum upload size is {MAX_UPLOAD_MB} MB per request.'
     }), 413
 
+
+def image_pool_busy_response(exc):
+    """503 for image work the bounded image pool refused or did not finish in time."""
+    logger.warning(f"Image pool rejected {request.endpoint}: {exc}")
+    response = jsonify({'error': 'The server is busy processing images. Please try again in a moment.'})
+    response.headers['Retry-After'] = str(exc.retry_after)
+    return response, 503
+
+
+app.register_error_handler(image_pool.ImagePoolError, image_pool_busy_response)
+
+
+def chunked_upload_error_response(exc):
+    return jsonify({'error': str(exc), **exc.details()}), exc.status
+
+
+app.register_error_handler(chunked_uploads.UploadError, chunked_upload_error_response)
+
+
+def upload_rejected_response(exc):
+    logger.warning(f"Rejected upload on {request.endpoint}: {exc}")
+    return jsonify({'error': str(exc)}), exc.status
+
+
+app.register_error_handler(upload_validation.UploadRejected, upload_rejected_response)
+# A chunk is one request body, so it cannot be larger than MAX_UPLOAD_MB
+chunked_uploads.UPLOAD_CHUNK_MB = min(chunked_uploads.UPLOAD_CHUNK_MB, max(1, MAX_UPLOAD_MB))
+
 # Make GTM_CONTAINER_ID and GA4_MEASUREMENT_ID available to all templates
 @app.context_processor
 def inject_gtm_container_id():
@@ -265,17 +301,29 @@ login_manager.init_app(app)
 login_manager.login_view = 'login'
 login_manager.login_message = 'Please log in to access this page.'
 
-# Initialize OAuth
-oauth = OAuth(app)
-google = oauth.register(
-    name='google',
-    client_id=os.getenv('GOOGLE_CLIENT_ID'),
-    client_secret=os.getenv('GOOGLE_CLIENT_SECRET'),
-    server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
-    client_kwargs={
-        'scope': 'openid email profile'
-    }
-)
+# Initialize OAuth. Authlib is imported and the Google client registered on first use
+_google_oauth = None
+_google_oauth_lock = threading.Lock()
+
+
+def get_google_oauth():
+    """The registered Google OAuth client, created on first call (thread-safe)."""
+    global _google_oauth
+    if _google_oauth is None:
+        with _google_oauth_lock:
+            if _google_oauth is None:
+                from authlib.integrations.flask_client import OAuth
+                oauth = OAuth(app)
+                _google_oauth = oauth.register(
+                    name='google',
+                    client_id=os.getenv('GOOGLE_CLIENT_ID'),
+                    client_secret=os.getenv('GOOGLE_CLIENT_SECRET'),
+                    server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
+                    client_kwargs={
+                        'scope': 'openid email profile'
+                    }
+                )
+    return _google_oauth
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -358,29 +406,43 @@ def attach_anonymous_browser_cookie(response, browser_id, cookie_created):
     return response
 
 
+@metrics.timed(metrics.IMAGE_OPERATION_SECONDS, 'normalize')
 def normalize_saved_upload(original_path: str):
     """Downscale or recompress oversized uploads before AI processing.
 
-    Returns (path_for_processing, basename_for_records). Leaves small JPEGs untouched.
+    Returns (path_for_processing, basename_for_records, perceptual_hash). Leaves small
+    JPEGs untouched. perceptual_hash is None if the image could not be decoded.
     """
     basename_orig = os.path.basename(original_path)
+    phash = None
     try:
         file_size = os.path.getsize(original_path)
         ext = os.path.splitext(original_path)[1].lower()
         large_file = file_size > 15 * 1024 * 1024
 
         with Image.open(original_path) as img:
+            # Format from the file's content; a PNG or animated GIF named .jpg is still re-encoded
+            is_jpeg = img.format in ('JPEG', 'MPO')
+            max_dim = max(img.size)
+            if is_jpeg and max_dim > IMAGE_MAX_EDGE:
+                # Let libjpeg decode at 1/2, 1/4 or 1/8 scale when that still covers IMAGE_MAX_EDGE
+                scale = IMAGE_MAX_EDGE / max_dim
+                img.draft('RGB', (math.ceil(img.width * scale), math.ceil(img.height * scale)))
             oriented = ImageOps.exif_transpose(img)
-            w, h = oriented.size
-            max_dim = max(w, h)
+
+            try:
+                phash = dhash(oriented)
+            except Exception as hash_err:
+                logger.warning('Could not compute perceptual hash for %s: %s', basename_orig, hash_err)
 
             needs_work = (
                 max_dim > IMAGE_MAX_EDGE
                 or ext not in ('.jpg', '.jpeg')
+                or not is_jpeg
                 or large_file
             )
             if not needs_work:
-                return original_path, basename_orig
+                return original_path, basename_orig, phash
 
             im = oriented
             if im.mode == 'RGBA':
@@ -400,7 +462,8 @@ def normalize_saved_upload(original_path: str):
 
             base, _ = os.path.splitext(original_path)
             normalized_path = base + '_work.jpg'
-            im.save(normalized_path, 'JPEG', quality=IMAGE_JPEG_QUALITY, optimize=True)
+            with storage.atomic_path(normalized_path) as tmp_path:
+                im.save(tmp_path, 'JPEG', quality=IMAGE_JPEG_QUALITY, optimize=True)
 
         if normalized_path != original_path:
             try:
@@ -408,14 +471,131 @@ def normalize_saved_upload(original_path: str):
             except OSError as rm_err:
                 logger.warning('Could not remove pre-normalize upload %s: %s', original_path, rm_err)
 
-        return normalized_path, os.path.basename(normalized_path)
+        return normalized_path, os.path.basename(normalized_path), phash
 
+    except Image.DecompressionBombError as exc:
+        # Never hand an over-budget image on to the AI encoder, which would decode it again
+        raise upload_validation.ImageTooLarge(str(exc)) from None
     except Exception as exc:
         logger.warning('Upload normalize skipped; using original (%s)', exc)
-        return original_path, basename_orig
+        return original_path, basename_orig, phash
+
+
+def find_near_duplicate(user_id, phash, conversion_type, change_intensity='moderate', detail_level='moderate'):
+    """Find the user's closest earlier photo with the same settings and a similar perceptual hash.
+
+    Reads (id, perceptual_hash) pairs from the (user_id, conversion_type, change_intensity,
+    detail_level, perceptual_hash) index alone, without touching the table, and compares
+    Hamming distances in Python. Ties go to the newest photo (highest id).
+    Returns an EnhancedImage or None.
+    """
+    if not user_id or not phash:
+        return None
+
+    candidates = db.session.query(EnhancedImage.id, EnhancedImage.perceptual_hash).filter(
+        EnhancedImage.user_id == user_id,
+        EnhancedImage.conversion_type == conversion_type,
+        EnhancedImage.change_intensity == change_intensity,
+        EnhancedImage.detail_level == detail_level,
+        EnhancedImage.perceptual_hash.isnot(None)
+    ).all()
+
+    best_id = None
+    best_distance = PHASH_MAX_DISTANCE + 1
+    for candidate_id, candidate_hash in candidates:
+        distance = hamming_distance(phash, candidate_hash)
+        if distance < best_distance or (distance == best_distance and candidate_id > best_id):
+            best_id, best_distance = candidate_id, distance
+
+    if best_id is None:
+        return None
+    logger.info(f"Found near-duplicate photo {best_id} for user {user_id} (distance {best_distance})")
+    return db.session.get(EnhancedImage, best_id)
+
+
+def build_duplicate_response(photo):
+    """Build an enhance/convert response that reuses an existing photo's enhancement."""
+    def as_base64(source):
+        stored_data = getattr(photo, f'{source}_image_data')
+        if stored_data:
+            return stored_data
+        image_bytes = read_photo_bytes(photo, source)
+        return base64.b64encode(image_bytes).decode('utf-8') if image_bytes else None
+
+    original_data = as_base64('original')
+    enhanced_data = as_base64('enhanced')
+    if not original_data or not enhanced_data:
+        return None
+
+    return jsonify({
+        'success': True,
+        'original_image_url': f"data:image/jpeg;base64,{original_data}",
+        'enhanced_image_url': f"data:image/jpeg;base64,{enhanced_data}",
+        'enhancements': json.loads(photo.enhancement_settings) if photo.enhancement_settings else None,
+        'image_id': photo.id,
+        'requires_login': False,
+        'conversion_type': photo.conversion_type,
+        'reused_duplicate': True
+    })
+
+
+def release_db_connection():
+    """End the session's read transaction so its connection goes back to the pool.
+
+    Call before waiting on the AI service: the wait can take tens of seconds, and with
+    threaded serving (asgi.py) every in-flight call would otherwise pin a connection.
+    Loaded objects, current_user included, are refreshed on their next access.
+    """
+    db.session.commit()
+
+
+def wants_duplicate_reuse():
+    """Whether the client asked to reuse an existing enhancement for near-duplicate uploads."""
+    return request.form.get('reuse_duplicate', '').lower() in ('1', 'true', 'yes')
+
+
+def get_request_upload(action):
+    """The photo sent to /api/enhance or /api/convert-to-night, and an error response if none.
+
+    That is the multipart `image` file, or the chunked upload being finalized
+    (finalize_chunked_upload). Both have `filename` and `save(path)`.
+    """
+    upload = g.get('chunked_upload')
+    if upload is not None:
+        return upload, None
+    if 'image' not in request.files:
+        logger.warning(f"{action} request without image file")
+        return None, (jsonify({'error': 'No image file provided'}), 400)
 
+    file = request.files['image']
+    if file.filename == '':
+        logger.warning(f"{action} request with empty filename")
+        return None, (jsonify({'error': 'No file selected'}), 400)
+
+    if not allowed_file(file.filename):
+        logger.warning(f"Invalid file type attempted: {file.filename}")
+        return None, (jsonify({'error': 'Invalid file type'}), 400)
+    return file, None
+
+
+def save_request_upload(upload, path):
+    """Save the photo from get_request_upload() to `path` once its header passes upload_validation.
+
+    Raises upload_validation.UploadRejected before anything is written for a file that
+    is not a supported image or is over UPLOAD_MAX_MEGAPIXELS.
+    """
+    if isinstance(upload, chunked_uploads.ChunkedUpload):
+        upload_validation.check_file(upload.data_path)
+        upload.save(path)
+    else:
+        upload_validation.save_stream(upload.stream, path)
+
+
+# Schema changes run in the release step (python migrate.py); workers only compare versions.
+# Local SQLite setups migrate on startup so `python app.py` keeps working without a release step.
+AUTO_MIGRATE = os.getenv('AUTO_MIGRATE', 'True' if database_url.startswith('sqlite') else 'False').lower() == 'true'
+SCHEMA_VERSION = 0
 
-# Create database tables with error handling
 with app.app_context():
     try:
         # Log database configuration
@@ -428,96 +608,19 @@ with app.app_context():
         else:
             logger.info(f"Using database: {db_uri.split('://')[0] if '://' in db_uri else 'unknown'}")
         
-        # Create all tables
-        db.create_all()
-        logger.info("Database tables created successfully")
+        metrics.instrument_engine(db.engine)
         
-        # Add new columns to existing tables if they don't exist (for migrations)
-        try:
-            from sqlalchemy import inspect, text
-            inspector = inspect(db.engine)
-            
-            # Check if user table exists and add is_admin column if needed
-            if 'user' in inspector.get_table_names():
-                user_columns = [col['name'] for col in inspector.get_columns('user')]
-                if 'is_admin' not in user_columns:
-                    logger.info("Adding is_admin column to user table...")
-                    with db.engine.connect() as conn:
-                        if db_uri.startswith('sqlite'):
-                            conn.execute(text('ALTER TABLE user ADD COLUMN is_admin BOOLEAN DEFAULT 0'))
-                        else:
-                            conn.execute(text('ALTER TABLE "user" ADD COLUMN is_admin BOOLEAN DEFAULT FALSE'))
-                        conn.commit()
-                    logger.info("Added is_admin column to user table")
-            
-            # Check if enhanced_image table exists
-            if 'enhanced_image' in inspector.get_table_names():
-                columns = [col['name'] for col in inspector.get_columns('enhanced_image')]
-                
-                if 'original_image_data' not in columns:
-                    logger.info("Adding original_image_data column to enhanced_image table...")
-                    with db.engine.connect() as conn:
-                        conn.execute(text('ALTER TABLE enhanced_image ADD COLUMN original_image_data TEXT'))
-                        conn.commit()
-                    logger.info("Added original_image_data column")
-                
-                if 'enhanced_image_data' not in columns:
-                    logger.info("Adding enhanced_image_data column to enhanced_image table...")
-                    with db.engine.connect() as conn:
-                        conn.execute(text('ALTER TABLE enhanced_image ADD COLUMN enhanced_image_data TEXT'))
-                        conn.commit()
-                    logger.info("Added enhanced_image_data column")
-                
-                if 'conversion_type' not in columns:
-                    logger.info("Adding conversion_type column to enhanced_image table...")
-                    with db.engine.connect() as conn:
-                        # For SQLite
-                        if db_uri.startswith('sqlite'):
-                            conn.execute(text('ALTER TABLE enhanced_image ADD COLUMN conversion_type VARCHAR(20) DEFAULT "enhancement"'))
-                        # For PostgreSQL
-                        else:
-                            conn.execute(text('ALTER TABLE "enhanced_image" ADD COLUMN conversion_type VARCHAR(20) DEFAULT \'enhancement\''))
-                        conn.commit()
-                    logger.info("Added conversion_type column")
-            
-            # Check if user table exists and add has_free_access column if needed
-            if 'user' in inspector.get_table_names():
-                columns = [col['name'] for col in inspector.get_columns('user')]
-                
-                if 'has_free_access' not in columns:
-                    logger.info("Adding has_free_access column to user table...")
-                    with db.engine.connect() as conn:
-                        # For SQLite
-                        if db_uri.startswith('sqlite'):
-                            conn.execute(text('ALTER TABLE user ADD COLUMN has_free_access BOOLEAN DEFAULT 0'))
-                        # For PostgreSQL
-                        else:
-                            conn.execute(text('ALTER TABLE "user" ADD COLUMN has_free_access BOOLEAN DEFAULT FALSE'))
-                        conn.commit()
-                    logger.info("Added has_free_access column")
-                
-                if 'is_admin' not in columns:
-                    logger.info("Adding is_admin column to user table...")
-                    with db.engine.connect() as conn:
-                        # For SQLite
-                        if db_uri.startswith('sqlite'):
-                            conn.execute(text('ALTER TABLE user ADD COLUMN is_admin BOOLEAN DEFAULT 0'))
-                        # For PostgreSQL
-                        else:
-                            conn.execute(text('ALTER TABLE "user" ADD COLUMN is_admin BOOLEAN DEFAULT FALSE'))
-                        conn.commit()
-                    logger.info("Added is_admin column to user table")
-        except Exception as migration_error:
-            # Columns might already exist or table might not exist yet - that's okay
-            logger.warning(f"Migration check: {migration_error} (columns may already exist or table not created yet)")
-        
-        # Verify tables exist by trying to query
-        try:
-            user_count = User.query.count()
-            image_count = EnhancedImage.query.count()
-            logger.info(f"Database initialized: {user_count} users, {image_count} images")
-        except Exception as verify_error:
-            logger.warning(f"Database tables created but verification query failed: {verify_error}")
+        SCHEMA_VERSION = migrations.current_version(db.engine)
+        if SCHEMA_VERSION < migrations.LATEST_VERSION:
+            if AUTO_MIGRATE:
+                applied = migrations.upgrade(db.engine, db.metadata)
+                SCHEMA_VERSION = migrations.LATEST_VERSION
+                logger.info(f"Applied schema migrations on startup: {applied}")
+            else:
+                logger.error(
+                    f"Database schema is at version {SCHEMA_VERSION} but this code expects "
+                    f"{migrations.LATEST_VERSION}. Run `python migrate.py` (release step)."
+                )
     except Exception as db_init_error:
         logger.error(f"CRITICAL: Failed to initialize database: {db_init_error}", exc_info=True)
         logger.error("The application may not work correctly without a database!")
@@ -716,13 +819,14 @@ def google_login():
     # Normalize to localhost (127.0.0.1 and localhost are the same, but Google requires exact match)
     redirect_uri = redirect_uri.replace('127.0.0.1', 'localhost')
     logger.info(f"OAuth redirect URI: {redirect_uri}")
-    return google.authorize_redirect(redirect_uri)
+    return get_google_oauth().authorize_redirect(redirect_uri)
 
 @app.route('/auth/google/callback')
 def google_callback():
     """Handle Google OAuth callback"""
     try:
         # Get token from Google
+        google = get_google_oauth()
         token = google.authorize_access_token()
         
         # Get user info from Google
@@ -853,25 +957,114 @@ def check_auth():
     """Check if user is authenticated"""
     return jsonify({'authenticated': current_user.is_authenticated})
 
+# Probe settings. /livez and /readyz must stay constant-cost; /api/health caches its row counts.
+READYZ_DB_TIMEOUT_MS = int(os.getenv('READYZ_DB_TIMEOUT_MS', '500'))
+READYZ_MIN_FREE_MB = int(os.getenv('READYZ_MIN_FREE_MB', '200'))
+HEALTH_CACHE_SECONDS = int(os.getenv('HEALTH_CACHE_SECONDS', '60'))
+_health_counts_cache = {'counts': None, 'computed_at': None, 'expires': 0.0}
+_health_counts_lock = threading.Lock()
+
+
+def check_database_ready():
+    """Run SELECT 1 on a pooled connection, bounded by a short statement timeout."""
+    with db.engine.connect() as conn:
+        if conn.dialect.name == 'postgresql':
+            # SET LOCAL only lasts for this transaction, which is rolled back on close
+            conn.execute(text(f'SET LOCAL statement_timeout = {READYZ_DB_TIMEOUT_MS}'))
+        conn.execute(text('SELECT 1'))
+
+
+def check_disk_space():
+    """Free space and writability of the upload and output folders. Returns (ok, details)."""
+    details = {}
+    all_ok = True
+    for folder in (UPLOAD_FOLDER, ENHANCED_FOLDER):
+        free_mb = shutil.disk_usage(folder).free // (1024 * 1024)
+        writable = os.access(folder, os.W_OK)
+        folder_ok = writable and free_mb >= READYZ_MIN_FREE_MB
+        details[folder] = {'free_mb': free_mb, 'writable': writable, 'ok': folder_ok}
+        all_ok = all_ok and folder_ok
+    return all_ok, details
+
+
+def get_health_counts():
+    """User and image counts for /api/health, recomputed at most every HEALTH_CACHE_SECONDS."""
+    now = time.monotonic()
+    with _health_counts_lock:
+        if _health_counts_cache['counts'] is not None and now < _health_counts_cache['expires']:
+            metrics.record_cache('health_counts', True)
+            return _health_counts_cache['counts'], _health_counts_cache['computed_at']
+    metrics.record_cache('health_counts', False)
+    # COUNT(*) scans both tables on Postgres, so it runs outside the lock and off the probe path
+    counts = {'users': User.query.count(), 'images': EnhancedImage.query.count()}
+    computed_at = datetime.utcnow().isoformat()
+    with _health_counts_lock:
+        _health_counts_cache.update(counts=counts, computed_at=computed_at,
+                                    expires=time.monotonic() + HEALTH_CACHE_SECONDS)
+    return counts, computed_at
+
+@app.route('/livez')
+def liveness_probe():
+    """Liveness probe: the worker is up and answering. Touches no dependencies."""
+    return jsonify({'status': 'ok'}), 200
+
+@app.route('/readyz')
+def readiness_probe():
+    """Readiness probe: database reachable and migrated, upload/output folders writable with free space."""
+    checks = {}
+    ready = True
+    
+    try:
+        check_database_ready()
+        checks['database'] = {'ok': True}
+    except Exception as e:
+        logger.warning(f"Readiness check: database unavailable: {e}")
+        checks['database'] = {'ok': False, 'error': type(e).__name__}
+        ready = False
+    
+    try:
+        disk_ok, checks['disk'] = check_disk_space()
+        ready = ready and disk_ok
+    except OSError as e:
+        logger.warning(f"Readiness check: disk check failed: {e}")
+        checks['disk'] = {'ok': False, 'error': type(e).__name__}
+        ready = False
+    
+    # Re-read only while behind, so a worker that started before the release step catches up
+    global SCHEMA_VERSION
+    if SCHEMA_VERSION < migrations.LATEST_VERSION and checks['database']['ok']:
+        SCHEMA_VERSION = migrations.current_version(db.engine)
+    schema_ok = SCHEMA_VERSION >= migrations.LATEST_VERSION
+    checks['schema'] = {'ok': schema_ok, 'version': SCHEMA_VERSION, 'expected': migrations.LATEST_VERSION}
+    ready = ready and schema_ok
+    
+    # Informational only: a slow or failing AI provider should not pull workers out of rotation
+    checks['ai'] = {
+        'backend': enhancer.backend_name,
+        'model': enhancer.model_name,
+        'initialized': enhancer.backend_initialized,
+    }
+    
+    return jsonify({'status': 'ready' if ready else 'not_ready', 'checks': checks}), 200 if ready else 503
+
 @app.route('/api/health')
 def health_check():
-    """Health check endpoint to verify database connectivity"""
+    """Detailed status with database connectivity and cached row counts"""
     try:
-        # Test database connection
         db_uri = app.config['SQLALCHEMY_DATABASE_URI']
         db_type = 'SQLite' if db_uri.startswith('sqlite') else 'PostgreSQL' if db_uri.startswith('postgresql') else 'Unknown'
         
-        # Try to query the database
-        user_count = User.query.count()
-        image_count = EnhancedImage.query.count()
+        check_database_ready()
+        counts, counts_computed_at = get_health_counts()
         
         return jsonify({
             'status': 'healthy',
             'database': {
                 'type': db_type,
                 'connected': True,
-                'users': user_count,
-                'images': image_count
+                'users': counts['users'],
+                'images': counts['images'],
+                'counts_computed_at': counts_computed_at
             },
             'timestamp': datetime.utcnow().isoformat()
         }), 200
@@ -886,6 +1079,17 @@ def health_check():
             'timestamp': datetime.utcnow().isoformat()
         }), 500
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint. Requires 'Authorization: Bearer <METRICS_TOKEN>' when METRICS_TOKEN is set."""
+    metrics_token = os.getenv('METRICS_TOKEN', '')
+    if metrics_token:
+        provided = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(provided.encode(), f'Bearer {metrics_token}'.encode()):
+            return jsonify({'error': 'Unauthorized'}), 401
+    body, content_type = metrics.render_latest()
+    return app.response_class(body, mimetype=None, content_type=content_type)
+
 @app.route('/sitemap.xml')
 def sitemap():
     """Generate sitemap.xml for SEO"""
@@ -1136,22 +1340,118 @@ def blog_sky_replacement_real_estate():
 def blog_vrbo_vs_airbnb_photography():
     return render_template('blog_vrbo_vs_airbnb_photography.html')
 
+def load_chunked_upload(upload_id):
+    """The caller's chunked upload; uploads started while logged in belong to that user."""
+    upload = chunked_uploads.load(upload_id)
+    if upload.user_id is not None and (
+        not current_user.is_authenticated or current_user.id != upload.user_id
+    ):
+        raise chunked_uploads.UploadNotFound('Upload not found')
+    return upload
+
+
+@app.route('/api/uploads', methods=['POST'])
+def create_chunked_upload():
+    """Start a resumable upload. Chunks follow with PUT, then finalize runs the enhancement."""
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(str(data.get('filename') or ''))
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': 'Invalid file type'}), 400
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'size must be a number of bytes'}), 400
+
+    if not current_user.is_authenticated:
+        # Refuse before the client sends the whole file, not at finalize
+        anon_browser_id, anon_cookie_created, anon_count = get_or_init_anonymous_trial()
+        if anon_count >= ANONYMOUS_TRIAL_LIMIT:
+            limit_resp = jsonify({
+                'error': f'Free trial limit reached ({ANONYMOUS_TRIAL_LIMIT} photos). Please sign up to continue.',
+                'trial_limit_reached': True,
+                'trial_limit': ANONYMOUS_TRIAL_LIMIT,
+                'trial_count': anon_count
+            })
+            return attach_anonymous_browser_cookie(limit_resp, anon_browser_id, anon_cookie_created), 403
+
+    user_id = current_user.id if current_user.is_authenticated else None
+    upload = chunked_uploads.create(filename, size, sha256=data.get('sha256') or None, user_id=user_id)
+    logger.info(f"Chunked upload {upload.upload_id} started: {filename}, {size} bytes, user {user_id}")
+    return jsonify(upload.status()), 201
+
+
+@app.route('/api/uploads/<upload_id>', methods=['GET', 'HEAD'])
+def chunked_upload_status(upload_id):
+    upload = load_chunked_upload(upload_id)
+    response = jsonify(upload.status())
+    response.headers['Upload-Offset'] = str(upload.offset)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """Append the request body at the offset in the Upload-Offset header."""
+    upload = load_chunked_upload(upload_id)
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return jsonify({'error': 'Upload-Offset header is required', 'offset': upload.offset}), 400
+
+    # Optional "Upload-Checksum: sha256 <hex digest of this chunk>"
+    algorithm, _, chunk_sha256 = request.headers.get('Upload-Checksum', '').partition(' ')
+    if algorithm and algorithm.lower() != 'sha256':
+        return jsonify({'error': 'Upload-Checksum must use sha256'}), 400
+
+    with span('upload_chunk'):
+        new_offset = upload.append(offset, request.stream, request.content_length, chunk_sha256.strip() or None)
+    if offset < upload_validation.SNIFF_BYTES:
+        # Refuse a non-image or oversized photo at its first chunk, not after the whole file
+        try:
+            upload_validation.check_file(upload.data_path, complete=new_offset == upload.size)
+        except upload_validation.UploadRejected:
+            upload.discard()
+            raise
+    response = jsonify({'offset': new_offset, 'complete': new_offset == upload.size})
+    response.headers['Upload-Offset'] = str(new_offset)
+    return response
+
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def abort_chunked_upload(upload_id):
+    load_chunked_upload(upload_id).discard()
+    return '', 204
+
+
+@app.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_chunked_upload(upload_id):
+    """Run /api/enhance (operation=enhance) or /api/convert-to-night (operation=night) on a complete upload.
+
+    Takes the same form fields as those endpoints and returns their response. The upload
+    is kept until the photo is processed, so a failed finalize can be retried.
+    """
+    handlers = {'enhance': enhance_image, 'night': convert_to_night}
+    handler = handlers.get(request.form.get('operation', 'enhance'))
+    if handler is None:
+        return jsonify({'error': 'operation must be "enhance" or "night"'}), 400
+
+    upload = load_chunked_upload(upload_id)
+    with span('upload_verify'):
+        upload.verify()
+    g.chunked_upload = upload
+    response = app.make_response(handler())
+    if response.status_code == 200:
+        upload.discard()
+    return response
+
+
 @app.route('/api/convert-to-night', methods=['POST'])
 def convert_to_night():
     """Convert a day photo to a night photo"""
     try:
-        if 'image' not in request.files:
-            logger.warning("Night conversion request without image file")
-            return jsonify({'error': 'No image file provided'}), 400
-        
-        file = request.files['image']
-        if file.filename == '':
-            logger.warning("Night conversion request with empty filename")
-            return jsonify({'error': 'No file selected'}), 400
-        
-        if not allowed_file(file.filename):
-            logger.warning(f"Invalid file type attempted: {file.filename}")
-            return jsonify({'error': 'Invalid file type'}), 400
+        file, error_response = get_request_upload("Night conversion")
+        if error_response:
+            return error_response
 
         anon_browser_id = None
         anon_cookie_created = False
@@ -1168,28 +1468,53 @@ def convert_to_night():
         
         # Save original image
         filename = secure_filename(file.filename)
-        original_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(original_path)
-        processed_path, _ = normalize_saved_upload(original_path)
+        # A new sharded path per upload; the name the user gave is kept in original_filename
+        original_path = storage.new_path(UPLOAD_FOLDER, '.' + file.filename.rsplit('.', 1)[1].lower())
+        with span('upload_save'):
+            save_request_upload(file, original_path)
+        with span('normalize'):
+            processed_path, _, perceptual_hash = image_pool.run('normalize', normalize_saved_upload, original_path)
+        
+        # Reuse an earlier night conversion of the same photo if the client asked for it
+        near_duplicate = None
+        if current_user.is_authenticated:
+            with span('duplicate_lookup'):
+                near_duplicate = find_near_duplicate(current_user.id, perceptual_hash, 'night_conversion')
+            metrics.record_cache('near_duplicate', near_duplicate is not None)
+            if near_duplicate and wants_duplicate_reuse():
+                reused_response = build_duplicate_response(near_duplicate)
+                if reused_response is not None:
+                    if processed_path != near_duplicate.original_path and os.path.exists(processed_path):
+                        os.remove(processed_path)
+                    logger.info(f"Reusing night conversion {near_duplicate.id} for near-duplicate upload {filename}")
+                    return reused_response
         
         # Convert to night
+        release_db_connection()
         night_path, conversion_info = enhancer.convert_to_night(processed_path, filename)
         
         # Get file sizes
         original_file_size = os.path.getsize(processed_path)
         night_file_size = os.path.getsize(night_path)
         
-        # Get night filename from path
-        night_filename = os.path.basename(night_path)
+        # Display and download name; the file itself has a unique name under enhanced/
+        night_filename = f"night_{filename.rsplit('.', 1)[0]}.jpg"
         
         # Read images as base64 for database storage (persists across deployments)
         original_image_data = None
         night_image_data = None
+        original_sha256 = None
+        night_sha256 = None
         try:
-            with open(processed_path, 'rb') as f:
-                original_image_data = base64.b64encode(f.read()).decode('utf-8')
-            with open(night_path, 'rb') as f:
-                night_image_data = base64.b64encode(f.read()).decode('utf-8')
+            with span('b64_encode'):
+                with open(processed_path, 'rb') as f:
+                    original_bytes = f.read()
+                with open(night_path, 'rb') as f:
+                    night_bytes = f.read()
+                original_image_data = base64.b64encode(original_bytes).decode('utf-8')
+                night_image_data = base64.b64encode(night_bytes).decode('utf-8')
+                original_sha256 = hashlib.sha256(original_bytes).hexdigest()
+                night_sha256 = hashlib.sha256(night_bytes).hexdigest()
             logger.info("Images encoded as base64 for database storage")
         except Exception as encode_error:
             logger.error(f"Error encoding images for database storage: {encode_error}")
@@ -1211,11 +1536,14 @@ def convert_to_night():
                 enhanced_file_size=night_file_size,
                 original_image_data=original_image_data,
                 enhanced_image_data=night_image_data,
+                original_sha256=original_sha256,
+                enhanced_sha256=night_sha256,
                 conversion_type='night_conversion',
                 change_intensity='moderate',
                 detail_level='moderate',
                 enhancement_settings=json.dumps(conversion_info) if conversion_info else None,
-                ai_analysis=conversion_info.get('response', '') if conversion_info else None
+                ai_analysis=conversion_info.get('response', '') if conversion_info else None,
+                perceptual_hash=perceptual_hash
             )
             
             db.session.add(enhanced_image_record)
@@ -1236,7 +1564,8 @@ def convert_to_night():
                 return enhanced_image_record
             
             # Retry commit and get the record back
-            enhanced_image_record = retry_db_operation(commit_operation, max_retries=3, initial_delay=2, max_delay=10)
+            with span('db_commit'):
+                enhanced_image_record = retry_db_operation(commit_operation, max_retries=3, initial_delay=2, max_delay=10)
             
             # Double-check the ID is set
             if enhanced_image_record.id is None:
@@ -1295,6 +1624,7 @@ def convert_to_night():
         
         # Convert to base64 for response
         # Try to read from file first, fallback to database if file doesn't exist
+        response_build_start = time.perf_counter()
         original_url = None
         night_url = None
         
@@ -1348,6 +1678,8 @@ def convert_to_night():
             'requires_login': not current_user.is_authenticated,
             'conversion_type': 'night_conversion'
         }
+        if near_duplicate:
+            response_payload['near_duplicate_of'] = near_duplicate.id
         if not current_user.is_authenticated:
             new_count = increment_anonymous_trial_count()
             response_payload['trial_limit'] = ANONYMOUS_TRIAL_LIMIT
@@ -1355,8 +1687,13 @@ def convert_to_night():
             response_payload['trial_remaining'] = max(0, ANONYMOUS_TRIAL_LIMIT - new_count)
 
         response = jsonify(response_payload)
+        request_timing.record_span('response_build', time.perf_counter() - response_build_start)
         return attach_anonymous_browser_cookie(response, anon_browser_id, anon_cookie_created)
     
+    except upload_validation.UploadRejected as e:
+        return upload_rejected_response(e)
+    except image_pool.ImagePoolError as e:
+        return image_pool_busy_response(e)
     except Exception as e:
         logger.error(f"Error in convert_to_night endpoint: {e}", exc_info=True)
         return jsonify({'error': 'An error occurred while processing the image'}), 500
@@ -1364,18 +1701,9 @@ def convert_to_night():
 @app.route('/api/enhance', methods=['POST'])
 def enhance_image():
     try:
-        if 'image' not in request.files:
-            logger.warning("Enhance request without image file")
-            return jsonify({'error': 'No image file provided'}), 400
-        
-        file = request.files['image']
-        if file.filename == '':
-            logger.warning("Enhance request with empty filename")
-            return jsonify({'error': 'No file selected'}), 400
-        
-        if not allowed_file(file.filename):
-            logger.warning(f"Invalid file type attempted: {file.filename}")
-            return jsonify({'error': 'Invalid file type'}), 400
+        file, error_response = get_request_upload("Enhance")
+        if error_response:
+            return error_response
 
         anon_browser_id = None
         anon_cookie_created = False
@@ -1402,11 +1730,32 @@ def enhance_image():
         
         # Save original image
         filename = secure_filename(file.filename)
-        original_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(original_path)
-        processed_path, _ = normalize_saved_upload(original_path)
+        # A new sharded path per upload; the name the user gave is kept in original_filename
+        original_path = storage.new_path(UPLOAD_FOLDER, '.' + file.filename.rsplit('.', 1)[1].lower())
+        with span('upload_save'):
+            save_request_upload(file, original_path)
+        with span('normalize'):
+            processed_path, _, perceptual_hash = image_pool.run('normalize', normalize_saved_upload, original_path)
+        
+        # Reuse an earlier enhancement of the same photo if the client asked for it
+        near_duplicate = None
+        if current_user.is_authenticated:
+            with span('duplicate_lookup'):
+                near_duplicate = find_near_duplicate(
+                    current_user.id, perceptual_hash, 'enhancement',
+                    change_intensity=change_intensity, detail_level=detail_level
+                )
+            metrics.record_cache('near_duplicate', near_duplicate is not None)
+            if near_duplicate and wants_duplicate_reuse():
+                reused_response = build_duplicate_response(near_duplicate)
+                if reused_response is not None:
+                    if processed_path != near_duplicate.original_path and os.path.exists(processed_path):
+                        os.remove(processed_path)
+                    logger.info(f"Reusing enhancement {near_duplicate.id} for near-duplicate upload {filename}")
+                    return reused_response
         
         # Enhance the image with user preferences
+        release_db_connection()
         enhanced_path, enhancements = enhancer.enhance_image(
             processed_path, 
             filename,
@@ -1418,17 +1767,24 @@ def enhance_image():
         original_file_size = os.path.getsize(processed_path)
         enhanced_file_size = os.path.getsize(enhanced_path)
         
-        # Get enhanced filename from path
-        enhanced_filename = os.path.basename(enhanced_path)
+        # Display and download name; the file itself has a unique name under enhanced/
+        enhanced_filename = f"enhanced_{filename.rsplit('.', 1)[0]}.jpg"
         
         # Read images as base64 for database storage (persists across deployments)
         original_image_data = None
         enhanced_image_data = None
+        original_sha256 = None
+        enhanced_sha256 = None
         try:
-            with open(processed_path, 'rb') as f:
-                original_image_data = base64.b64encode(f.read()).decode('utf-8')
-            with open(enhanced_path, 'rb') as f:
-                enhanced_image_data = base64.b64encode(f.read()).decode('utf-8')
+            with span('b64_encode'):
+                with open(processed_path, 'rb') as f:
+                    original_bytes = f.read()
+                with open(enhanced_path, 'rb') as f:
+                    enhanced_bytes = f.read()
+                original_image_data = base64.b64encode(original_bytes).decode('utf-8')
+                enhanced_image_data = base64.b64encode(enhanced_bytes).decode('utf-8')
+                original_sha256 = hashlib.sha256(original_bytes).hexdigest()
+                enhanced_sha256 = hashlib.sha256(enhanced_bytes).hexdigest()
             logger.info("Images encoded as base64 for database storage")
         except Exception as encode_error:
             logger.error(f"Error encoding images for database storage: {encode_error}")
@@ -1450,11 +1806,14 @@ def enhance_image():
                 enhanced_file_size=enhanced_file_size,
                 original_image_data=original_image_data,
                 enhanced_image_data=enhanced_image_data,
+                original_sha256=original_sha256,
+                enhanced_sha256=enhanced_sha256,
                 conversion_type='enhancement',
                 change_intensity=change_intensity,
                 detail_level=detail_level,
                 enhancement_settings=json.dumps(enhancements) if enhancements else None,
-                ai_analysis=enhancements.get('response', '') if enhancements else None
+                ai_analysis=enhancements.get('response', '') if enhancements else None,
+                perceptual_hash=perceptual_hash
             )
             
             db.session.add(enhanced_image_record)
@@ -1472,7 +1831,8 @@ def enhance_image():
                     raise Exception("Image ID was not set after commit")
                 return enhanced_image_record
             
-            enhanced_image_record = retry_db_operation(commit_operation, max_retries=3, initial_delay=2, max_delay=10)
+            with span('db_commit'):
+                enhanced_image_record = retry_db_operation(commit_operation, max_retries=3, initial_delay=2, max_delay=10)
             
             # Double-check the ID is set
             if enhanced_image_record.id is None:
@@ -1530,6 +1890,7 @@ def enhance_image():
         
         # Convert to base64 for response
         # Try to read from file first, fallback to database if file doesn't exist
+        response_build_start = time.perf_counter()
         original_url = None
         enhanced_url = None
         
@@ -1582,6 +1943,8 @@ def enhance_image():
             'image_id': enhanced_image_record.id,
             'requires_login': not current_user.is_authenticated
         }
+        if near_duplicate:
+            response_payload['near_duplicate_of'] = near_duplicate.id
         if not current_user.is_authenticated:
             new_count = increment_anonymous_trial_count()
             response_payload['trial_limit'] = ANONYMOUS_TRIAL_LIMIT
@@ -1589,8 +1952,13 @@ def enhance_image():
             response_payload['trial_remaining'] = max(0, ANONYMOUS_TRIAL_LIMIT - new_count)
 
         response = jsonify(response_payload)
+        request_timing.record_span('response_build', time.perf_counter() - response_build_start)
         return attach_anonymous_browser_cookie(response, anon_browser_id, anon_cookie_created)
     
+    except upload_validation.UploadRejected as e:
+        return upload_rejected_response(e)
+    except image_pool.ImagePoolError as e:
+        return image_pool_busy_response(e)
     except Exception as e:
         logger.error(f"Error in enhance_image endpoint: {e}", exc_info=True)
         return jsonify({'error': 'An error occurred while processing the image'}), 500
@@ -1609,45 +1977,44 @@ def user_stats():
 @app.route('/api/photos')
 @login_required
 def get_user_photos():
-    """Get all photos for the current user"""
+    """Get the current user's photos, newest first, one keyset page at a time.
+
+    Query parameters: per_page (max 100), cursor (next_cursor / prev_cursor from the
+    previous response), total=1 to include a capped photo count, and fields= to add
+    enhancement_settings and/or ai_analysis to each photo.
+    """
     try:
-        # Get query parameters for pagination
-        page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
-        per_page = min(per_page, 100)  # Limit to 100 per page
+        per_page = max(1, min(per_page, 100))  # Limit to 100 per page
+        with_total = request.args.get('total', '').lower() in ('1', 'true')
+        try:
+            extra_fields = photo_listing.parse_fields(request.args.get('fields'))
+        except photo_listing.UnknownField as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Query photos for the current user
-        photos_query = EnhancedImage.query.filter_by(user_id=current_user.id)
-        photos_query = photos_query.order_by(EnhancedImage.created_at.desc())
+        # Only the listing columns of the current user's photos, as row tuples
+        photos_query = EnhancedImage.query.filter_by(user_id=current_user.id).with_entities(
+            *photo_listing.columns(extra_fields))
         
-        # Paginate
-        pagination = photos_query.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
-        )
+        try:
+            page = keyset.paginate(photos_query, EnhancedImage, per_page,
+                                   cursor=request.args.get('cursor'), with_total=with_total)
+        except keyset.InvalidCursor:
+            return jsonify({'error': 'Invalid cursor'}), 400
         
         # Filter out photos where files don't exist and no database backup
-        valid_photos = []
-        for photo in pagination.items:
+        valid_rows = []
+        for row in page.items:
             # Check if photo is accessible (file exists OR database has backup)
-            file_exists = os.path.exists(photo.enhanced_path) or photo.enhanced_image_data is not None
-            if file_exists:
-                valid_photos.append(photo.to_dict())
+            if row.has_payload or row.archived_at is not None or os.path.exists(row.enhanced_path):
+                valid_rows.append(row)
             else:
-                logger.warning(f"Photo {photo.id} has no file and no database backup - skipping")
+                logger.warning(f"Photo {row.id} has no file and no database backup - skipping")
         
         return jsonify({
             'success': True,
-            'photos': valid_photos,
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': pagination.total,
-                'pages': pagination.pages,
-                'has_next': pagination.has_next,
-                'has_prev': pagination.has_prev
-            }
+            'photos': photo_listing.to_dicts(valid_rows, extra_fields),
+            'pagination': page.as_dict()
         })
     except Exception as e:
         logger.error(f"Error in get_user_photos: {e}", exc_info=True)
@@ -1672,12 +2039,147 @@ def get_photo(photo_id):
         logger.error(f"Error in get_photo: {e}", exc_info=True)
         return jsonify({'error': 'Failed to retrieve photo'}), 500
 
+# Browser caching of photo responses. Photos never change once created; ETags let a
+# browser revalidate with a 304 once max-age has passed
+PHOTO_MAX_AGE = int(os.getenv('PHOTO_MAX_AGE_SECONDS', '86400'))
+# Part of preview ETags. Bump it when add_watermark's output changes
+PREVIEW_ETAG_VERSION = 'wm1'
+
+
+def load_photo_or_404(photo_id):
+    """EnhancedImage by id without its base64 payloads; those only load if a file is missing."""
+    return EnhancedImage.query.options(
+        defer(EnhancedImage.original_image_data), defer(EnhancedImage.enhanced_image_data)
+    ).get_or_404(photo_id)
+
+
+def read_archived_bytes(photo, source):
+    """Bytes of an image that archive.py moved to cold storage, or None."""
+    entry = db.session.get(ArchivedPayload, (photo.id, source))
+    if entry is None:
+        return None
+    try:
+        return cold_storage.read(entry)
+    except cold_storage.ColdStorageError as e:
+        logger.error(f"Could not read archived {source} image of photo {photo.id}: {e}")
+        return None
+
+
+def read_photo_bytes(photo, source):
+    """Bytes of a photo's 'original' or 'enhanced' image, or None if it is stored nowhere.
+
+    Falls back to the base64 copy in the database, or to cold storage once archive.py has
+    moved it there, and writes it back to disk, so later requests for the photo are
+    served from the file again.
+    """
+    path = getattr(photo, f'{source}_path')
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return f.read()
+    if photo.archived_at is not None:
+        image_bytes = read_archived_bytes(photo, source)
+    else:
+        image_data = getattr(photo, f'{source}_image_data')
+        image_bytes = base64.b64decode(image_data) if image_data else None
+    if not image_bytes:
+        return None
+    try:
+        storage.write_atomic(path, image_bytes)
+        logger.info(f"Restored {source} image of photo {photo.id} to {path} from database")
+    except OSError as e:
+        logger.warning(f"Could not restore {source} image of photo {photo.id} to disk: {e}")
+    return image_bytes
+
+
+# Photos viewed more recently than this stay out of cold storage (archive.py)
+ACCESS_STAMP_INTERVAL = timedelta(days=1)
+
+
+def note_photo_access(photo):
+    """Update last_accessed_at, at most once per ACCESS_STAMP_INTERVAL for each photo."""
+    now = datetime.utcnow()
+    last_access = photo.last_accessed_at or photo.created_at
+    if last_access is not None and now - last_access < ACCESS_STAMP_INTERVAL:
+        return
+    photo.last_accessed_at = now
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"Could not record access to photo {photo.id}: {e}")
+
+
+def photo_digest(photo, source):
+    """SHA-256 of a photo's stored image, computed and saved on first use for older rows."""
+    digest = getattr(photo, f'{source}_sha256')
+    if digest:
+        return digest
+    image_bytes = read_photo_bytes(photo, source)
+    if image_bytes is None:
+        return None
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    setattr(photo, f'{source}_sha256', digest)
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"Could not save {source} digest of photo {photo.id}: {e}")
+    return digest
+
+
+def send_photo(photo, source, preview=False, as_attachment=False, max_age=PHOTO_MAX_AGE):
+    """Send a photo's original or enhanced image with a strong ETag and Last-Modified.
+
+    Answers 304 from the stored digest without reading the image when the client's copy
+    is current, and 206 for Range requests. preview=True sends the watermarked version.
+    max_age=0 makes browsers revalidate on every use (content that changes once paid).
+    """
+    digest = photo_digest(photo, source)
+    if digest is None:
+        logger.warning(f"{source.capitalize()} image {photo.id} not found in file system or database")
+        return jsonify({'error': f'{source.capitalize()} image not found'}), 404
+    etag = f"{digest}-{PREVIEW_ETAG_VERSION}" if preview else digest
+    last_modified = photo.created_at
+    download_name = getattr(photo, f'{source}_filename')
+
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        if last_modified:
+            response.last_modified = last_modified
+    else:
+        path = getattr(photo, f'{source}_path')
+        if not preview and os.path.exists(path):
+            body = os.path.abspath(path)
+        else:
+            image_bytes = read_photo_bytes(photo, source)
+            if image_bytes is None:
+                return jsonify({'error': f'{source.capitalize()} image not found'}), 404
+            if preview:
+                image_bytes = image_pool.run('watermark', add_watermark, image_bytes)
+            body = BytesIO(image_bytes)
+        response = send_file(body, mimetype='image/jpeg', as_attachment=as_attachment,
+                             download_name=download_name, etag=etag, last_modified=last_modified,
+                             conditional=True)
+        # Werkzeug only sets this on 206 responses; download managers look for it on the 200
+        response.headers.setdefault('Accept-Ranges', 'bytes')
+        note_photo_access(photo)
+
+    response.cache_control.no_cache = None
+    response.cache_control.private = True
+    if max_age:
+        response.cache_control.max_age = max_age
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
 @app.route('/api/photos/<int:photo_id>/original')
 @login_required
 def serve_original_photo(photo_id):
     """Serve the original image file"""
     try:
-        photo = EnhancedImage.query.get_or_404(photo_id)
+        photo = load_photo_or_404(photo_id)
         
         # Check if the photo belongs to the current user OR if user is admin
         # For anonymous photos (user_id is None), only admin can access
@@ -1687,31 +2189,110 @@ def serve_original_photo(photo_id):
         elif photo.user_id != current_user.id and not is_admin_user(current_user):
             return jsonify({'error': 'Unauthorized'}), 403
         
-        # Try to serve from file first (if it exists)
-        if os.path.exists(photo.original_path):
-            return send_file(photo.original_path, mimetype='image/jpeg')
-        
-        # If file doesn't exist, serve from database (base64)
-        if photo.original_image_data:
-            try:
-                logger.info(f"Serving original image {photo_id} from database (file not found)")
-                image_bytes = base64.b64decode(photo.original_image_data)
-                if len(image_bytes) == 0:
-                    logger.warning(f"Original image {photo_id} has empty base64 data")
-                    return jsonify({'error': 'Image data is empty'}), 404
-                return send_file(BytesIO(image_bytes), mimetype='image/jpeg', download_name=photo.original_filename)
-            except Exception as decode_error:
-                logger.error(f"Error decoding original image {photo_id} from base64: {decode_error}")
-                return jsonify({'error': 'Failed to decode image data'}), 500
-        
-        # Neither file nor database data available
-        logger.warning(f"Original image {photo_id} not found in file system or database")
-        return jsonify({'error': 'Original image not found'}), 404
+        return send_photo(photo, 'original')
     except Exception as e:
         logger.error(f"Error serving original photo: {e}", exc_info=True)
         return jsonify({'error': 'Failed to serve photo'}), 500
 
-def add_watermark(image_bytes, watermark_text="PREVIEW - ELEVANCE AI"):
+WATERMARK_FONT_PATHS = [
+    "/System/Library/Fonts/Helvetica.ttc",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf",
+    "/Windows/Fonts/arial.ttf",
+]
+
+
+@functools.lru_cache(maxsize=1)
+def _watermark_font_data():
+    """Bytes of the first available watermark font file, or None.
+
+    Fonts are loaded from memory rather than by path: FreeType keeps a path-loaded font's
+    file open, and a descriptor inherited from a preloading master shares its offset
+    between workers.
+    """
+    for font_path in WATERMARK_FONT_PATHS:
+        try:
+            if os.path.exists(font_path):
+                with open(font_path, 'rb') as f:
+                    return f.read()
+        except OSError:
+            continue
+    return None
+
+
+@functools.lru_cache(maxsize=32)
+def load_watermark_font(font_size):
+    """Watermark font at the given size, built once per size and worker.
+
+    Falls back to Pillow's default font, or None if even that is unavailable.
+    """
+    font_data = _watermark_font_data()
+    if font_data is not None:
+        try:
+            return ImageFont.truetype(BytesIO(font_data), font_size)
+        except Exception as e:
+            logger.warning(f"Could not load watermark font: {e}")
+    try:
+        return ImageFont.load_default()
+    except Exception:
+        return None
+
+
+WATERMARK_TEXT = "PREVIEW - ELEVANCE AI"
+
+
+def watermark_image(img, watermark_text=WATERMARK_TEXT):
+    """Tile a diagonal semi-transparent watermark over an RGB image and return it."""
+    # Create a semi-transparent overlay
+    overlay = Image.new('RGBA', img.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(overlay)
+    
+    # Calculate font size based on image dimensions
+    font_size = max(24, min(img.width, img.height) // 20)
+    
+    font = load_watermark_font(font_size)
+    
+    # Get text dimensions (handle case where font might be None)
+    if font:
+        bbox = draw.textbbox((0, 0), watermark_text, font=font)
+        text_width = bbox[2] - bbox[0]
+        text_height = bbox[3] - bbox[1]
+    else:
+        # Estimate text dimensions if no font available
+        text_width = len(watermark_text) * 10
+        text_height = 20
+    
+    # Calculate position for diagonal watermark (repeated pattern)
+    spacing = text_width + 100
+    for y in range(-img.height, img.height * 2, spacing):
+        for x in range(-img.width, img.width * 2, spacing):
+            # Draw semi-transparent text
+            if font:
+                draw.text(
+                    (x, y),
+                    watermark_text,
+                    fill=(255, 255, 255, 120),  # White with transparency
+                    font=font
+                )
+            else:
+                # Fallback: draw simple text without font
+                draw.text(
+                    (x, y),
+                    watermark_text,
+                    fill=(255, 255, 255, 120)  # White with transparency
+                )
+    
+    # Rotate overlay 45 degrees for diagonal watermark
+    overlay = overlay.rotate(-45, expand=False)
+    
+    # Composite overlay onto image
+    img_rgba = img.convert('RGBA')
+    watermarked = Image.alpha_composite(img_rgba, overlay)
+    return watermarked.convert('RGB')
+
+
+@metrics.timed(metrics.IMAGE_OPERATION_SECONDS, 'watermark')
+def add_watermark(image_bytes, watermark_text=WATERMARK_TEXT):
     """Add watermark to image bytes and return watermarked image bytes"""
     try:
         # Open image from bytes
@@ -1725,75 +2306,7 @@ def add_watermark(image_bytes, watermark_text="PREVIEW - ELEVANCE AI"):
         preview_height = int(height * (preview_width / width))
         img = img.resize((preview_width, preview_height), Image.Resampling.LANCZOS)
         
-        # Create a semi-transparent overlay
-        overlay = Image.new('RGBA', img.size, (0, 0, 0, 0))
-        draw = ImageDraw.Draw(overlay)
-        
-        # Calculate font size based on image dimensions
-        font_size = max(24, min(img.width, img.height) // 20)
-        
-        # Try to use a default font, fallback to basic font if not available
-        font = None
-        font_paths = [
-            "/System/Library/Fonts/Helvetica.ttc",
-            "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
-            "/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf",
-            "/Windows/Fonts/arial.ttf",
-        ]
-        
-        for font_path in font_paths:
-            try:
-                if os.path.exists(font_path):
-                    font = ImageFont.truetype(font_path, font_size)
-                    break
-            except:
-                continue
-        
-        # Fallback to default font if no font file found
-        if font is None:
-            try:
-                font = ImageFont.load_default()
-            except:
-                # If even default font fails, create a simple font
-                font = None
-        
-        # Get text dimensions (handle case where font might be None)
-        if font:
-            bbox = draw.textbbox((0, 0), watermark_text, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-        else:
-            # Estimate text dimensions if no font available
-            text_width = len(watermark_text) * 10
-            text_height = 20
-        
-        # Calculate position for diagonal watermark (repeated pattern)
-        spacing = text_width + 100
-        for y in range(-img.height, img.height * 2, spacing):
-            for x in range(-img.width, img.width * 2, spacing):
-                # Draw semi-transparent text
-                if font:
-                    draw.text(
-                        (x, y),
-                        watermark_text,
-                        fill=(255, 255, 255, 120),  # White with transparency
-                        font=font
-                    )
-                else:
-                    # Fallback: draw simple text without font
-                    draw.text(
-                        (x, y),
-                        watermark_text,
-                        fill=(255, 255, 255, 120)  # White with transparency
-                    )
-        
-        # Rotate overlay 45 degrees for diagonal watermark
-        overlay = overlay.rotate(-45, expand=False)
-        
-        # Composite overlay onto image
-        img_rgba = img.convert('RGBA')
-        watermarked = Image.alpha_composite(img_rgba, overlay)
-        watermarked = watermarked.convert('RGB')
+        watermarked = watermark_image(img, watermark_text)
         
         # Save to bytes with reduced quality
         output = BytesIO()
@@ -1831,7 +2344,7 @@ def check_photo_payment(photo_id, user_id):
         return False
 
 @app.route('/api/photos/<int:photo_id>/preview')
-def serve_preview_photo(photo_id):
+def serve_preview_photo(photo_id, max_age=PHOTO_MAX_AGE):
     """Serve a watermarked preview of the enhanced image.
 
     - Logged-out users may only preview *unclaimed* photos (user_id is None), e.g. home page
@@ -1839,7 +2352,7 @@ def serve_preview_photo(photo_id):
     - Logged-in owners and admins follow the same rules as before.
     """
     try:
-        photo = EnhancedImage.query.get_or_404(photo_id)
+        photo = load_photo_or_404(photo_id)
 
         if current_user.is_authenticated:
             if is_admin_user(current_user):
@@ -1855,28 +2368,10 @@ def serve_preview_photo(photo_id):
             if photo.user_id is not None:
                 return jsonify({'error': 'Login required'}), 401
         
-        # Get image bytes
-        image_bytes = None
-        
-        # Try to get from file first
-        if os.path.exists(photo.enhanced_path):
-            with open(photo.enhanced_path, 'rb') as f:
-                image_bytes = f.read()
-        # If file doesn't exist, get from database (base64)
-        elif photo.enhanced_image_data:
-            try:
-                image_bytes = base64.b64decode(photo.enhanced_image_data)
-            except Exception as decode_error:
-                logger.error(f"Error decoding enhanced image {photo_id} from base64: {decode_error}")
-                return jsonify({'error': 'Failed to decode image data'}), 500
-        
-        if not image_bytes:
-            return jsonify({'error': 'Enhanced image not found'}), 404
-        
-        # Add watermark and return
-        watermarked_bytes = add_watermark(image_bytes)
-        return send_file(BytesIO(watermarked_bytes), mimetype='image/jpeg')
+        return send_photo(photo, 'enhanced', preview=True, max_age=max_age)
         
+    except image_pool.ImagePoolError as e:
+        return image_pool_busy_response(e)
     except Exception as e:
         logger.error(f"Error serving preview photo: {e}", exc_info=True)
         return jsonify({'error': 'Failed to serve photo'}), 500
@@ -1886,7 +2381,7 @@ def serve_preview_photo(photo_id):
 def serve_enhanced_photo(photo_id):
     """Serve the enhanced image file - now requires payment verification"""
     try:
-        photo = EnhancedImage.query.get_or_404(photo_id)
+        photo = load_photo_or_404(photo_id)
         
         # Check if the photo belongs to the current user OR if user is admin
         # For anonymous photos (user_id is None), only admin can access
@@ -1900,40 +2395,112 @@ def serve_enhanced_photo(photo_id):
         # Admins can always access
         if not is_admin_user(current_user):
             if not check_photo_payment(photo_id, current_user.id):
-                # User hasn't paid - return watermarked preview instead
-                return serve_preview_photo(photo_id)
+                # User hasn't paid - return watermarked preview instead. This URL serves the
+                # full image once paid, so browsers must revalidate it every time
+                return serve_preview_photo(photo_id, max_age=0)
         
         # User has paid or is admin - serve full-quality image
-        # Try to serve from file first (if it exists)
-        if os.path.exists(photo.enhanced_path):
-            return send_file(photo.enhanced_path, mimetype='image/jpeg')
-        
-        # If file doesn't exist, serve from database (base64)
-        if photo.enhanced_image_data:
-            try:
-                logger.info(f"Serving enhanced image {photo_id} from database (file not found)")
-                image_bytes = base64.b64decode(photo.enhanced_image_data)
-                if len(image_bytes) == 0:
-                    logger.warning(f"Enhanced image {photo_id} has empty base64 data")
-                    return jsonify({'error': 'Image data is empty'}), 404
-                return send_file(BytesIO(image_bytes), mimetype='image/jpeg', download_name=photo.enhanced_filename)
-            except Exception as decode_error:
-                logger.error(f"Error decoding enhanced image {photo_id} from base64: {decode_error}")
-                return jsonify({'error': 'Failed to decode image data'}), 500
-        
-        # Neither file nor database data available
-        logger.warning(f"Enhanced image {photo_id} not found in file system or database")
-        return jsonify({'error': 'Enhanced image not found'}), 404
+        return send_photo(photo, 'enhanced')
     except Exception as e:
         logger.error(f"Error serving enhanced photo: {e}", exc_info=True)
         return jsonify({'error': 'Failed to serve photo'}), 500
 
+# Unwatermarked renditions never change for a given URL; watermarked ones turn into
+# unwatermarked ones once the photo is paid for, so browsers revalidate them sooner
+RENDITION_MAX_AGE = 365 * 24 * 3600
+WATERMARKED_RENDITION_MAX_AGE = 3600
+
+
+@app.route('/api/photos/<int:photo_id>/rendition')
+def serve_photo_rendition(photo_id):
+    """Serve a resized WebP/JPEG copy of a photo for galleries and thumbnails.
+
+    Query parameters:
+        w: requested width, rounded up to one of renditions.RENDITION_WIDTHS
+        fmt: webp or jpeg (default: WebP if the Accept header lists it)
+        src: enhanced (default) or original
+
+    Originals follow the access rules of /original. Enhanced renditions follow /preview
+    and are watermarked unless the viewer may see the full image (admin, or owner who paid).
+    """
+    try:
+        source = request.args.get('src', 'enhanced')
+        if source not in ('enhanced', 'original'):
+            return jsonify({'error': 'src must be enhanced or original'}), 400
+        fmt = renditions.negotiate_format(request.args.get('fmt'), request.headers.get('Accept'))
+        if fmt is None:
+            return jsonify({'error': f"fmt must be one of: {', '.join(renditions.FORMATS)}"}), 400
+        width = renditions.standard_width(request.args.get('w', type=int))
+        
+        photo = load_photo_or_404(photo_id)
+        is_admin = current_user.is_authenticated and is_admin_user(current_user)
+        is_owner = current_user.is_authenticated and photo.user_id is not None and photo.user_id == current_user.id
+        
+        if source == 'original':
+            if not current_user.is_authenticated:
+                return jsonify({'error': 'Login required'}), 401
+            if not (is_admin or is_owner):
+                return jsonify({'error': 'Unauthorized'}), 403
+            watermarked = False
+        else:
+            if not current_user.is_authenticated and photo.user_id is not None:
+                return jsonify({'error': 'Login required'}), 401
+            if photo.user_id is not None and not (is_admin or is_owner):
+                return jsonify({'error': 'Unauthorized'}), 403
+            watermarked = not (is_admin or (is_owner and check_photo_payment(photo_id, current_user.id)))
+        
+        path = os.path.abspath(renditions.cache_path(photo_id, source, width, fmt, watermarked))
+        rendition = renditions.open_cached(path)
+        if rendition is None:
+            image_source = getattr(photo, f'{source}_path')
+            if not os.path.exists(image_source):
+                image_bytes = read_photo_bytes(photo, source)
+                if image_bytes is None:
+                    logger.warning(f"{source.capitalize()} image {photo_id} not found in file system or database")
+                    return jsonify({'error': 'Image not found'}), 404
+                image_source = BytesIO(image_bytes)
+            data = image_pool.run('rendition', renditions.render, image_source, width, fmt,
+                                  watermark_image if watermarked else None)
+            renditions.store(path, data)
+            note_photo_access(photo)
+            # Serve the bytes in hand; the stored file may already be evicted again
+            rendition = BytesIO(data)
+            try:
+                mtime = os.stat(path).st_mtime
+            except FileNotFoundError:
+                mtime = time.time()
+            size = len(data)
+        else:
+            stat = os.fstat(rendition.fileno())
+            mtime, size = stat.st_mtime, stat.st_size
+        
+        response = send_file(rendition, mimetype=renditions.mimetype(fmt), conditional=True,
+                             etag=renditions.etag(path, mtime, size), last_modified=mtime)
+        # send_file marks it no-cache (no max_age given) and would mark it public; these are
+        # per-user images that browsers may keep
+        response.cache_control.no_cache = None
+        response.cache_control.public = False
+        response.cache_control.private = True
+        if watermarked:
+            response.cache_control.max_age = WATERMARKED_RENDITION_MAX_AGE
+        else:
+            response.cache_control.max_age = RENDITION_MAX_AGE
+            response.cache_control.immutable = True
+        if not request.args.get('fmt'):
+            response.vary.add('Accept')
+        return response
+    except image_pool.ImagePoolError as e:
+        return image_pool_busy_response(e)
+    except Exception as e:
+        logger.error(f"Error serving photo rendition: {e}", exc_info=True)
+        return jsonify({'error': 'Failed to serve photo'}), 500
+
 @app.route('/api/photos/<int:photo_id>/download')
 @login_required
 def download_enhanced_photo(photo_id):
     """Download full-quality enhanced image - requires payment verification"""
     try:
-        photo = EnhancedImage.query.get_or_404(photo_id)
+        photo = load_photo_or_404(photo_id)
         
         # Check if the photo belongs to the current user OR if user is admin
         # For anonymous photos (user_id is None), only admin can access
@@ -1949,31 +2516,102 @@ def download_enhanced_photo(photo_id):
             if not check_photo_payment(photo_id, current_user.id):
                 return jsonify({'error': 'Payment required. Please complete payment to download this photo.'}), 403
         
-        # User has paid or is admin - serve full-quality image for download
-        # Try to serve from file first (if it exists)
-        if os.path.exists(photo.enhanced_path):
-            return send_file(photo.enhanced_path, mimetype='image/jpeg', as_attachment=True, download_name=photo.enhanced_filename)
-        
-        # If file doesn't exist, serve from database (base64)
-        if photo.enhanced_image_data:
-            try:
-                logger.info(f"Downloading enhanced image {photo_id} from database (file not found)")
-                image_bytes = base64.b64decode(photo.enhanced_image_data)
-                if len(image_bytes) == 0:
-                    logger.warning(f"Enhanced image {photo_id} has empty base64 data")
-                    return jsonify({'error': 'Image data is empty'}), 404
-                return send_file(BytesIO(image_bytes), mimetype='image/jpeg', as_attachment=True, download_name=photo.enhanced_filename)
-            except Exception as decode_error:
-                logger.error(f"Error decoding enhanced image {photo_id} from base64: {decode_error}")
-                return jsonify({'error': 'Failed to decode image data'}), 500
-        
-        # Neither file nor database data available
-        logger.warning(f"Enhanced image {photo_id} not found in file system or database")
-        return jsonify({'error': 'Enhanced image not found'}), 404
+        # User has paid or is admin - serve full-quality image for download (Range requests
+        # let interrupted downloads resume)
+        return send_photo(photo, 'enhanced', as_attachment=True)
     except Exception as e:
         logger.error(f"Error downloading enhanced photo: {e}", exc_info=True)
         return jsonify({'error': 'Failed to download photo'}), 500
 
+# Upper bound on photos per ZIP download, so one request cannot stream the whole bucket
+MAX_ZIP_PHOTOS = int(os.getenv('MAX_ZIP_PHOTOS', '500'))
+
+
+def paid_photo_ids(user_id):
+    """Ids of every photo covered by the user's completed payments, in one query."""
+    paid = set()
+    for (photo_ids,) in db.session.query(Payment.photo_ids).filter_by(user_id=user_id, status='completed'):
+        if photo_ids:
+            paid.update(json.loads(photo_ids))
+    return paid
+
+
+def zip_entry_source(photo_id, path):
+    """Path of an enhanced image for a ZIP entry, or its bytes from the database if the file is gone."""
+    if os.path.exists(path):
+        return path
+    photo = db.session.get(EnhancedImage, photo_id)
+    image_bytes = read_photo_bytes(photo, 'enhanced') if photo else None
+    release_db_connection()
+    if image_bytes is None:
+        logger.warning(f"Enhanced image {photo_id} not found in file system or database; left out of ZIP")
+        return None
+    return BytesIO(image_bytes)
+
+
+@app.route('/api/photos/download-zip')
+@login_required
+def download_photos_zip():
+    """Stream a ZIP of the current user's paid enhanced photos.
+
+    ?ids=1,2,3 selects photos; every one of them must be owned and paid for. Without it,
+    every paid photo of the user is included. Entitlement is checked once for the whole
+    set. The archive is written as the files are read, so the first bytes go out at once
+    and memory use does not grow with the number of photos.
+    """
+    try:
+        requested = None
+        if request.args.get('ids'):
+            try:
+                requested = {int(value) for value in request.args['ids'].split(',') if value.strip()}
+            except ValueError:
+                return jsonify({'error': 'ids must be a comma-separated list of photo ids'}), 400
+            if len(requested) > MAX_ZIP_PHOTOS:
+                return jsonify({'error': f'At most {MAX_ZIP_PHOTOS} photos per ZIP download'}), 400
+        
+        query = EnhancedImage.query.options(
+            defer(EnhancedImage.original_image_data), defer(EnhancedImage.enhanced_image_data)
+        ).filter(EnhancedImage.user_id == current_user.id)
+        if requested is not None:
+            query = query.filter(EnhancedImage.id.in_(requested))
+        if not (current_user.has_free_access or is_admin_user(current_user)):
+            paid = paid_photo_ids(current_user.id)
+            if requested is not None and not requested <= paid:
+                return jsonify({'error': 'Payment required. Please complete payment to download these photos.'}), 403
+            query = query.filter(EnhancedImage.id.in_(paid))
+        photos = query.order_by(EnhancedImage.created_at).limit(MAX_ZIP_PHOTOS + 1).all()
+        
+        if requested is not None and len(photos) != len(requested):
+            return jsonify({'error': 'Unauthorized'}), 403
+        if not photos:
+            return jsonify({'error': 'No paid photos to download'}), 404
+        if len(photos) > MAX_ZIP_PHOTOS:
+            return jsonify({'error': f'At most {MAX_ZIP_PHOTOS} photos per ZIP download. Select fewer photos.'}), 400
+        
+        entries = []
+        names = set()
+        for photo in photos:
+            stem, ext = os.path.splitext(photo.enhanced_filename)
+            name = photo.enhanced_filename
+            copy = 1
+            while name in names:
+                copy += 1
+                name = f"{stem} ({copy}){ext}"
+            names.add(name)
+            entries.append((name, functools.partial(zip_entry_source, photo.id, photo.enhanced_path), photo.created_at))
+        logger.info(f"Streaming ZIP of {len(entries)} photos for user {current_user.id}")
+        # Streaming can take minutes; do not hold a pooled connection meanwhile
+        release_db_connection()
+        
+        response = app.response_class(stream_with_context(zip_stream.stream_zip(entries)), mimetype='application/zip')
+        response.headers['Content-Disposition'] = f'attachment; filename="elevance-photos-{datetime.utcnow():%Y%m%d}.zip"'
+        response.cache_control.private = True
+        response.cache_control.no_store = True
+        return response
+    except Exception as e:
+        logger.error(f"Error building photo ZIP: {e}", exc_info=True)
+        return jsonify({'error': 'Failed to download photos'}), 500
+
 @app.route('/api/photos/<int:photo_id>', methods=['DELETE'])
 @login_required
 def delete_photo(photo_id):
@@ -2001,8 +2639,14 @@ def delete_photo(photo_id):
                 file_deletion_errors.append(f"Failed to delete enhanced: {file_error}")
                 logger.warning(f"Failed to delete enhanced file {photo.enhanced_path}: {file_error}")
         
+        try:
+            renditions.discard(photo_id)
+        except OSError as file_error:
+            logger.warning(f"Failed to delete renditions of photo {photo_id}: {file_error}")
+        
         # Delete from database with transaction
         try:
+            ArchivedPayload.query.filter_by(photo_id=photo_id).delete()
             db.session.delete(photo)
             
             # Update user's processed images count
@@ -2043,6 +2687,7 @@ def create_checkout_session():
     
     # Sanitize the API key - remove whitespace, newlines, etc.
     stripe_secret = stripe_secret.strip()
+    stripe = get_stripe()
     
     # Validate API key format
     if not stripe_secret.startswith(('sk_live_', 'sk_test_')):
@@ -2166,6 +2811,7 @@ def create_checkout_session():
             payment.completed_at = datetime.utcnow()
             db.session.add(payment)
             db.session.commit()
+            metrics.PAYMENT_EVENTS.labels('free_access').inc()
             
             return jsonify({
                 'success': True,
@@ -2175,29 +2821,30 @@ def create_checkout_session():
         
         # Create Stripe Checkout Session
         try:
-            checkout_session = stripe.checkout.Session.create(
-                payment_method_types=['card'],
-                line_items=[{
-                    'price_data': {
-                        'currency': 'usd',
-                        'product_data': {
-                            'name': f'Enhanced Photo Download ({photo_count} photo{"s" if photo_count > 1 else ""})',
-                            'description': f'Download {photo_count} AI-enhanced photo{"s" if photo_count > 1 else ""}',
+            with metrics.time_histogram(metrics.STRIPE_API_SECONDS, 'checkout_session_create'):
+                checkout_session = stripe.checkout.Session.create(
+                    payment_method_types=['card'],
+                    line_items=[{
+                        'price_data': {
+                            'currency': 'usd',
+                            'product_data': {
+                                'name': f'Enhanced Photo Download ({photo_count} photo{"s" if photo_count > 1 else ""})',
+                                'description': f'Download {photo_count} AI-enhanced photo{"s" if photo_count > 1 else ""}',
+                            },
+                            'unit_amount': PHOTO_PRICE_CENTS,
                         },
-                        'unit_amount': PHOTO_PRICE_CENTS,
-                    },
-                    'quantity': photo_count,
-                }],
-                mode='payment',
-                success_url=request.host_url + 'payment/success?session_id={CHECKOUT_SESSION_ID}',
-                cancel_url=request.host_url + 'payment/cancel',
-                customer_email=current_user.email,
-                metadata={
-                    'user_id': str(current_user.id),
-                    'photo_count': str(photo_count),
-                    'photo_ids': json.dumps(photo_ids)
-                }
-            )
+                        'quantity': photo_count,
+                    }],
+                    mode='payment',
+                    success_url=request.host_url + 'payment/success?session_id={CHECKOUT_SESSION_ID}',
+                    cancel_url=request.host_url + 'payment/cancel',
+                    customer_email=current_user.email,
+                    metadata={
+                        'user_id': str(current_user.id),
+                        'photo_count': str(photo_count),
+                        'photo_ids': json.dumps(photo_ids)
+                    }
+                )
             
             # Create payment record
             payment = Payment(
@@ -2212,6 +2859,7 @@ def create_checkout_session():
             db.session.add(payment)
             db.session.commit()
             
+            metrics.PAYMENT_EVENTS.labels('checkout_created').inc()
             logger.info(f"Created checkout session {checkout_session.id} for user {current_user.id}, {photo_count} photos")
             
             return jsonify({
@@ -2301,7 +2949,9 @@ def payment_success():
     if session_id:
         try:
             # Retrieve the session from Stripe
-            checkout_session = stripe.checkout.Session.retrieve(session_id)
+            stripe = get_stripe()
+            with metrics.time_histogram(metrics.STRIPE_API_SECONDS, 'checkout_session_retrieve'):
+                checkout_session = stripe.checkout.Session.retrieve(session_id)
             
             # Update payment status
             payment = Payment.query.filter_by(stripe_session_id=session_id).first()
@@ -2310,6 +2960,7 @@ def payment_success():
                 payment.stripe_payment_intent_id = checkout_session.payment_intent
                 payment.completed_at = datetime.utcnow()
                 db.session.commit()
+                metrics.PAYMENT_EVENTS.labels('completed').inc()
                 logger.info(f"Payment {session_id} marked as completed")
             
             # Get photo IDs from payment to pass to template for auto-download
@@ -2358,9 +3009,10 @@ def payment_cancel():
 def stripe_webhook():
     """Handle Stripe webhook events"""
     # Check if Stripe is configured
-    if not app.config['STRIPE_SECRET_KEY'] or not stripe.api_key:
+    if not app.config['STRIPE_SECRET_KEY']:
         logger.error("Stripe not configured - webhook cannot be processed")
         return jsonify({'error': 'Payment system not configured'}), 500
+    stripe = get_stripe()
     
     payload = request.get_data(as_text=True)
     sig_header = request.headers.get('Stripe-Signature')
@@ -2391,6 +3043,7 @@ def stripe_webhook():
             payment.stripe_payment_intent_id = session.get('payment_intent')
             payment.completed_at = datetime.utcnow()
             db.session.commit()
+            metrics.PAYMENT_EVENTS.labels('completed').inc()
             logger.info(f"Payment {session['id']} completed via webhook")
     
     elif event['type'] == 'checkout.session.async_payment_succeeded':
@@ -2400,6 +3053,7 @@ def stripe_webhook():
             payment.status = 'completed'
             payment.completed_at = datetime.utcnow()
             db.session.commit()
+            metrics.PAYMENT_EVENTS.labels('async_succeeded').inc()
             logger.info(f"Payment {session['id']} succeeded via webhook")
     
     elif event['type'] == 'checkout.session.async_payment_failed':
@@ -2408,6 +3062,7 @@ def stripe_webhook():
         if payment:
             payment.status = 'failed'
             db.session.commit()
+            metrics.PAYMENT_EVENTS.labels('failed').inc()
             logger.info(f"Payment {session['id']} failed via webhook")
     
     return jsonify({'status': 'success'}), 200
@@ -2492,6 +3147,14 @@ def is_admin_user(user):
     
     return False
 
+
+def admin_page(query, model, per_page, with_total=True):
+    """keyset.paginate() for the admin lists; a cursor that does not decode shows the first page."""
+    try:
+        return keyset.paginate(query, model, per_page, cursor=request.args.get('cursor'), with_total=with_total)
+    except keyset.InvalidCursor:
+        return keyset.paginate(query, model, per_page, with_total=with_total)
+
 # Admin dashboard route
 @app.route('/admin')
 @login_required
@@ -2506,8 +3169,6 @@ def admin_dashboard():
                              error_description="You don't have permission to access this page."), 403
     
     try:
-        # Get pagination parameters
-        page = request.args.get('page', 1, type=int)
         per_page = 50  # Users per page
         search_query = request.args.get('search', '').strip()
         
@@ -2523,15 +3184,14 @@ def admin_dashboard():
             )
             query = query.filter(search_filter)
         
-        # Order by creation date (newest first)
-        query = query.order_by(User.created_at.desc())
-        
-        # Paginate
-        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+        # Newest first; without a search the user count below is the total
+        pagination = admin_page(query, User, per_page, with_total=bool(search_query))
         users = pagination.items
         
         # Calculate statistics
         total_users = User.query.count()
+        if not search_query:
+            pagination.total, pagination.total_exact = total_users, True
         email_users = User.query.filter(User.google_id.is_(None)).count()
         google_users = User.query.filter(User.google_id.is_not(None)).count()
         free_access_users = User.query.filter_by(has_free_access=True).count()
@@ -2630,23 +3290,19 @@ def admin_user_photos(user_id):
         # Get the user
         user = User.query.get_or_404(user_id)
         
-        # Get pagination parameters
-        page = request.args.get('page', 1, type=int)
         per_page = 20  # Photos per page
         
-        # Query photos for this user
+        # Query photos for this user, newest first
         photos_query = EnhancedImage.query.filter_by(user_id=user_id)
-        photos_query = photos_query.order_by(EnhancedImage.created_at.desc())
-        
-        # Paginate
-        pagination = photos_query.paginate(page=page, per_page=per_page, error_out=False)
+        pagination = admin_page(photos_query, EnhancedImage, per_page)
         photos = pagination.items
         
         # Filter out photos that don't exist (file or database backup)
         valid_photos = []
         for photo in photos:
             # Check if photo is accessible (file exists OR database has backup)
-            file_exists = os.path.exists(photo.enhanced_path) or photo.enhanced_image_data is not None
+            file_exists = (os.path.exists(photo.enhanced_path) or photo.archived_at is not None
+                           or photo.enhanced_image_data is not None)
             if file_exists:
                 valid_photos.append(photo)
         
@@ -2671,31 +3327,102 @@ def admin_anonymous_photos():
                              error_description="You don't have permission to access this page."), 403
 
     try:
-        page = request.args.get('page', 1, type=int)
         per_page = 20
 
         photos_query = EnhancedImage.query.filter(EnhancedImage.user_id.is_(None))
-        photos_query = photos_query.order_by(EnhancedImage.created_at.desc())
-
-        pagination = photos_query.paginate(page=page, per_page=per_page, error_out=False)
+        pagination = admin_page(photos_query, EnhancedImage, per_page)
         photos = pagination.items
 
         valid_photos = []
         for photo in photos:
             # Keep only photos that can be rendered from filesystem or DB backup
-            file_exists = os.path.exists(photo.enhanced_path) or photo.enhanced_image_data is not None
+            file_exists = (os.path.exists(photo.enhanced_path) or photo.archived_at is not None
+                           or photo.enhanced_image_data is not None)
             if file_exists:
                 valid_photos.append(photo)
 
         return render_template('admin_anonymous_photos.html',
                              photos=valid_photos,
-                             pagination=pagination,
-                             total_anonymous_photos=photos_query.count())
+                             pagination=pagination)
     except Exception as e:
         logger.error(f"Error loading anonymous photos for admin: {e}", exc_info=True)
         flash('An error occurred while loading anonymous photos.', 'error')
         return redirect(url_for('admin_dashboard'))
 
+@app.route('/admin/profiles')
+@login_required
+def admin_profiles():
+    """List saved request profiles. Requires admin privileges."""
+    if not is_admin_user(current_user):
+        logger.warning(f"Unauthorized admin access attempt by user {current_user.id} ({current_user.email})")
+        return render_template('error.html',
+                             error_code=403,
+                             error_message="Access Denied",
+                             error_description="You don't have permission to access this page."), 403
+
+    return render_template('admin_profiles.html',
+                         runs=profiling.list_runs(),
+                         profiling_enabled=profiling.PROFILING_ENABLED,
+                         max_runs=profiling.PROFILE_MAX_RUNS)
+
+@app.route('/admin/profiles/<path:filename>')
+@login_required
+def admin_profile_download(filename):
+    """Download one saved profile file. Requires admin privileges."""
+    if not is_admin_user(current_user):
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    path = profiling.profile_path(filename)
+    if path is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_file(path, as_attachment=True, download_name=filename, mimetype='application/octet-stream')
+
+# Preload support (preload_app in gunicorn.conf.py). prepare_for_fork() runs once in the
+# master so every worker shares its results copy-on-write; reinit_after_fork() runs in
+# each worker right after the fork.
+PRELOAD_MODULES = ['stripe', 'authlib.integrations.flask_client']
+
+
+def prepare_for_fork():
+    """Do the shared, fork-safe initialization in the gunicorn master."""
+    start = time.perf_counter()
+    template_dir = os.path.join(app.root_path, app.template_folder)
+    compiled = 0
+    for name in sorted(os.listdir(template_dir)):
+        if not name.endswith(('.html', '.xml')):
+            continue
+        try:
+            app.jinja_env.get_template(name)
+            compiled += 1
+        except Exception as e:
+            logger.warning(f"Could not precompile template {name}: {e}")
+    _watermark_font_data()
+    # Import, but do not configure, the libraries every worker loads on first use, so their
+    # code and module state are shared too. Clients are still built per worker.
+    for module in PRELOAD_MODULES + (['google.genai'] if enhancer.backend_name == 'gemini' else []):
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            logger.warning(f"Could not preload {module}: {e}")
+    # Connections opened by the startup schema check must not be inherited by workers
+    with app.app_context():
+        db.engine.dispose()
+    logger.info(f"Preloaded {compiled} templates and the watermark font in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+def reinit_after_fork():
+    """Reset per-process resources in a freshly forked worker."""
+    with app.app_context():
+        # close=False: the inherited connections belong to the master; never touch their sockets
+        db.engine.dispose(close=False)
+    # Network clients keep connection pools and are rebuilt on first use in each worker
+    enhancer.reset_backend()
+    image_pool.reset()
+    global _stripe, _google_oauth
+    _stripe = None
+    _google_oauth = None
+
+
 if __name__ == '__main__':
     # Production: Use environment variable for port, default to 5000
     port = int(os.getenv('PORT', 5000))
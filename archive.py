@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Move the image payloads of old, idle photos out of the database into cold storage.
+
+A photo is archived when it was created more than COLD_ARCHIVE_AFTER_DAYS ago and none of
+its images has been served for COLD_IDLE_DAYS (last_accessed_at, stamped by the photo
+endpoints at most once a day). Its images are written to pack files on the cold storage
+backend (cold_storage.py), archived_payload records where each one went, and the base64
+columns are cleared. The photo endpoints read archived images back when they are needed.
+
+Photos go in batches of --batch-size with --pause seconds between batches, one pack per
+batch (split when it reaches COLD_PACK_MB). Only one photo's payloads are in memory at a
+time. A pack is stored and its size checked before any row points at it. The index rows
+and cleared columns for a pack are committed together, so an interrupted run leaves at
+most an unreferenced pack behind. Run one archive.py at a time.
+
+Clearing the columns frees space inside the database, which new rows reuse. PostgreSQL only
+returns it to the OS after VACUUM FULL (or pg_repack), SQLite after VACUUM.
+
+Usage:
+  python archive.py --dry-run
+  python archive.py
+  python archive.py --older-than-days 60 --limit 1000
+"""
+
+import os
+import sys
+import time
+import base64
+import logging
+import argparse
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, or_, select, update
+from dotenv import load_dotenv
+
+# Add the current directory to the path so we can import app
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# The settings below and in the imported modules are read at import, before app.py would load .env
+load_dotenv()
+
+import metrics  # noqa: E402
+import cold_storage  # noqa: E402
+from models import ArchivedPayload, EnhancedImage  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+COLD_ARCHIVE_AFTER_DAYS = float(os.getenv('COLD_ARCHIVE_AFTER_DAYS', '30'))
+COLD_IDLE_DAYS = float(os.getenv('COLD_IDLE_DAYS', '14'))
+COLD_ARCHIVE_BATCH_SIZE = int(os.getenv('COLD_ARCHIVE_BATCH_SIZE', '50'))
+COLD_ARCHIVE_PAUSE_SECONDS = float(os.getenv('COLD_ARCHIVE_PAUSE_SECONDS', '0.5'))
+
+SOURCES = ('original', 'enhanced')
+
+
+class Archiver:
+    """One archive run over the photos that are past COLD_ARCHIVE_AFTER_DAYS and COLD_IDLE_DAYS."""
+
+    def __init__(self, db, dry_run=False, batch_size=COLD_ARCHIVE_BATCH_SIZE, pause=COLD_ARCHIVE_PAUSE_SECONDS,
+                 limit=None, older_than_days=COLD_ARCHIVE_AFTER_DAYS, idle_days=COLD_IDLE_DAYS,
+                 backend=None, now=None):
+        self.db = db
+        self.dry_run = dry_run
+        self.batch_size = max(1, batch_size)
+        self.pause = pause
+        self.limit = limit
+        self.backend = backend
+        now = now or datetime.utcnow()
+        self.conditions = [
+            EnhancedImage.archived_at.is_(None),
+            EnhancedImage.created_at < now - timedelta(days=older_than_days),
+            func.coalesce(EnhancedImage.last_accessed_at, EnhancedImage.created_at) < now - timedelta(days=idle_days),
+            or_(EnhancedImage.original_image_data.isnot(None), EnhancedImage.enhanced_image_data.isnot(None)),
+        ]
+        self.totals = {'photos': 0, 'images': 0, 'db_bytes': 0, 'pack_bytes': 0, 'packs': 0}
+
+    def run(self):
+        session = self.db.session
+        last_id = 0
+        while self.limit is None or self.totals['photos'] < self.limit:
+            batch_size = self.batch_size
+            if self.limit is not None:
+                batch_size = min(batch_size, self.limit - self.totals['photos'])
+            ids = session.scalars(
+                select(EnhancedImage.id).where(*self.conditions, EnhancedImage.id > last_id)
+                .order_by(EnhancedImage.id).limit(batch_size)
+            ).all()
+            if not ids:
+                break
+            last_id = ids[-1]
+            if self.dry_run:
+                self._count(ids)
+            else:
+                self._archive(ids)
+            session.rollback()  # End the read transaction between batches
+            if self.pause > 0:
+                time.sleep(self.pause)
+        return self.totals
+
+    def _count(self, ids):
+        stored_size = func.length if self.db.engine.dialect.name != 'postgresql' else func.pg_column_size
+        images, db_bytes = self.db.session.execute(
+            select(func.count(EnhancedImage.original_image_data) + func.count(EnhancedImage.enhanced_image_data),
+                   func.coalesce(func.sum(stored_size(EnhancedImage.original_image_data)), 0)
+                   + func.coalesce(func.sum(stored_size(EnhancedImage.enhanced_image_data)), 0))
+            .where(EnhancedImage.id.in_(ids))
+        ).one()
+        self.totals['photos'] += len(ids)
+        self.totals['images'] += images
+        self.totals['db_bytes'] += db_bytes
+
+    def _archive(self, ids):
+        session = self.db.session
+        writer = cold_storage.PackWriter(self.backend)
+        entries, photo_ids, db_bytes = [], [], 0
+        try:
+            for photo_id in ids:
+                payloads = session.execute(
+                    select(EnhancedImage.original_image_data, EnhancedImage.enhanced_image_data)
+                    .where(EnhancedImage.id == photo_id)
+                ).one()
+                for source, image_data in zip(SOURCES, payloads):
+                    if not image_data:
+                        continue
+                    image_bytes = base64.b64decode(image_data)
+                    offset, length = writer.add(image_bytes)
+                    entries.append({'photo_id': photo_id, 'source': source, 'pack': writer.key,
+                                    'pack_offset': offset, 'length': length, 'size': len(image_bytes)})
+                    db_bytes += len(image_data)
+                photo_ids.append(photo_id)
+                if writer.full:
+                    self._commit_pack(writer, entries, photo_ids, db_bytes)
+                    writer = cold_storage.PackWriter(self.backend)
+                    entries, photo_ids, db_bytes = [], [], 0
+            if entries:
+                self._commit_pack(writer, entries, photo_ids, db_bytes)
+            else:
+                writer.discard()
+        except BaseException:
+            writer.discard()
+            session.rollback()
+            raise
+
+    def _commit_pack(self, writer, entries, photo_ids, db_bytes):
+        session = self.db.session
+        pack_bytes = writer.size
+        writer.store()
+        now = datetime.utcnow()
+        session.execute(insert(ArchivedPayload), [dict(entry, archived_at=now) for entry in entries])
+        session.execute(
+            update(EnhancedImage)
+            .where(EnhancedImage.id.in_(photo_ids), EnhancedImage.archived_at.is_(None))
+            .values(original_image_data=None, enhanced_image_data=None, archived_at=now)
+        )
+        session.commit()
+
+        metrics.COLD_STORAGE_ARCHIVED_BYTES.labels('db').inc(db_bytes)
+        metrics.COLD_STORAGE_ARCHIVED_BYTES.labels('pack').inc(pack_bytes)
+        self.totals['photos'] += len(photo_ids)
+        self.totals['images'] += len(entries)
+        self.totals['db_bytes'] += db_bytes
+        self.totals['pack_bytes'] += pack_bytes
+        self.totals['packs'] += 1
+        logger.info(f"Archived {len(photo_ids)} photos to {writer.key} ({pack_bytes / 1e6:.1f} MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move old photo payloads from the database to cold storage')
+    parser.add_argument('--dry-run', action='store_true', help='Report what would be archived, change nothing')
+    parser.add_argument('--older-than-days', type=float, default=COLD_ARCHIVE_AFTER_DAYS,
+                        help='Only photos created more than this many days ago')
+    parser.add_argument('--idle-days', type=float, default=COLD_IDLE_DAYS,
+                        help='Only photos not served for this many days')
+    parser.add_argument('--batch-size', type=int, default=COLD_ARCHIVE_BATCH_SIZE, help='Photos per batch')
+    parser.add_argument('--pause', type=float, default=COLD_ARCHIVE_PAUSE_SECONDS,
+                        help='Seconds to sleep between batches')
+    parser.add_argument('--limit', type=int, default=None, help='Most photos to archive in this run')
+    args = parser.parse_args()
+
+    # Importing the app must not migrate; migrate.py does that as the release step
+    os.environ['AUTO_MIGRATE'] = 'False'
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    from app import app, db
+
+    with app.app_context():
+        archiver = Archiver(db, dry_run=args.dry_run, batch_size=args.batch_size, pause=args.pause,
+                            limit=args.limit, older_than_days=args.older_than_days, idle_days=args.idle_days)
+        try:
+            totals = archiver.run()
+        except Exception as e:
+            print(f"Archive failed: {e}")
+            import traceback
+            traceback.print_exc()
+            return 1
+
+    print(f"{'Would archive' if args.dry_run else 'Archived'} {totals['photos']} photos "
+          f"({totals['images']} images): {totals['db_bytes'] / 1e6:.1f} MB of base64 out of the database")
+    if not args.dry_run:
+        print(f"Wrote {totals['packs']} packs, {totals['pack_bytes'] / 1e6:.1f} MB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
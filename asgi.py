@@ -0,0 +1,126 @@
+"""
+ASGI entry point: serve the Flask app with many requests in flight per process.
+
+Under sync gunicorn workers every /api/enhance or /api/convert-to-night call holds a whole
+process while it waits for the AI service. Here the event loop owns the sockets and
+each request runs on a thread from a per-process pool of ASGI_THREADS threads. The AI
+call is network I/O, which releases the GIL, so one process can hold hundreds of AI calls
+at once. All Flask routes run unchanged; the SQLAlchemy session, Pillow and the AI
+client are synchronous, so nothing is rewritten as coroutines.
+
+Run it under gunicorn so gunicorn.conf.py (preload, metrics directory, post_fork) still
+applies:
+
+    gunicorn asgi:application -k uvicorn.workers.UvicornWorker --timeout 120
+
+asgiref's WsgiToAsgi runs every request on a single shared thread, so it is subclassed
+here to run requests on the pool instead. The subclass follows asgiref 3.12's internals
+(duplicate_header_limit), hence asgiref>=3.12.0 in requirements.txt.
+
+On Heroku-style hosts, replace the web line in the Procfile with the command above.
+"""
+
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from dotenv import load_dotenv
+
+# metrics reads PROMETHEUS_MULTIPROC_DIR when imported, before app.py would load .env
+load_dotenv()
+
+import metrics  # noqa: E402
+from app import app  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+# Threads per process available to requests. Each in-flight AI call holds one; size the
+# DB pool (DB_POOL_SIZE + DB_MAX_OVERFLOW) for the requests that query at the same time.
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', '200'))
+
+
+class _PooledWsgiInstance(WsgiToAsgiInstance):
+    def __init__(self, wsgi_application, executor, duplicate_header_limit=100):
+        super().__init__(wsgi_application, duplicate_header_limit)
+        self.executor = executor
+
+    async def run_wsgi_app(self, body):
+        metrics.ASGI_REQUESTS_IN_FLIGHT.inc()
+        try:
+            await sync_to_async(self._run_wsgi_app, thread_sensitive=False, executor=self.executor)(body)
+        finally:
+            metrics.ASGI_REQUESTS_IN_FLIGHT.dec()
+
+    def _run_wsgi_app(self, body):
+        # Same flow as asgiref's version, plus closing the response iterable as WSGI
+        # requires (send_file responses hold an open file until closed)
+        try:
+            environ = self.build_environ(self.scope, body)
+        except ValueError:
+            self.sync_send({'type': 'http.response.start', 'status': 400,
+                            'headers': [(b'content-type', b'text/plain')]})
+            self.sync_send({'type': 'http.response.body', 'body': b'Bad Request: Too many duplicate headers'})
+            return
+        result = self.wsgi_application(environ, self.start_response)
+        try:
+            bytes_sent = 0
+            for output in result:
+                if not self.response_started:
+                    self.response_started = True
+                    self.sync_send(self.response_start)
+                if self.response_content_length is not None:
+                    output = output[:self.response_content_length - bytes_sent]
+                self.sync_send({'type': 'http.response.body', 'body': output, 'more_body': True})
+                bytes_sent += len(output)
+                if bytes_sent == self.response_content_length:
+                    break
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        if not self.response_started:
+            self.response_started = True
+            self.sync_send(self.response_start)
+        self.sync_send({'type': 'http.response.body'})
+
+
+class ThreadPoolWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi that runs each request on a bounded thread pool and handles lifespan."""
+
+    def __init__(self, wsgi_application, max_threads):
+        super().__init__(wsgi_application)
+        self.max_threads = max_threads
+        self.executor = None
+
+    def _get_executor(self):
+        # Created in the worker process, never in a preloading master
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_threads, thread_name_prefix='asgi-request')
+        return self.executor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        await _PooledWsgiInstance(self.wsgi_application, self._get_executor(), self.duplicate_header_limit)(
+            scope, receive, send
+        )
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self._get_executor()
+                logger.info(f"ASGI request pool ready ({self.max_threads} threads)")
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                # The server has already drained in-flight requests
+                if self.executor is not None:
+                    self.executor.shutdown(wait=True)
+                    self.executor = None
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+application = ThreadPoolWsgiToAsgi(app, ASGI_THREADS)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Database size and read latency before and after archiving old photos to cold storage.
+
+Seeds a throwaway SQLite database with --photos photos whose base64 payloads are fixture
+JPEGs of --mp megapixels. All but --recent of them are 60 days old. Measured before and
+after archive.py moves the old payloads to local pack files (followed by VACUUM):
+
+  db MB           size of the SQLite file
+  scan ms         a query that reads every enhanced_image row (the table's working set)
+  page ms         GET /api/photos for the 20 newest photos
+  restore ms      GET /original for an old photo whose local file is gone, so it is
+                  restored from the database (before) or from a pack (after); median
+                  and p95 over --restores photos
+
+Usage:
+  python benchmarks/cold_archive.py
+  python benchmarks/cold_archive.py --photos 400 --mp 2 --recent 40
+"""
+
+import os
+import sys
+import time
+import base64
+import shutil
+import logging
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import megapixel_size, photo_bytes  # noqa: E402
+
+EMAIL = 'cold-bench@example.com'
+
+
+def load_app(workdir):
+    os.chdir(workdir)
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['AI_BACKEND'] = 'stub'
+    os.environ['COLD_STORAGE_BACKEND'] = 'local'
+    os.environ['COLD_STORAGE_DIR'] = os.path.join(workdir, 'cold_storage')
+    logging.basicConfig(level=logging.ERROR)
+    import app as app_module
+    return app_module
+
+
+def seed(app_module, client, photos, mp, recent):
+    from models import db, User, EnhancedImage
+    client.post('/signup', json={'username': 'cold_bench', 'email': EMAIL,
+                                 'password': 'bench-secret', 'confirm_password': 'bench-secret'})
+    width, height = megapixel_size(mp)
+    payloads = [base64.b64encode(photo_bytes(width, height, seed=k)).decode() for k in range(8)]
+    old = datetime.utcnow() - timedelta(days=60)
+    with app_module.app.app_context():
+        user_id = User.query.filter_by(email=EMAIL).first().id
+        for k in range(photos):
+            db.session.add(EnhancedImage(
+                user_id=user_id, original_filename=f'IMG_{k:04d}.jpg', enhanced_filename=f'enhanced_IMG_{k:04d}.jpg',
+                # Not on disk, so serving restores them from the database or cold storage
+                original_path=f'uploads/bench_{k}.jpg', enhanced_path=f'enhanced/bench_{k}.jpg',
+                original_image_data=payloads[k % 8], enhanced_image_data=payloads[(k + 1) % 8],
+                created_at=datetime.utcnow() if k >= photos - recent else old,
+            ))
+            if k % 50 == 49:
+                db.session.commit()
+        db.session.commit()
+        return [p.id for p in EnhancedImage.query.filter(EnhancedImage.created_at == old)
+                .order_by(EnhancedImage.id)]
+
+
+def measure(app_module, client, old_ids, restores, workdir):
+    from models import db
+    with app_module.app.app_context():
+        with db.engine.connect() as conn:
+            conn.execute(text('VACUUM'))
+            start = time.perf_counter()
+            conn.execute(text("SELECT COUNT(*) FROM enhanced_image WHERE length(enhanced_image_data) > 0 "
+                              "OR conversion_type = 'x'")).scalar()
+            scan_ms = (time.perf_counter() - start) * 1000
+
+    page_times = []
+    for _ in range(10):
+        start = time.perf_counter()
+        assert client.get('/api/photos?per_page=20').status_code == 200
+        page_times.append((time.perf_counter() - start) * 1000)
+
+    restore_times = []
+    for photo_id in old_ids[:restores]:
+        start = time.perf_counter()
+        response = client.get(f'/api/photos/{photo_id}/original', headers={'Cache-Control': 'no-cache'})
+        restore_times.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.status_code
+    # Remove what was restored, so the next pass restores again
+    shutil.rmtree(os.path.join(workdir, 'uploads'), ignore_errors=True)
+    os.makedirs(os.path.join(workdir, 'uploads'), exist_ok=True)
+
+    restore_times.sort()
+    return {
+        'db_mb': os.path.getsize(os.path.join(workdir, 'bench.db')) / 1e6,
+        'scan_ms': scan_ms,
+        'page_ms': statistics.median(page_times),
+        'restore_p50_ms': statistics.median(restore_times),
+        'restore_p95_ms': restore_times[int(len(restore_times) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Database size and read latency with cold storage')
+    parser.add_argument('--photos', type=int, default=200)
+    parser.add_argument('--mp', type=float, default=1, help='Megapixels of the fixture payloads')
+    parser.add_argument('--recent', type=int, default=20, help='Photos young enough to stay in the database')
+    parser.add_argument('--restores', type=int, default=30)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='cold_archive_')
+    cwd = os.getcwd()
+    try:
+        app_module = load_app(workdir)
+        import archive
+        from models import db
+        client = app_module.app.test_client()
+        old_ids = seed(app_module, client, args.photos, args.mp, args.recent)
+
+        before = measure(app_module, client, old_ids, args.restores, workdir)
+        with app_module.app.app_context():
+            start = time.perf_counter()
+            # The before pass stamped last_accessed_at on the photos it restored
+            totals = archive.Archiver(db, pause=0, idle_days=0).run()
+            archive_s = time.perf_counter() - start
+        after = measure(app_module, client, old_ids, args.restores, workdir)
+        pack_mb = sum(os.path.getsize(os.path.join(d, f))
+                      for d, _, files in os.walk(os.path.join(workdir, 'cold_storage')) for f in files) / 1e6
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{args.photos} photos of {args.mp:g} MP, {args.photos - args.recent} archived in {archive_s:.1f} s "
+          f"({totals['packs']} packs, {pack_mb:.1f} MB)\n")
+    print(f"{'':<16} {'before':>10} {'after':>10}")
+    for key, label in (('db_mb', 'db MB'), ('scan_ms', 'scan ms'), ('page_ms', 'page ms'),
+                       ('restore_p50_ms', 'restore p50 ms'), ('restore_p95_ms', 'restore p95 ms')):
+        print(f"{label:<16} {before[key]:>10.1f} {after[key]:>10.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
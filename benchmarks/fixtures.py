@@ -0,0 +1,73 @@
+"""
+Deterministic fixture photos for load tests and benchmarks.
+
+Images are generated from a fixed seed instead of being committed to the repo. The
+same (width, height, seed) always gives the same pixels. Generated files are cached
+under benchmarks/.fixtures.
+"""
+
+import os
+import random
+from io import BytesIO
+
+from PIL import Image, ImageDraw, ImageFilter
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.fixtures')
+
+
+def make_photo(width, height, seed=0, alpha=False):
+    """Build a photo-like image: a gradient with soft shapes and sensor-style noise.
+
+    The noise keeps JPEG/WebP sizes close to real phone photos. A flat synthetic
+    image would compress to almost nothing.
+    """
+    rnd = random.Random(seed)
+    base_w, base_h = 640, max(1, int(640 * height / width))
+    base = Image.linear_gradient('L').resize((base_w, base_h)).convert('RGB')
+    draw = ImageDraw.Draw(base)
+    for _ in range(30):
+        x, y = rnd.randrange(base_w), rnd.randrange(base_h)
+        r = rnd.randrange(20, 160)
+        draw.ellipse((x - r, y - r, x + r, y + r),
+                     fill=(rnd.randrange(256), rnd.randrange(256), rnd.randrange(256)))
+    base = base.filter(ImageFilter.GaussianBlur(2))
+
+    photo = base.resize((width, height), Image.Resampling.BICUBIC)
+    noise = Image.effect_noise((width, height), 24).convert('RGB')
+    photo = Image.blend(photo, noise, 0.08)
+
+    if alpha:
+        mask = Image.linear_gradient('L').rotate(90).resize((width, height))
+        photo.putalpha(mask)
+    return photo
+
+
+def photo_bytes(width, height, fmt='JPEG', seed=0, quality=90):
+    """Encoded fixture bytes, cached on disk between runs."""
+    alpha = fmt.upper() == 'PNG'
+    ext = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}[fmt.upper()]
+    path = os.path.join(FIXTURE_DIR, f'photo_{width}x{height}_s{seed}_q{quality}.{ext}')
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    image = make_photo(width, height, seed=seed, alpha=alpha)
+    buffer = BytesIO()
+    if fmt.upper() == 'PNG':
+        image.save(buffer, format='PNG', compress_level=1)
+    else:
+        image.save(buffer, format=fmt.upper(), quality=quality)
+    data = buffer.getvalue()
+
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return data
+
+
+def megapixel_size(megapixels, aspect=(4, 3)):
+    """(width, height) for an image of roughly `megapixels` MP at the given aspect ratio."""
+    aw, ah = aspect
+    height = int((megapixels * 1_000_000 * ah / aw) ** 0.5)
+    width = int(height * aw / ah)
+    return width, height
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Bytes and time to load one gallery page of thumbnails.
+
+Seeds --photos photos of --size MP for one user, then loads every thumbnail of the page
+through the Flask test client three ways:
+
+  full        /original + /preview per photo (what the grids loaded before renditions)
+  cold        /rendition at --width, cache empty (every thumbnail is rendered)
+  warm        the same again, served from the rendition cache
+
+Each is then loaded once more as a repeat visit whose browser cache has expired: every
+request sends the ETag it got the first time and should come back 304 Not Modified.
+
+Renditions are requested once with a browser's Accept header (WebP) and once with
+fmt=jpeg.
+
+Usage:
+  python benchmarks/gallery_weight.py
+  python benchmarks/gallery_weight.py --photos 20 --size 12 --width 480 --output gallery.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import photo_bytes, megapixel_size
+
+BROWSER_ACCEPT = 'image/avif,image/webp,image/apng,image/*,*/*;q=0.8'
+
+
+def load_app(workdir):
+    """Import the app against a throwaway SQLite DB with the stub AI backend."""
+    os.chdir(workdir)
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['AI_BACKEND'] = 'stub'
+    logging.basicConfig(level=logging.ERROR)
+    import app as app_module
+    return app_module
+
+
+def seed(app_module, client, photos, size):
+    """Sign up an owner with free access and give it `photos` photos. Returns their ids."""
+    from models import db, User, EnhancedImage
+    width, height = megapixel_size(size)
+    with open('uploads/gallery.jpg', 'wb') as f:
+        f.write(photo_bytes(width, height, 'JPEG', seed=11))
+    with open('enhanced/gallery.jpg', 'wb') as f:
+        f.write(photo_bytes(width, height, 'JPEG', seed=12, quality=95))
+    response = client.post('/signup', json={
+        'username': 'gallery_owner', 'email': 'gallery_owner@example.com',
+        'password': 'gallery-secret', 'confirm_password': 'gallery-secret',
+    })
+    assert response.status_code == 200, response.get_data(as_text=True)[:200]
+    with app_module.app.app_context():
+        owner = User.query.filter_by(username='gallery_owner').first()
+        rows = [EnhancedImage(
+            user_id=owner.id, original_filename=f'IMG_{i:04d}.jpg', original_path='uploads/gallery.jpg',
+            enhanced_filename=f'enhanced_IMG_{i:04d}.jpg', enhanced_path='enhanced/gallery.jpg',
+        ) for i in range(photos)]
+        db.session.add_all(rows)
+        db.session.commit()
+        return [row.id for row in rows]
+
+
+def load_page(client, urls, headers=None, etags=None):
+    """Fetch every URL. With `etags` (url -> ETag from an earlier load), revalidate like a browser."""
+    start = time.perf_counter()
+    total = 0
+    not_modified = 0
+    seen = {}
+    for url in urls:
+        request_headers = dict(headers or {})
+        if etags and etags.get(url):
+            request_headers['If-None-Match'] = etags[url]
+        response = client.get(url, headers=request_headers)
+        assert response.status_code in (200, 304), (url, response.status_code)
+        not_modified += response.status_code == 304
+        total += len(response.get_data())
+        seen[url] = response.headers.get('ETag')
+    return {'requests': len(urls), 'bytes': total, 'not_modified': not_modified,
+            'seconds': round(time.perf_counter() - start, 3)}, seen
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gallery page weight with and without renditions')
+    parser.add_argument('--photos', type=int, default=20, help='Photos on the page')
+    parser.add_argument('--size', type=int, default=12, help='Photo size in megapixels')
+    parser.add_argument('--width', type=int, default=480, help='Rendition width requested by the grid')
+    parser.add_argument('--output', default=None, help='Write results JSON here')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='gallery_weight_')
+    cwd = os.getcwd()
+    results = {}
+    try:
+        app_module = load_app(workdir)
+        import renditions
+        client = app_module.app.test_client()
+        ids = seed(app_module, client, args.photos, args.size)
+
+        full_urls = [f'/api/photos/{i}/{kind}' for i in ids for kind in ('original', 'preview')]
+        results['full'], etags = load_page(client, full_urls)
+        results['full_revisit'], _ = load_page(client, full_urls, etags=etags)
+        for label, query, headers in (('webp', '', {'Accept': BROWSER_ACCEPT}), ('jpeg', '&fmt=jpeg', None)):
+            urls = [f'/api/photos/{i}/rendition?w={args.width}{query}{src}'
+                    for i in ids for src in ('&src=original', '')]
+            for photo_id in ids:
+                renditions.discard(photo_id)
+            results[f'{label}_cold'], etags = load_page(client, urls, headers)
+            results[f'{label}_warm'], _ = load_page(client, urls, headers)
+            results[f'{label}_revisit'], _ = load_page(client, urls, headers, etags=etags)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    full_bytes = results['full']['bytes']
+    print(f"{args.photos} photos of {args.size} MP, thumbnails at {args.width}px\n")
+    print(f"{'page load':<14} {'requests':>9} {'304s':>6} {'KB':>10} {'seconds':>9} {'vs full':>9}")
+    print('-' * 62)
+    for name, result in results.items():
+        ratio = f"{full_bytes / result['bytes']:.1f}x" if result['bytes'] else '-'
+        print(f"{name:<14} {result['requests']:>9} {result['not_modified']:>6} {result['bytes'] / 1024:>10.0f} "
+              f"{result['seconds']:>9.2f} {ratio:>9}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'timestamp': datetime.utcnow().isoformat(), 'photos': args.photos,
+                       'size_mp': args.size, 'width': args.width, 'results': results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the image hot paths.
+
+Cases cover normalize_saved_upload, add_watermark, base64 encode/decode of stored
+payloads, ImageEnhancer request encoding and response decoding, and EnhancedImage.to_dict
+over a page of rows. Fixture photos are 1, 12, 24 and 48 MP in JPEG, PNG (with alpha)
+and WebP.
+
+Each case runs once as a warmup. It then reports median/min wall time over --repeat
+runs, and peak memory from one extra tracemalloc run. tracemalloc sees Python-heap
+allocations (bytes, base64 strings, encode buffers) but not Pillow's internal pixel
+buffers.
+
+Usage:
+  python benchmarks/image_paths.py --sizes 1,12 --output bench.json
+  python benchmarks/image_paths.py --save-baseline benchmarks/baseline.json
+  python benchmarks/image_paths.py --baseline benchmarks/baseline.json --threshold 0.25
+Exits with status 1 when a case's min time or peak memory exceeds baseline * (1 + threshold).
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import shutil
+import logging
+import argparse
+import tempfile
+import tracemalloc
+import statistics
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import photo_bytes, megapixel_size
+
+SIZES_MP = (1, 12, 24, 48)
+FORMATS = ('JPEG', 'PNG', 'WEBP')
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+CASES = ('normalize', 'watermark', 'b64_encode', 'b64_decode', 'ai_encode', 'ai_decode', 'to_dict')
+
+
+def load_app(workdir):
+    """Import the app against a throwaway SQLite DB with the stub AI backend."""
+    os.chdir(workdir)
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['AI_BACKEND'] = 'stub'
+    # Configure logging first so the app's INFO-level basicConfig becomes a no-op
+    logging.basicConfig(level=logging.WARNING)
+    import app as app_module
+    return app_module
+
+
+def measure(func, setup, repeat):
+    """Warm up once, run func(setup()) `repeat` times for timing, then once more under tracemalloc."""
+    func(setup())
+    timings = []
+    for _ in range(repeat):
+        arg = setup()
+        start = time.perf_counter()
+        func(arg)
+        timings.append(time.perf_counter() - start)
+
+    arg = setup()
+    tracemalloc.start()
+    try:
+        func(arg)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'median_ms': round(statistics.median(timings) * 1000, 2),
+        'min_ms': round(min(timings) * 1000, 2),
+        'peak_mem_kb': round(peak / 1024, 1),
+    }
+
+
+def build_cases(app_module, workdir, size_mp, fmt, selected):
+    """Yield (case_name, func, setup) for one fixture."""
+    width, height = megapixel_size(size_mp)
+    data = photo_bytes(width, height, fmt)
+    ext = EXTENSIONS[fmt]
+    source_path = os.path.join(workdir, f'source_{size_mp}mp.{ext}')
+    with open(source_path, 'wb') as f:
+        f.write(data)
+
+    if 'normalize' in selected:
+        counter = [0]
+
+        def normalize_setup():
+            # normalize_saved_upload removes its input, so work on a fresh copy each run
+            counter[0] += 1
+            path = os.path.join(workdir, 'uploads', f'bench_{counter[0]}.{ext}')
+            shutil.copyfile(source_path, path)
+            return path
+
+        def normalize(path):
+            result = app_module.normalize_saved_upload(path)
+            for candidate in {path, result[0]}:
+                if os.path.exists(candidate):
+                    os.remove(candidate)
+
+        yield 'normalize', normalize, normalize_setup
+
+    # Downstream stages work on the JPEG the pipeline actually stores
+    jpeg_bytes = data if fmt == 'JPEG' else photo_bytes(width, height, 'JPEG')
+    jpeg_b64 = base64.b64encode(jpeg_bytes).decode('utf-8')
+
+    if 'watermark' in selected:
+        yield 'watermark', app_module.add_watermark, lambda: jpeg_bytes
+    if 'b64_encode' in selected:
+        yield 'b64_encode', lambda raw: base64.b64encode(raw).decode('utf-8'), lambda: jpeg_bytes
+    if 'b64_decode' in selected:
+        yield 'b64_decode', base64.b64decode, lambda: jpeg_b64
+
+    enhancer = None
+    if 'ai_encode' in selected or 'ai_decode' in selected:
+        from image_enhancer import ImageEnhancer
+        from ai_backends import LocalStubBackend
+        enhancer = ImageEnhancer(backend=LocalStubBackend(url='http://127.0.0.1:9'))
+    if 'ai_encode' in selected:
+        yield 'ai_encode', enhancer._encode_request_image, lambda: source_path
+    if 'ai_decode' in selected:
+        # Pillow decodes lazily; force the pixel decode the save step would trigger
+        yield 'ai_decode', lambda raw: enhancer._decode_response_image(raw).load(), lambda: jpeg_bytes
+
+
+def build_to_dict_case(app_module, page_size=100):
+    settings = json.dumps({
+        'response': 'Enhanced lighting and colour balance. ' * 20,
+        'enhanced_by_ai': True,
+        'reason': 'Successfully enhanced by AI',
+        'change_intensity': 'moderate',
+        'detail_level': 'moderate',
+    })
+    rows = [
+        app_module.EnhancedImage(
+            id=i, user_id=1,
+            original_filename=f'IMG_{i:04d}.jpg', original_path=f'uploads/IMG_{i:04d}_work.jpg',
+            original_file_size=2_400_000, enhanced_filename=f'enhanced_IMG_{i:04d}.jpg',
+            enhanced_path=f'enhanced/enhanced_IMG_{i:04d}.jpg', enhanced_file_size=2_900_000,
+            conversion_type='enhancement', change_intensity='moderate', detail_level='moderate',
+            enhancement_settings=settings, ai_analysis='Enhanced lighting and colour balance. ' * 20,
+            created_at=datetime(2026, 1, 1, 12, 0, 0),
+        )
+        for i in range(page_size)
+    ]
+    return lambda page: [row.to_dict() for row in page], lambda: rows
+
+
+def compare(results, baseline, threshold):
+    """Return a list of regression messages."""
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if not previous:
+            continue
+        # min_ms is the least noisy timing statistic between runs
+        for metric in ('min_ms', 'peak_mem_kb'):
+            before, after = previous.get(metric), current.get(metric)
+            # Ignore tiny absolute values where noise dominates
+            floor = 1.0 if metric == 'min_ms' else 64.0
+            if before is None or after is None or max(before, after) < floor:
+                continue
+            if after > before * (1 + threshold):
+                regressions.append(f"{key} {metric}: {before} -> {after} (+{(after / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the image hot paths')
+    parser.add_argument('--sizes', default=','.join(str(s) for s in SIZES_MP), help='Megapixel sizes, e.g. 1,12')
+    parser.add_argument('--formats', default=','.join(FORMATS), help='Fixture formats, e.g. JPEG,WEBP')
+    parser.add_argument('--cases', default=','.join(CASES), help='Cases to run')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default=None, help='Write results JSON here')
+    parser.add_argument('--baseline', default=None, help='Compare against this results JSON')
+    parser.add_argument('--save-baseline', default=None, help='Write results as a new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Allowed regression ratio (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    formats = [f.strip().upper() for f in args.formats.split(',') if f]
+    selected = {c.strip() for c in args.cases.split(',') if c}
+
+    workdir = tempfile.mkdtemp(prefix='bench_images_')
+    cwd = os.getcwd()
+    results = {}
+    try:
+        app_module = load_app(workdir)
+        print(f"{'Case':<42} {'median ms':>10} {'min ms':>10} {'peak KB':>12}")
+        print('-' * 78)
+        for size_mp in sizes:
+            for fmt in formats:
+                # Format only matters for decode-heavy stages; run the rest once per size on JPEG
+                fixture_cases = selected if fmt == 'JPEG' else selected & {'normalize', 'ai_encode'}
+                for name, func, setup in build_cases(app_module, workdir, size_mp, fmt, fixture_cases):
+                    key = f"{name}/{size_mp}mp/{fmt.lower()}"
+                    results[key] = measure(func, setup, args.repeat)
+                    r = results[key]
+                    print(f"{key:<42} {r['median_ms']:>10} {r['min_ms']:>10} {r['peak_mem_kb']:>12}")
+        if 'to_dict' in selected:
+            func, setup = build_to_dict_case(app_module)
+            results['to_dict/page100'] = measure(func, setup, max(args.repeat, 5))
+            r = results['to_dict/page100']
+            print(f"{'to_dict/page100':<42} {r['median_ms']:>10} {r['min_ms']:>10} {r['peak_mem_kb']:>12}")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    payload = {'timestamp': datetime.utcnow().isoformat(), 'results': results}
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(payload, f, indent=2)
+            print(f"Results written to {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f).get('results', {})
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nREGRESSIONS (threshold {args.threshold * 100:.0f}%):")
+            for message in regressions:
+                print(f"  - {message}")
+            return 1
+        print(f"\nNo regressions against {args.baseline} (threshold {args.threshold * 100:.0f}%)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Saturation behaviour of the bounded image pool (image_pool.py).
+
+Simulates a burst of preview requests on a threaded server: --clients request threads
+each watermark a photo in a loop for --duration seconds. Meanwhile a probe thread sends
+a light request (GET /livez through the Flask test client) every 50 ms. Each
+configuration is run in turn:
+
+  inline       IMAGE_POOL_THREADS=0: every request thread runs Pillow itself (no bound)
+  pool T/Q     T pool threads, Q queued operations, the rest rejected with 503
+
+Reported per configuration: completed and rejected watermarks, watermark latency
+(p50/p95) and the latency of the light probe requests (p50/p95/max). The probe shows
+whether the burst starves the rest of the app.
+
+Usage:
+  python benchmarks/image_pool_saturation.py
+  python benchmarks/image_pool_saturation.py --clients 32 --pools 1/4,2/8,4/16 --size 12
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+import statistics
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import photo_bytes, megapixel_size
+
+
+def load_app(workdir):
+    """Import the app against a throwaway SQLite DB with the stub AI backend."""
+    os.chdir(workdir)
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['AI_BACKEND'] = 'stub'
+    logging.basicConfig(level=logging.ERROR)
+    import app as app_module
+    return app_module
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * pct / 100))] * 1000, 1)
+
+
+def run_config(app_module, image, threads, queue, clients, duration):
+    import image_pool
+    image_pool.IMAGE_POOL_THREADS = threads
+    image_pool.IMAGE_POOL_QUEUE = queue
+    image_pool.reset()
+
+    deadline = time.perf_counter() + duration
+    latencies, probe_latencies = [], []
+    counts = {'completed': 0, 'busy': 0, 'timeout': 0}
+    lock = threading.Lock()
+
+    def preview_client():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                image_pool.run('watermark', app_module.add_watermark, image)
+                outcome = 'completed'
+            except image_pool.ImagePoolBusy:
+                outcome = 'busy'
+                # A rejected client backs off like a browser honouring Retry-After would
+                time.sleep(0.05)
+            except image_pool.ImagePoolTimeout:
+                outcome = 'timeout'
+            with lock:
+                counts[outcome] += 1
+                if outcome == 'completed':
+                    latencies.append(time.perf_counter() - start)
+
+    def probe():
+        client = app_module.app.test_client()
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            client.get('/livez')
+            probe_latencies.append(time.perf_counter() - start)
+            time.sleep(0.05)
+
+    workers = [threading.Thread(target=preview_client) for _ in range(clients)]
+    workers.append(threading.Thread(target=probe))
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    wall = time.perf_counter() - started
+
+    return {
+        'threads': threads, 'queue': queue, 'wall_s': round(wall, 2),
+        **counts,
+        'watermarks_per_s': round(counts['completed'] / wall, 2),
+        'watermark_p50_ms': percentile(latencies, 50), 'watermark_p95_ms': percentile(latencies, 95),
+        'probe_p50_ms': percentile(probe_latencies, 50), 'probe_p95_ms': percentile(probe_latencies, 95),
+        'probe_max_ms': round(max(probe_latencies) * 1000, 1) if probe_latencies else None,
+        'probe_mean_ms': round(statistics.mean(probe_latencies) * 1000, 1) if probe_latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Saturation benchmark for the bounded image pool')
+    parser.add_argument('--clients', type=int, default=24, help='Concurrent preview request threads')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per configuration')
+    parser.add_argument('--size', type=int, default=6, help='Photo size in megapixels')
+    parser.add_argument('--pools', default='1/4,2/8,4/16', help='Pool configurations THREADS/QUEUE')
+    parser.add_argument('--output', default=None, help='Write results JSON here')
+    args = parser.parse_args()
+
+    width, height = megapixel_size(args.size)
+    image = photo_bytes(width, height, 'JPEG', seed=3)
+
+    workdir = tempfile.mkdtemp(prefix='image_pool_')
+    cwd = os.getcwd()
+    results = []
+    try:
+        app_module = load_app(workdir)
+        configs = [(0, 0)] + [tuple(int(v) for v in pool.split('/')) for pool in args.pools.split(',')]
+        for threads, queue in configs:
+            results.append(run_config(app_module, image, threads, queue, args.clients, args.duration))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{args.clients} preview clients, {args.size} MP photo, {args.duration:.0f}s each, "
+          f"{os.cpu_count()} CPUs\n")
+    print(f"{'config':<12} {'done':>6} {'busy':>6} {'t/o':>5} {'wm/s':>7} {'wm p50':>8} {'wm p95':>8} "
+          f"{'probe p50':>10} {'probe p95':>10} {'probe max':>10}")
+    print('-' * 92)
+    for r in results:
+        name = 'inline' if r['threads'] == 0 else f"pool {r['threads']}/{r['queue']}"
+        print(f"{name:<12} {r['completed']:>6} {r['busy']:>6} {r['timeout']:>5} {r['watermarks_per_s']:>7} "
+              f"{r['watermark_p50_ms']!s:>8} {r['watermark_p95_ms']!s:>8} "
+              f"{r['probe_p50_ms']!s:>10} {r['probe_p95_ms']!s:>10} {r['probe_max_ms']!s:>10}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'timestamp': datetime.utcnow().isoformat(), 'clients': args.clients,
+                       'size_mp': args.size, 'results': results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
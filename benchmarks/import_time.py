@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Import-time budget for the app module.
+
+Runs `python -X importtime -c "import app"` in a fresh interpreter against a throwaway
+SQLite database, parses the per-module timings, and prints the slowest imports. This
+is the time every gunicorn worker spends before it can serve a request.
+
+The run fails (exit status 1) when:
+  - the median cumulative time of `import app` exceeds --budget-ms, or
+  - a module listed in DEFERRED_MODULES was imported at startup. Those are loaded on
+    first use (get_stripe, get_google_oauth, ImageEnhancer.backend).
+
+Usage:
+  python benchmarks/import_time.py                      # check the default budget
+  python benchmarks/import_time.py --budget-ms 600 --output import_time.json
+  python benchmarks/import_time.py --top 40 --report    # print without failing
+"""
+
+import os
+import re
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Heavy packages that must stay out of the startup path
+DEFERRED_MODULES = ('google.genai', 'authlib.integrations.flask_client', 'stripe')
+
+_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$')
+
+
+def parse_importtime(stderr):
+    """Parse -X importtime output into dicts with module, self_us, cumulative_us and depth."""
+    rows = []
+    for line in stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        rows.append({
+            'module': module,
+            'self_us': int(self_us),
+            'cumulative_us': int(cumulative_us),
+            # importtime indents nested imports by two spaces per level
+            'depth': (len(indent) - 1) // 2,
+        })
+    return rows
+
+
+def run_once(workdir):
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'import_time.db')}",
+        # Production configuration. The key is never used: the client is built on first use
+        'AI_BACKEND': 'gemini',
+        'GEMINI_API_KEY': 'import-time-placeholder',
+        'STRIPE_SECRET_KEY': 'sk_test_import_time_placeholder',
+        'GOOGLE_CLIENT_ID': 'import-time-placeholder',
+        'GOOGLE_CLIENT_SECRET': 'import-time-placeholder',
+        'PYTHONPATH': REPO_ROOT,
+    })
+    env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        cwd=workdir, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import app failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the import-time budget of the app module')
+    parser.add_argument('--budget-ms', type=float, default=float(os.getenv('IMPORT_BUDGET_MS', '900')),
+                        help='Maximum median cumulative time of `import app` (default 900)')
+    parser.add_argument('--repeat', type=int, default=5, help='Measured runs after one warm-up run')
+    parser.add_argument('--top', type=int, default=20, help='How many of the slowest modules to list')
+    parser.add_argument('--report', action='store_true', help='Print timings without enforcing the budget')
+    parser.add_argument('--output', default=None, help='Write results JSON here')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='import_time_')
+    try:
+        # Warm-up: compiles bytecode and creates the SQLite schema, neither of which a
+        # deployed worker pays for
+        run_once(workdir)
+        runs = [run_once(workdir) for _ in range(max(1, args.repeat))]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    totals = []
+    for rows in runs:
+        app_row = next(row for row in rows if row['module'] == 'app' and row['depth'] == 0)
+        totals.append(app_row['cumulative_us'] / 1000)
+    total_ms = statistics.median(totals)
+
+    # The run closest to the median is the one shown
+    rows = runs[min(range(len(runs)), key=lambda i: abs(totals[i] - total_ms))]
+    # Modules imported directly by app.py. Shared dependencies are charged to whichever
+    # of them imported them first
+    direct = [row for row in rows if row['depth'] == 1]
+    slowest = sorted(rows, key=lambda row: row['self_us'], reverse=True)[:args.top]
+    loaded = {row['module'] for row in rows}
+    eager = [module for module in DEFERRED_MODULES if module in loaded]
+
+    print(f"import app: {total_ms:.1f} ms median of {len(totals)} runs "
+          f"(min {min(totals):.1f}, max {max(totals):.1f}), budget {args.budget_ms:.0f} ms\n")
+    print(f"{'Slowest modules (self time)':<52} {'self ms':>8} {'cum ms':>8}")
+    print('-' * 70)
+    for row in slowest:
+        print(f"{row['module'][:52]:<52} {row['self_us'] / 1000:>8.1f} {row['cumulative_us'] / 1000:>8.1f}")
+    print(f"\n{'Direct imports of app (cumulative)':<52} {'ms':>8}")
+    print('-' * 62)
+    for row in sorted(direct, key=lambda row: row['cumulative_us'], reverse=True)[:args.top]:
+        print(f"{row['module'][:52]:<52} {row['cumulative_us'] / 1000:>8.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'timestamp': datetime.utcnow().isoformat(), 'python': sys.version.split()[0],
+                'total_ms': total_ms, 'runs_ms': totals, 'budget_ms': args.budget_ms,
+                'eager_deferred_modules': eager, 'slowest': slowest,
+            }, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f"import app took {total_ms:.1f} ms, budget is {args.budget_ms:.0f} ms")
+    for module in eager:
+        failures.append(f"{module} is imported at startup; it should load on first use")
+    if failures and not args.report:
+        print('\nFAILED:')
+        for message in failures:
+            print(f"  - {message}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
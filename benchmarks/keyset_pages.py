@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Latency of deep gallery pages with OFFSET pagination and with keyset cursors.
+
+Seeds a throwaway SQLite database with --photos photo rows (metadata only) for one user
+and --anonymous anonymous ones, then times the page query for each of --pages:
+
+  offset ms   paginate(page=N): ORDER BY created_at DESC LIMIT/OFFSET plus COUNT(*), as
+              /api/photos and the admin lists did before keyset.py
+  keyset ms   keyset.paginate() with the cursor that leads to page N
+  +total ms   keyset.paginate(with_total=True), the capped count that /api/photos?total=1
+              and the admin pages add
+
+Medians over --repeat runs, for the user's gallery and the anonymous list.
+
+Usage:
+  python benchmarks/keyset_pages.py
+  python benchmarks/keyset_pages.py --photos 200000 --pages 1,100,5000
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import logging
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+def load_app(workdir):
+    os.chdir(workdir)
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['AI_BACKEND'] = 'stub'
+    logging.basicConfig(level=logging.ERROR)
+    import app as app_module
+    return app_module
+
+
+def seed(photos, anonymous):
+    from models import db, User, EnhancedImage
+    rnd = random.Random(0)
+    now = datetime.utcnow()
+    user = User(username='keyset_bench', email='keyset-bench@example.com')
+    db.session.add(user)
+    db.session.commit()
+    rows = []
+    for k in range(photos + anonymous):
+        rows.append({
+            'user_id': user.id if k < photos else None, 'original_filename': f'IMG_{k}.jpg',
+            'original_path': f'uploads/IMG_{k}.jpg', 'enhanced_filename': f'enhanced_IMG_{k}.jpg',
+            'enhanced_path': f'enhanced/enhanced_IMG_{k}.jpg', 'conversion_type': 'enhancement',
+            # Whole seconds, so plenty of rows share a created_at and the id tie-break matters
+            'created_at': now - timedelta(seconds=rnd.randrange(photos + anonymous)),
+        })
+        if len(rows) >= 20_000:
+            db.session.execute(insert(EnhancedImage), rows)
+            rows = []
+    if rows:
+        db.session.execute(insert(EnhancedImage), rows)
+    db.session.commit()
+    db.session.execute(db.text('ANALYZE'))
+    return user.id
+
+
+def median_ms(fn, repeat):
+    fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def cursor_for(query, model, page, per_page):
+    """The next_cursor a client holds after reading page - 1."""
+    import keyset
+    if page == 1:
+        return None
+    row = (query.order_by(model.created_at.desc(), model.id.desc())
+           .offset((page - 1) * per_page - 1).first())
+    return keyset.encode_cursor(row.created_at, row.id, 'next', page)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Deep page latency: OFFSET vs keyset pagination')
+    parser.add_argument('--photos', type=int, default=100_000, help='Photos in the one gallery')
+    parser.add_argument('--anonymous', type=int, default=100_000, help='Anonymous photos')
+    parser.add_argument('--per-page', type=int, default=20)
+    parser.add_argument('--pages', default='1,10,100,1000,4000')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    pages = [int(p) for p in args.pages.split(',')]
+
+    workdir = tempfile.mkdtemp(prefix='keyset_pages_')
+    try:
+        app_module = load_app(workdir)
+        import keyset
+        from models import EnhancedImage
+        with app_module.app.app_context():
+            user_id = seed(args.photos, args.anonymous)
+            lists = {
+                'gallery': EnhancedImage.query.filter_by(user_id=user_id),
+                'anonymous': EnhancedImage.query.filter(EnhancedImage.user_id.is_(None)),
+            }
+            print(f"Seeded {args.photos} gallery and {args.anonymous} anonymous photos, "
+                  f"{args.per_page} per page\n")
+            print(f"{'list':<10} {'page':>6} {'offset ms':>10} {'keyset ms':>10} {'+total ms':>10}")
+            for name, query in lists.items():
+                for page in pages:
+                    if (page - 1) * args.per_page >= query.count():
+                        continue
+                    cursor = cursor_for(query, EnhancedImage, page, args.per_page)
+                    offset_ms = median_ms(lambda: query.order_by(EnhancedImage.created_at.desc()).paginate(
+                        page=page, per_page=args.per_page, error_out=False), args.repeat)
+                    keyset_ms = median_ms(lambda: keyset.paginate(
+                        query, EnhancedImage, args.per_page, cursor=cursor), args.repeat)
+                    total_ms = median_ms(lambda: keyset.paginate(
+                        query, EnhancedImage, args.per_page, cursor=cursor, with_total=True), args.repeat)
+                    print(f"{name:<10} {page:>6} {offset_ms:>10.2f} {keyset_ms:>10.2f} {total_ms:>10.2f}")
+    finally:
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
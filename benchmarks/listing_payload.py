@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Response size and server time of one /api/photos page, with EnhancedImage.to_dict() on
+full rows and with the slim listing (photo_listing.py).
+
+Seeds a throwaway SQLite database with --photos photos that look like real ones: base64
+payloads of --mp megapixel fixture JPEGs, an enhancement_settings JSON document and an
+ai_analysis text of --analysis-kb KB. Medians over --repeat runs of:
+
+  to_dict         the listing as it was: load the page as ORM instances (every column),
+                  check availability, to_dict() each photo, encode the JSON
+  slim            the listing now: the listing columns as row tuples, photo_listing.to_dicts()
+  slim+fields     the same with fields=enhancement_settings,ai_analysis
+
+Both run the page query, serialization and JSON encoding in an app context, without the
+request overhead around them.
+
+Usage:
+  python benchmarks/listing_payload.py
+  python benchmarks/listing_payload.py --photos 100 --mp 2
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import shutil
+import logging
+import argparse
+import tempfile
+import statistics
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import megapixel_size, photo_bytes  # noqa: E402
+
+EMAIL = 'listing-bench@example.com'
+
+
+def load_app(workdir):
+    os.chdir(workdir)
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['AI_BACKEND'] = 'stub'
+    logging.basicConfig(level=logging.ERROR)
+    import app as app_module
+    return app_module
+
+
+def seed(app_module, client, photos, mp, analysis_kb):
+    from models import db, User, EnhancedImage
+    client.post('/signup', json={'username': 'listing_bench', 'email': EMAIL,
+                                 'password': 'bench-secret', 'confirm_password': 'bench-secret'})
+    width, height = megapixel_size(mp)
+    payloads = [base64.b64encode(photo_bytes(width, height, seed=k)).decode() for k in range(4)]
+    settings = json.dumps({'brightness': 1.08, 'contrast': 1.12, 'saturation': 1.05, 'sharpness': 1.2,
+                           'white_balance': 'auto', 'steps': ['exposure', 'color', 'straighten', 'declutter'],
+                           'notes': 'Brightened the living room and balanced the window light.'})
+    analysis = ('The room is well lit from the left; lift the shadows under the table, '
+                'warm the white balance slightly and straighten the verticals. ' * 40)[:analysis_kb * 1024]
+    with app_module.app.app_context():
+        user_id = User.query.filter_by(email=EMAIL).first().id
+        for k in range(photos):
+            db.session.add(EnhancedImage(
+                user_id=user_id, original_filename=f'IMG_{k:04d}.jpg', enhanced_filename=f'enhanced_IMG_{k:04d}.jpg',
+                original_path=f'uploads/bench_{k}.jpg', enhanced_path=f'enhanced/bench_{k}.jpg',
+                original_file_size=len(payloads[k % 4]) * 3 // 4, enhanced_file_size=len(payloads[(k + 1) % 4]) * 3 // 4,
+                original_image_data=payloads[k % 4], enhanced_image_data=payloads[(k + 1) % 4],
+                enhancement_settings=settings, ai_analysis=analysis,
+            ))
+        db.session.commit()
+        return user_id
+
+
+def to_dict_page(app_module, user_id, per_page):
+    """The listing before photo_listing.py: full rows, to_dict() per photo."""
+    from models import EnhancedImage
+    rows = (EnhancedImage.query.filter_by(user_id=user_id)
+            .order_by(EnhancedImage.created_at.desc(), EnhancedImage.id.desc()).limit(per_page + 1).all())
+    photos = [photo.to_dict() for photo in rows[:per_page]
+              if os.path.exists(photo.enhanced_path) or photo.archived_at is not None
+              or photo.enhanced_image_data is not None]
+    return json.dumps({'success': True, 'photos': photos}).encode()
+
+
+def slim_page(app_module, user_id, per_page, extra=()):
+    """The listing in get_user_photos: listing columns, availability check, to_dicts()."""
+    import photo_listing
+    from models import EnhancedImage
+    rows = (EnhancedImage.query.filter_by(user_id=user_id).with_entities(*photo_listing.columns(extra))
+            .order_by(EnhancedImage.created_at.desc(), EnhancedImage.id.desc()).limit(per_page + 1).all())
+    rows = [row for row in rows[:per_page]
+            if row.has_payload or row.archived_at is not None or os.path.exists(row.enhanced_path)]
+    return json.dumps({'success': True, 'photos': photo_listing.to_dicts(rows, extra)}).encode()
+
+
+def median(fn, repeat):
+    timings, size = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = len(fn())
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='/api/photos page size and time: to_dict vs slim listing')
+    parser.add_argument('--photos', type=int, default=100, help='Photos on the page')
+    parser.add_argument('--mp', type=float, default=1, help='Megapixels of the stored payloads')
+    parser.add_argument('--analysis-kb', type=int, default=3, help='Size of each ai_analysis text')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='listing_payload_')
+    try:
+        app_module = load_app(workdir)
+        client = app_module.app.test_client()
+        user_id = seed(app_module, client, args.photos, args.mp, args.analysis_kb)
+        response = client.get(f'/api/photos?per_page={args.photos}')
+        assert len(response.get_json()['photos']) == args.photos
+
+        def run(page_fn, *extra):
+            def fn():
+                with app_module.app.app_context():
+                    return page_fn(app_module, user_id, args.photos, *extra)
+            return fn
+
+        print(f"{args.photos} photos, {args.mp} MP payloads, {args.analysis_kb} KB ai_analysis\n")
+        print(f"{'listing':<14} {'ms':>8} {'KB':>8}")
+        for name, fn in (('to_dict', run(to_dict_page)), ('slim', run(slim_page)),
+                         ('slim+fields', run(slim_page, ('enhancement_settings', 'ai_analysis')))):
+            ms, size = median(fn, args.repeat)
+            print(f"{name:<14} {ms:>8.2f} {size / 1024:>8.1f}")
+    finally:
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
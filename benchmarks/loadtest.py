@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test for the enhance / dashboard / preview / checkout / download flows.
+
+Starts the local AI stand-in (ai_stub_server.py) and the app under gunicorn, configured
+like the Procfile (sync workers). Then it drives simulated listings concurrently.
+Each listing:
+  signup -> batch upload to /api/enhance -> page through /api/photos
+         -> /preview every photo -> checkout -> /download every photo
+
+Checkout uses the free-access branch, because Stripe cannot run offline. It still
+exercises the payment-record write path. Results go to a JSON file so runs can be
+compared.
+
+Usage:
+  python benchmarks/loadtest.py --listings 20 --concurrency 8 --photos 6 --workers 2
+  python benchmarks/loadtest.py --database-url postgresql://localhost/enhancer_load
+  python benchmarks/loadtest.py --base-url http://127.0.0.1:5000   # app already running
+  python benchmarks/loadtest.py --asgi --workers 1 --concurrency 64  # asgi.py under uvicorn workers
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import signal
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ai_stub_server import start_stub_server, StubConfig
+from fixtures import photo_bytes
+
+ADMIN_SECRET = 'loadtest-admin-secret'
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    """Thread-safe collector of request timings plus a running in-flight counter."""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._in_flight_area = 0.0
+        self._last_change = time.perf_counter()
+        self.max_in_flight = 0
+
+    def _account(self, delta):
+        now = time.perf_counter()
+        self._in_flight_area += self._in_flight * (now - self._last_change)
+        self._last_change = now
+        self._in_flight += delta
+        self.max_in_flight = max(self.max_in_flight, self._in_flight)
+
+    def request(self, session, label, method, url, **kwargs):
+        with self._lock:
+            self._account(1)
+        start = time.perf_counter()
+        response = None
+        error = None
+        try:
+            response = session.request(method, url, timeout=300, **kwargs)
+        except requests.RequestException as e:
+            error = type(e).__name__
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._account(-1)
+            self.samples.setdefault(label, []).append(elapsed)
+            if error or response.status_code >= 400:
+                key = error or str(response.status_code)
+                per_label = self.errors.setdefault(label, {})
+                per_label[key] = per_label.get(key, 0) + 1
+        return response
+
+    def mean_in_flight(self, wall_time):
+        with self._lock:
+            self._account(0)
+            return self._in_flight_area / wall_time if wall_time > 0 else 0.0
+
+
+def run_listing(base_url, recorder, listing_index, photos, per_page, images):
+    """Drive one listing owner through the full flow."""
+    session = requests.Session()
+    username = f"load_{uuid.uuid4().hex[:10]}"
+    response = recorder.request(session, 'signup', 'POST', f"{base_url}/signup", json={
+        'username': username,
+        'email': f"{username}@loadtest.local",
+        'password': 'loadtest-pass',
+        'confirm_password': 'loadtest-pass'
+    })
+    if response is None or response.status_code != 200:
+        return
+
+    # Setup step: free access stands in for Stripe at checkout
+    recorder.request(session, 'setup_free_access', 'POST', f"{base_url}/api/admin/set-free-access",
+                     json={'username': username, 'has_free_access': True},
+                     headers={'X-Admin-Secret': ADMIN_SECRET})
+
+    photo_ids = []
+    for i in range(photos):
+        image = images[(listing_index + i) % len(images)]
+        response = recorder.request(session, 'enhance', 'POST', f"{base_url}/api/enhance",
+                                    files={'image': (f"listing{listing_index}_photo{i}.jpg", image, 'image/jpeg')},
+                                    data={'change_intensity': 'moderate', 'detail_level': 'moderate'})
+        if response is not None and response.status_code == 200:
+            photo_ids.append(response.json().get('image_id'))
+
+    url = f"{base_url}/api/photos?per_page={per_page}"
+    while True:
+        response = recorder.request(session, 'photos_page', 'GET', url)
+        if response is None or response.status_code != 200:
+            break
+        next_cursor = response.json().get('pagination', {}).get('next_cursor')
+        if not next_cursor:
+            break
+        url = f"{base_url}/api/photos?per_page={per_page}&cursor={next_cursor}"
+
+    for photo_id in photo_ids:
+        recorder.request(session, 'preview', 'GET', f"{base_url}/api/photos/{photo_id}/preview")
+
+    if photo_ids:
+        recorder.request(session, 'checkout', 'POST', f"{base_url}/api/payment/create-checkout-session",
+                         json={'photo_ids': photo_ids})
+        for photo_id in photo_ids:
+            recorder.request(session, 'download', 'GET', f"{base_url}/api/photos/{photo_id}/download")
+
+
+def worker_pids(master_pid):
+    """PIDs of the gunicorn workers (children of the master)."""
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            if int(fields[1]) == master_pid:
+                pids.append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    return pids
+
+
+def wait_for_workers(master_pid, workers, timeout=30):
+    """Worker PIDs once all `workers` have forked, or whatever is there at the deadline.
+
+    The app answers as soon as the first worker is up; the master forks the rest with a
+    short random pause between them.
+    """
+    deadline = time.time() + timeout
+    pids = worker_pids(master_pid)
+    while len(pids) < workers and time.time() < deadline:
+        time.sleep(0.1)
+        pids = worker_pids(master_pid)
+    return pids
+
+
+def cpu_seconds(pid):
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def wait_for_app(base_url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{base_url}/api/check-auth", timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    return False
+
+
+def start_app(args, stub_url, workdir):
+    port = args.port
+    env = dict(os.environ)
+    env.update({
+        'AI_BACKEND': 'stub',
+        'AI_STUB_URL': stub_url,
+        'DATABASE_URL': args.database_url or f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+        'ADMIN_SECRET_KEY': ADMIN_SECRET,
+        # Checkout refuses to run without a key; free-access users never reach the Stripe API
+        'STRIPE_SECRET_KEY': 'sk_test_loadtest',
+        'SECRET_KEY': 'loadtest-secret',
+        'FLASK_DEBUG': 'False',
+        'PROMETHEUS_MULTIPROC_DIR': os.path.join(workdir, 'prometheus'),
+        # No release step here; let the workers create and migrate the schema
+        'AUTO_MIGRATE': 'True',
+    })
+    command = [
+        sys.executable, '-m', 'gunicorn', 'asgi:application' if args.asgi else 'app:app',
+        '--bind', f'127.0.0.1:{port}',
+        '--workers', str(args.workers),
+        '--worker-class', 'uvicorn.workers.UvicornWorker' if args.asgi else args.worker_class,
+        '--timeout', '120',
+        '--config', os.path.join(REPO_ROOT, 'gunicorn.conf.py'),
+        '--chdir', workdir,
+        '--pythonpath', REPO_ROOT,
+        '--log-level', 'warning',
+    ]
+    log = open(os.path.join(workdir, 'app.log'), 'w')
+    process = subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return process, f"http://127.0.0.1:{port}"
+
+
+def summarize(recorder, wall_time, workers, worker_cpu, worker_changes=None):
+    endpoints = {}
+    total_requests = 0
+    for label, values in sorted(recorder.samples.items()):
+        ordered = sorted(values)
+        total_requests += len(ordered)
+        endpoints[label] = {
+            'count': len(ordered),
+            'throughput_rps': round(len(ordered) / wall_time, 3) if wall_time else None,
+            'p50_ms': round(percentile(ordered, 50) * 1000, 1),
+            'p95_ms': round(percentile(ordered, 95) * 1000, 1),
+            'p99_ms': round(percentile(ordered, 99) * 1000, 1),
+            'max_ms': round(ordered[-1] * 1000, 1),
+            'errors': recorder.errors.get(label, {}),
+        }
+
+    mean_in_flight = recorder.mean_in_flight(wall_time)
+    return {
+        'wall_time_s': round(wall_time, 2),
+        'total_requests': total_requests,
+        'throughput_rps': round(total_requests / wall_time, 3) if wall_time else None,
+        'endpoints': endpoints,
+        'saturation': {
+            'workers': workers,
+            'mean_in_flight': round(mean_in_flight, 2),
+            'max_in_flight': recorder.max_in_flight,
+            # >1.0 means requests were queueing behind busy sync workers
+            'in_flight_per_worker': round(mean_in_flight / workers, 2) if workers else None,
+            'worker_cpu_utilization': worker_cpu,
+            # Workers not measured over the whole run: not forked in time, exited, or forked to replace one
+            'worker_changes': worker_changes or {},
+        },
+    }
+
+
+def print_summary(summary):
+    print(f"\n{'='*88}")
+    print(f"Wall time: {summary['wall_time_s']}s  Requests: {summary['total_requests']}  "
+          f"Throughput: {summary['throughput_rps']} req/s")
+    print(f"{'='*88}")
+    print(f"{'Endpoint':<20} {'Count':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'Errors':>8}")
+    print('-' * 88)
+    for label, stats in summary['endpoints'].items():
+        errors = sum(stats['errors'].values())
+        print(f"{label:<20} {stats['count']:>6} {stats['throughput_rps']:>8} {stats['p50_ms']:>9} "
+              f"{stats['p95_ms']:>9} {stats['p99_ms']:>9} {errors:>8}")
+    saturation = summary['saturation']
+    print('-' * 88)
+    print(f"Workers: {saturation['workers']}  mean in-flight: {saturation['mean_in_flight']}  "
+          f"max in-flight: {saturation['max_in_flight']}  in-flight/worker: {saturation['in_flight_per_worker']}")
+    if saturation['worker_cpu_utilization']:
+        print(f"Worker CPU utilization: {saturation['worker_cpu_utilization']}")
+    changes = saturation['worker_changes']
+    if changes.get('missing_at_start'):
+        print(f"WARNING: only {changes['workers_at_start']} of {saturation['workers']} workers were running "
+              f"when the run started; the others are not counted")
+    if changes.get('exited') or changes.get('started'):
+        print(f"WARNING: workers exited during the run: {changes.get('exited', [])}, "
+              f"started during the run (CPU not counted): {changes.get('started', [])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end load test against a local app')
+    parser.add_argument('--listings', type=int, default=10, help='Number of simulated listing owners')
+    parser.add_argument('--concurrency', type=int, default=4, help='Listings driven at the same time')
+    parser.add_argument('--photos', type=int, default=6, help='Photos uploaded per listing')
+    parser.add_argument('--per-page', type=int, default=20, help='Dashboard page size')
+    parser.add_argument('--image-size', default='2000x1500', help='Fixture photo size WIDTHxHEIGHT')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers (Procfile uses 2)')
+    parser.add_argument('--worker-class', default='sync', help='gunicorn worker class')
+    parser.add_argument('--asgi', action='store_true',
+                        help='Serve asgi:application with uvicorn workers (overrides --worker-class)')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--database-url', default=None, help='Defaults to a fresh SQLite file')
+    parser.add_argument('--base-url', default=None, help='Target an already running app instead of starting one '
+                        '(it must run with AI_BACKEND=stub and ADMIN_SECRET_KEY=%s)' % ADMIN_SECRET)
+    parser.add_argument('--ai-latency-median', type=float, default=2.0, help='Stub AI median latency (s)')
+    parser.add_argument('--ai-latency-sigma', type=float, default=0.4)
+    parser.add_argument('--ai-error-rate', type=float, default=0.0)
+    parser.add_argument('--ai-rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--keep-workdir', action='store_true', help='Keep the temp dir with app.log and the DB')
+    parser.add_argument('--output', default=None, help='JSON results path (default: loadtest_results/<timestamp>.json)')
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.image_size.lower().split('x'))
+    images = [photo_bytes(width, height, 'JPEG', seed=args.seed + i) for i in range(4)]
+
+    stub = start_stub_server(config=StubConfig(
+        latency_median=args.ai_latency_median,
+        latency_sigma=args.ai_latency_sigma,
+        error_rate=args.ai_error_rate,
+        rate_limit_rate=args.ai_rate_limit_rate,
+        seed=args.seed,
+    ))
+    stub_url = f"http://127.0.0.1:{stub.server_address[1]}"
+
+    workdir = tempfile.mkdtemp(prefix='loadtest_')
+    process = None
+    try:
+        if args.base_url:
+            base_url = args.base_url.rstrip('/')
+        else:
+            process, base_url = start_app(args, stub_url, workdir)
+            if not wait_for_app(base_url):
+                print(f"App did not start; see {os.path.join(workdir, 'app.log')}")
+                return 1
+
+        pids = wait_for_workers(process.pid, args.workers) if process else []
+        cpu_before = {pid: cpu_seconds(pid) for pid in pids}
+
+        recorder = Recorder()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            futures = [pool.submit(run_listing, base_url, recorder, i, args.photos, args.per_page, images)
+                       for i in range(args.listings)]
+            for future in futures:
+                future.result()
+        wall_time = time.perf_counter() - start
+
+        worker_cpu = {}
+        pids_after = set(worker_pids(process.pid)) if process else set()
+        for pid in pids:
+            after = cpu_seconds(pid) if pid in pids_after else None
+            if after is not None and cpu_before.get(pid) is not None:
+                worker_cpu[str(pid)] = round((after - cpu_before[pid]) / wall_time, 3)
+            else:
+                # Exited (crashed, timed out or recycled) before the end; its CPU is lost
+                worker_cpu[str(pid)] = None
+        worker_changes = {}
+        if process:
+            if len(pids) < args.workers:
+                worker_changes['workers_at_start'] = len(pids)
+                worker_changes['missing_at_start'] = args.workers - len(pids)
+            exited = sorted(set(pids) - pids_after)
+            started = sorted(pids_after - set(pids))
+            if exited:
+                worker_changes['exited'] = exited
+            if started:
+                worker_changes['started'] = started
+
+        summary = summarize(recorder, wall_time, args.workers if process else None, worker_cpu, worker_changes)
+        summary['config'] = {k: v for k, v in vars(args).items() if k != 'database_url'}
+        summary['config']['database'] = 'custom' if args.database_url else 'sqlite'
+        summary['timestamp'] = datetime.utcnow().isoformat()
+        print_summary(summary)
+
+        output = args.output or os.path.join(
+            'loadtest_results', f"loadtest_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json")
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"\nResults written to {output}")
+        return 0
+    finally:
+        if process:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        stub.shutdown()
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+        else:
+            print(f"Work directory kept at {workdir}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
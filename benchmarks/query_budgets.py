@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Per-endpoint SQL query budgets.
+
+Seeds a throwaway SQLite database with users, photos and payments, then requests each
+endpoint through the Flask test client inside query_stats.query_budget(). An endpoint
+that issues more statements than its budget fails the run. Budgets are set to today's
+counts, so a new per-row query (N+1) shows up as a failure instead of a slow page in
+production.
+
+Usage:
+  python benchmarks/query_budgets.py            # check budgets
+  python benchmarks/query_budgets.py --report   # print actual counts without failing
+Exits with status 1 when any endpoint is over budget.
+"""
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import logging
+import argparse
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+ADMIN_EMAIL = 'budget-admin@example.com'
+USERS = 20
+PHOTOS_PER_USER = 25
+ANONYMOUS_PHOTOS = 10
+
+# (name, method, path, json body, login as, budget). Paths are formatted with the seeded ids.
+BUDGETS = [
+    ('livez', 'GET', '/livez', None, None, 0),
+    ('readyz', 'GET', '/readyz', None, None, 1),
+    ('health', 'GET', '/api/health', None, None, 3),
+    ('user_stats', 'GET', '/api/user/stats', None, 'owner', 1),
+    ('photos_page', 'GET', '/api/photos?per_page=10&cursor={page2_cursor}', None, 'owner', 2),
+    ('photo_detail', 'GET', '/api/photos/{photo_id}', None, 'owner', 2),
+    ('photo_original', 'GET', '/api/photos/{photo_id}/original', None, 'owner', 2),
+    ('photo_preview', 'GET', '/api/photos/{photo_id}/preview', None, 'owner', 2),
+    ('photo_rendition', 'GET', '/api/photos/{photo_id}/rendition?w=160', None, 'owner', 3),
+    ('photos_zip', 'GET', '/api/photos/download-zip', None, 'owner', 3),
+    ('payment_status', 'POST', '/api/payment/check-status', {'photo_ids': '{photo_ids}'}, 'owner', 2),
+    ('admin_dashboard', 'GET', '/admin', None, 'admin', 12),
+    ('admin_user_photos', 'GET', '/admin/user/{owner_id}', None, 'admin', 4),
+    ('admin_anonymous_photos', 'GET', '/admin/anonymous-photos', None, 'admin', 3),
+]
+
+
+def load_app(workdir):
+    os.chdir(workdir)
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'budget.db')}"
+    os.environ['AI_BACKEND'] = 'stub'
+    os.environ['ADMIN_EMAILS'] = ADMIN_EMAIL
+    logging.basicConfig(level=logging.ERROR)
+    import app as app_module
+    return app_module
+
+
+def seed(app_module):
+    """Create users, photos and payments. Returns the id of the first seeded user."""
+    from PIL import Image
+    from models import db, User, EnhancedImage, Payment
+    # Every row points at the same small files so file-serving endpoints return 200
+    for path in ('uploads/seed.jpg', 'enhanced/seed.jpg'):
+        Image.new('RGB', (320, 240), (90, 120, 160)).save(path, 'JPEG')
+    # Recorded at upload time, like the enhance endpoints do
+    with open('uploads/seed.jpg', 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    with app_module.app.app_context():
+        users = [User(username=f'host{i}', email=f'host{i}@example.com') for i in range(USERS)]
+        db.session.add_all(users)
+        db.session.flush()
+        photos = []
+        for user in users:
+            for j in range(PHOTOS_PER_USER):
+                photos.append(EnhancedImage(
+                    user_id=user.id, original_filename=f'IMG_{j:04d}.jpg',
+                    original_path='uploads/seed.jpg', original_file_size=2_400_000,
+                    enhanced_filename=f'enhanced_IMG_{j:04d}.jpg',
+                    enhanced_path='enhanced/seed.jpg', enhanced_file_size=2_900_000,
+                    original_sha256=digest, enhanced_sha256=digest,
+                ))
+        for j in range(ANONYMOUS_PHOTOS):
+            photos.append(EnhancedImage(
+                original_filename=f'anon_{j}.jpg', original_path='uploads/seed.jpg',
+                enhanced_filename=f'enhanced_anon_{j}.jpg', enhanced_path='enhanced/seed.jpg',
+                original_sha256=digest, enhanced_sha256=digest,
+            ))
+        db.session.add_all(photos)
+        db.session.flush()
+        # A few completed payments per user, each covering a handful of photos
+        for user in users:
+            user_photo_ids = [p.id for p in photos if p.user_id == user.id]
+            for k in range(0, 15, 5):
+                db.session.add(Payment(
+                    user_id=user.id, stripe_session_id=f'cs_test_{user.id}_{k}', amount=500,
+                    photo_count=5, photo_ids=json.dumps(user_photo_ids[k:k + 5]), status='completed',
+                ))
+        db.session.commit()
+        return users[0].id
+
+
+def login(client, app_module, email):
+    """Sign up (or reuse) a password account and log the test client in as it."""
+    client.get('/logout')
+    username = email.split('@')[0].replace('-', '_')
+    response = client.post('/signup', json={
+        'username': username, 'email': email,
+        'password': 'budget-secret', 'confirm_password': 'budget-secret',
+    })
+    if response.status_code != 200:
+        response = client.post('/login', json={'username': username, 'password': 'budget-secret'})
+    assert response.status_code == 200, response.get_data(as_text=True)[:200]
+    from models import User
+    with app_module.app.app_context():
+        return User.query.filter_by(email=email).first().id
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check per-endpoint SQL query budgets')
+    parser.add_argument('--report', action='store_true', help='Print counts without enforcing budgets')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='query_budgets_')
+    cwd = os.getcwd()
+    failures = []
+    try:
+        app_module = load_app(workdir)
+        import keyset
+        from query_stats import query_budget, QueryBudgetExceeded
+        from models import db, EnhancedImage, Payment
+
+        first_user_id = seed(app_module)
+        client = app_module.app.test_client()
+
+        # Hand the first seeded user's photos and payments to an account we can log in as;
+        # they are the ones the per-user endpoints page through
+        owner_id = login(client, app_module, 'budget-owner@example.com')
+        with app_module.app.app_context():
+            for photo in EnhancedImage.query.filter_by(user_id=first_user_id).all():
+                photo.user_id = owner_id
+            for payment in Payment.query.filter_by(user_id=first_user_id).all():
+                payment.user_id = owner_id
+            db.session.commit()
+            photo_ids = [p.id for p in EnhancedImage.query.filter_by(user_id=owner_id).all()]
+            page2_cursor = keyset.paginate(EnhancedImage.query.filter_by(user_id=owner_id), EnhancedImage, 10).next_cursor
+        admin_id = login(client, app_module, ADMIN_EMAIL)
+        current = 'admin'
+
+        ids = {'photo_id': photo_ids[0], 'owner_id': owner_id, 'admin_id': admin_id, 'page2_cursor': page2_cursor}
+        print(f"{'Endpoint':<26} {'queries':>8} {'budget':>8}")
+        print('-' * 44)
+        for name, method, path, body, role, budget in BUDGETS:
+            if role and role != current:
+                login(client, app_module, ADMIN_EMAIL if role == 'admin' else 'budget-owner@example.com')
+                current = role
+            if body is not None:
+                body = json.loads(json.dumps(body).replace('"{photo_ids}"', json.dumps(photo_ids[:10])))
+            try:
+                with query_budget(10_000 if args.report else budget) as used:
+                    response = client.open(path.format(**ids), method=method, json=body)
+                status = 'ok'
+            except QueryBudgetExceeded as e:
+                status = 'OVER'
+                failures.append(f"{name}: {e}")
+            if response.status_code >= 400:
+                status = f'HTTP {response.status_code}'
+                failures.append(f"{name}: HTTP {response.status_code}")
+            print(f"{name:<26} {used['count']:>8} {budget:>8}  {status}")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if failures and not args.report:
+        print('\nFAILED:')
+        for message in failures:
+            print(f"  - {message}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
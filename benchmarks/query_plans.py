@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Query plans and latency for the hot EnhancedImage / Payment lookups, before and after
+the indexes added by migrations 3 and 7 (HOT_QUERY_INDEXES, KEYSET_INDEXES).
+
+Seeds a database (a throwaway SQLite file by default, or --database-url), drops the
+hot-query indexes, and records the plan and median latency of each query. It then
+recreates the indexes the way the migration does and measures again.
+
+Queries:
+  gallery         WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT 21  (/api/photos)
+  anonymous_link  WHERE user_id IS NULL AND created_at >= ?            (login / checkout linking)
+  payment_lookup  WHERE user_id = ? AND status = 'completed' ORDER BY completed_at DESC LIMIT 1
+  webhook         WHERE stripe_session_id = ?                          (unique index; control)
+
+Usage:
+  python benchmarks/query_plans.py
+  python benchmarks/query_plans.py --database-url postgresql://localhost/plans --users 2000
+Postgres plans use EXPLAIN (ANALYZE, BUFFERS). Point it at a scratch database: the
+script drops and recreates the app tables.
+"""
+
+import os
+import sys
+import json
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+import time
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from sqlalchemy import create_engine, select, text
+
+import migrations
+from models import db, EnhancedImage, Payment, User
+
+
+def seed(engine, users, photos_per_user, anonymous, seed_value=0):
+    rnd = random.Random(seed_value)
+    now = datetime.utcnow()
+    db.metadata.drop_all(engine)
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {'id': i, 'username': f'host{i}', 'email': f'host{i}@example.com',
+             'created_at': now, 'images_processed': 0, 'has_free_access': False, 'is_admin': False}
+            for i in range(1, users + 1)
+        ])
+        rows = []
+        photo_id = 0
+        for user_id in range(1, users + 1):
+            for _ in range(photos_per_user):
+                photo_id += 1
+                rows.append(_photo_row(photo_id, user_id, now - timedelta(minutes=rnd.randrange(525_600))))
+            if len(rows) >= 20_000:
+                conn.execute(EnhancedImage.__table__.insert(), rows)
+                rows = []
+        for _ in range(anonymous):
+            photo_id += 1
+            rows.append(_photo_row(photo_id, None, now - timedelta(minutes=rnd.randrange(525_600))))
+        if rows:
+            conn.execute(EnhancedImage.__table__.insert(), rows)
+
+        payments = []
+        for user_id in range(1, users + 1):
+            for k in range(rnd.randrange(1, 6)):
+                status = rnd.choice(('completed', 'completed', 'pending', 'failed'))
+                payments.append({
+                    'user_id': user_id, 'stripe_session_id': f'cs_test_{user_id}_{k}', 'amount': 500,
+                    'currency': 'usd', 'photo_count': 5, 'photo_ids': '[]', 'status': status,
+                    'created_at': now, 'completed_at': now - timedelta(days=rnd.randrange(365)) if status == 'completed' else None,
+                })
+        conn.execute(Payment.__table__.insert(), payments)
+    return photo_id
+
+
+def _photo_row(photo_id, user_id, created_at):
+    return {
+        'id': photo_id, 'user_id': user_id, 'original_filename': f'IMG_{photo_id}.jpg',
+        'original_path': f'uploads/IMG_{photo_id}.jpg', 'original_file_size': 2_400_000,
+        'enhanced_filename': f'enhanced_IMG_{photo_id}.jpg', 'enhanced_path': f'enhanced/enhanced_IMG_{photo_id}.jpg',
+        'enhanced_file_size': 2_900_000, 'conversion_type': 'enhancement', 'change_intensity': 'moderate',
+        'detail_level': 'moderate', 'created_at': created_at,
+    }
+
+
+def build_queries(users):
+    images = EnhancedImage.__table__
+    payments = Payment.__table__
+    user_id = users // 2 or 1
+    return {
+        'gallery': select(images).where(images.c.user_id == user_id)
+        .order_by(images.c.created_at.desc(), images.c.id.desc()).limit(21),
+        'anonymous_link': select(images).where(
+            images.c.user_id.is_(None), images.c.created_at >= datetime.utcnow() - timedelta(hours=1)),
+        'payment_lookup': select(payments).where(
+            payments.c.user_id == user_id, payments.c.status == 'completed')
+        .order_by(payments.c.completed_at.desc()).limit(1),
+        'webhook': select(payments).where(payments.c.stripe_session_id == f'cs_test_{user_id}_0'),
+    }
+
+
+def _driver_sql(conn, statement):
+    compiled = statement.compile(dialect=conn.dialect)
+    params = compiled.construct_params()
+    if conn.dialect.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    return str(compiled), params
+
+
+def explain(conn, statement):
+    sql, params = _driver_sql(conn, statement)
+    if conn.dialect.name == 'postgresql':
+        rows = conn.exec_driver_sql(f'EXPLAIN (ANALYZE, BUFFERS) {sql}', params).fetchall()
+        return [row[0] for row in rows]
+    rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def time_query(conn, statement, repeat):
+    sql, params = _driver_sql(conn, statement)
+    conn.exec_driver_sql(sql, params).fetchall()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.exec_driver_sql(sql, params).fetchall()
+        timings.append(time.perf_counter() - start)
+    return round(statistics.median(timings) * 1000, 3)
+
+
+def analyze(conn):
+    conn.exec_driver_sql('ANALYZE')
+
+
+def measure(engine, queries, repeat):
+    results = {}
+    with engine.connect() as conn:
+        analyze(conn)
+        for name, statement in queries.items():
+            results[name] = {'plan': explain(conn, statement), 'median_ms': time_query(conn, statement, repeat)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query plans before/after the hot-query indexes')
+    parser.add_argument('--database-url', default=None, help='Scratch database (defaults to a temp SQLite file)')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--photos-per-user', type=int, default=40)
+    parser.add_argument('--anonymous', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--output', default=None, help='Write results JSON here')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='query_plans_')
+    try:
+        url = args.database_url or f"sqlite:///{os.path.join(workdir, 'plans.db')}"
+        engine = create_engine(url)
+        total = seed(engine, args.users, args.photos_per_user, args.anonymous)
+        print(f"Seeded {total} photos for {args.users} users ({engine.dialect.name})\n")
+        queries = build_queries(args.users)
+
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            for name, _, _, _ in migrations.HOT_QUERY_INDEXES + migrations.KEYSET_INDEXES:
+                conn.execute(text(f'DROP INDEX IF EXISTS {name}'))
+        before = measure(engine, queries, args.repeat)
+
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            for name, table, columns, where in migrations.HOT_QUERY_INDEXES:
+                migrations.create_index(conn, name, table, columns, where)
+            migrations._keyset_indexes(conn)
+        after = measure(engine, queries, args.repeat)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for name in queries:
+        b, a = before[name], after[name]
+        speedup = b['median_ms'] / a['median_ms'] if a['median_ms'] else float('inf')
+        print(f"== {name}: {b['median_ms']} ms -> {a['median_ms']} ms ({speedup:.1f}x)")
+        print("   before: " + "\n           ".join(b['plan']))
+        print("   after:  " + "\n           ".join(a['plan']))
+        print()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'timestamp': datetime.utcnow().isoformat(), 'dialect': engine.dialect.name,
+                       'before': before, 'after': after}, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
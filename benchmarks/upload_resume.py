@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Large uploads over a connection that drops: one multipart POST vs resumable chunks.
+
+Serves the app on a local threaded server and sends a --mb MB file over a simulated link
+of --mbps megabits per second. The link drops the connection after an exponentially
+distributed number of bytes, --mb-between-drops on average. Both modes see the same drop
+positions (same --seed).
+
+  single    One multipart POST, like /api/enhance. After a drop the whole file is sent
+            again, up to --max-attempts times. It goes to a route that only parses the
+            form, so no AI call is made.
+  chunked   POST /api/uploads, then PUT chunks of UPLOAD_CHUNK_MB. After a drop, the
+            client asks for the offset (GET) and resumes from there.
+
+Reported per mode: whether the file arrived, bytes sent, requests, wall time, and the
+longest request. The longest request is how long a sync worker is held at once.
+
+Usage:
+  python benchmarks/upload_resume.py
+  python benchmarks/upload_resume.py --mb 40 --mbps 40 --mb-between-drops 15
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import shutil
+import socket
+import hashlib
+import logging
+import argparse
+import tempfile
+import threading
+import http.client
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+_BLOCK = 64 * 1024
+
+
+def load_app(workdir):
+    """Import the app against a throwaway SQLite DB with the stub AI backend."""
+    os.chdir(workdir)
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['AI_BACKEND'] = 'stub'
+    os.environ['CHUNKED_UPLOAD_DIR'] = os.path.join(workdir, 'partial_uploads')
+    logging.basicConfig(level=logging.ERROR)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    import app as app_module
+
+    def parse_only():
+        # The transfer half of /api/enhance: werkzeug parses the multipart body
+        upload = app_module.request.files['image']
+        return {'bytes': len(upload.read())}
+
+    app_module.app.add_url_rule('/bench/multipart', 'bench_multipart', parse_only, methods=['POST'])
+    return app_module
+
+
+class FlakyLink:
+    """Throttled sender that drops the connection at random byte positions."""
+
+    def __init__(self, mbps, mb_between_drops, seed):
+        self.bytes_per_second = mbps * 1_000_000 / 8
+        self.mean_bytes = mb_between_drops * 1024 * 1024
+        self.rng = random.Random(seed)
+        self.until_drop = self._next_drop()
+        self.bytes_sent = 0
+
+    def _next_drop(self):
+        return int(self.rng.expovariate(1 / self.mean_bytes)) if self.mean_bytes > 0 else float('inf')
+
+    def request(self, port, method, path, headers, body):
+        """Send one request. Returns (status, body bytes), or None if the link dropped."""
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        try:
+            conn.putrequest(method, path)
+            for name, value in {**headers, 'Content-Length': str(len(body))}.items():
+                conn.putheader(name, value)
+            conn.endheaders()
+            for start in range(0, len(body), _BLOCK):
+                block = body[start:start + _BLOCK]
+                if len(block) >= self.until_drop:
+                    conn.send(block[:self.until_drop])
+                    self.bytes_sent += self.until_drop
+                    self.until_drop = self._next_drop()
+                    conn.sock.shutdown(socket.SHUT_RDWR)
+                    return None
+                conn.send(block)
+                self.bytes_sent += len(block)
+                self.until_drop -= len(block)
+                time.sleep(len(block) / self.bytes_per_second)
+            response = conn.getresponse()
+            return response.status, response.read()
+        finally:
+            conn.close()
+
+
+def multipart_body(filename, data):
+    boundary = uuid.uuid4().hex
+    head = (f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="{filename}"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n').encode()
+    return boundary, head + data + f'\r\n--{boundary}--\r\n'.encode()
+
+
+def run_single(port, data, link, max_attempts):
+    boundary, body = multipart_body('large.jpg', data)
+    requests, longest, arrived = 0, 0.0, False
+    started = time.perf_counter()
+    for _ in range(max_attempts):
+        requests += 1
+        request_start = time.perf_counter()
+        result = link.request(port, 'POST', '/bench/multipart',
+                              {'Content-Type': f'multipart/form-data; boundary={boundary}'}, body)
+        longest = max(longest, time.perf_counter() - request_start)
+        if result and result[0] == 200 and json.loads(result[1])['bytes'] == len(data):
+            arrived = True
+            break
+    return {'mode': 'single', 'arrived': arrived, 'bytes_sent': link.bytes_sent, 'requests': requests,
+            'wall_s': round(time.perf_counter() - started, 2), 'longest_request_s': round(longest, 2)}
+
+
+def run_chunked(port, data, link, max_attempts):
+    plain = FlakyLink(1e6, 0, 0)  # Control requests are tiny; only chunk bodies are dropped
+    started = time.perf_counter()
+    status, body = plain.request(port, 'POST', '/api/uploads', {'Content-Type': 'application/json'},
+                                 json.dumps({'filename': 'large.jpg', 'size': len(data),
+                                             'sha256': hashlib.sha256(data).hexdigest()}).encode())
+    assert status == 201, body
+    upload = json.loads(body)
+    upload_id, chunk_size = upload['upload_id'], upload['chunk_size']
+
+    offset, requests, drops, longest = 0, 1, 0, 0.0
+    while offset < len(data) and drops < max_attempts * 50:
+        chunk = data[offset:offset + chunk_size]
+        requests += 1
+        request_start = time.perf_counter()
+        result = link.request(port, 'PUT', f'/api/uploads/{upload_id}', {
+            'Upload-Offset': str(offset), 'Content-Type': 'application/octet-stream',
+            'Upload-Checksum': 'sha256 ' + hashlib.sha256(chunk).hexdigest(),
+        }, chunk)
+        longest = max(longest, time.perf_counter() - request_start)
+        if result is None:
+            drops += 1
+            requests += 1
+            _, body = plain.request(port, 'GET', f'/api/uploads/{upload_id}', {}, b'')
+            offset = json.loads(body)['offset']
+            continue
+        offset = json.loads(result[1])['offset']
+
+    import chunked_uploads
+    stored = chunked_uploads.load(upload_id)
+    try:
+        stored.verify()
+        arrived = True
+    except chunked_uploads.UploadError:
+        arrived = False
+    stored.discard()
+    return {'mode': 'chunked', 'arrived': arrived, 'bytes_sent': link.bytes_sent, 'requests': requests,
+            'wall_s': round(time.perf_counter() - started, 2), 'longest_request_s': round(longest, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resumable chunked uploads vs one multipart POST on a flaky link')
+    parser.add_argument('--mb', type=float, default=24, help='File size in MB')
+    parser.add_argument('--mbps', type=float, default=80, help='Link speed in megabits per second')
+    parser.add_argument('--mb-between-drops', type=float, default=20, help='Mean MB sent between drops')
+    parser.add_argument('--max-attempts', type=int, default=10, help='Whole-file attempts for the single POST')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', default=None, help='Write results JSON here')
+    args = parser.parse_args()
+
+    data = random.Random(args.seed).randbytes(int(args.mb * 1024 * 1024))
+    workdir = tempfile.mkdtemp(prefix='upload_resume_')
+    cwd = os.getcwd()
+    try:
+        app_module = load_app(workdir)
+        app_module.app.config['MAX_CONTENT_LENGTH'] = len(data) * 2
+        from werkzeug.serving import make_server
+        server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            results = [
+                run_single(server.server_port, data, FlakyLink(args.mbps, args.mb_between_drops, args.seed),
+                           args.max_attempts),
+                run_chunked(server.server_port, data, FlakyLink(args.mbps, args.mb_between_drops, args.seed),
+                            args.max_attempts),
+            ]
+        finally:
+            server.shutdown()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{args.mb:g} MB file, {args.mbps:g} Mbit/s, a drop every {args.mb_between_drops:g} MB on average\n")
+    print(f"{'mode':<9} {'arrived':>8} {'MB sent':>8} {'requests':>9} {'wall s':>8} {'longest req s':>14}")
+    print('-' * 61)
+    for r in results:
+        print(f"{r['mode']:<9} {str(r['arrived']):>8} {r['bytes_sent'] / (1024 * 1024):>8.1f} {r['requests']:>9} "
+              f"{r['wall_s']:>8} {r['longest_request_s']:>14}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'timestamp': datetime.utcnow().isoformat(), 'args': vars(args), 'results': results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
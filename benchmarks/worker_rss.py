@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Per-worker memory with and without gunicorn preload_app.
+
+Starts the app under gunicorn (gunicorn.conf.py, sync workers) once with
+GUNICORN_PRELOAD=False and once with GUNICORN_PRELOAD=True. Each run sends the same
+warm-up traffic: page views, signup, an enhance through the local AI stand-in, the
+gallery, a preview and a free-access checkout. It then reads /proc/<pid>/smaps_rollup
+for the master and every worker.
+
+  RSS  resident pages, shared ones counted in full for every process
+  PSS  shared pages divided between the processes that map them (sums to real usage)
+  USS  pages private to the process (what an extra worker actually costs)
+
+The summary estimates how many workers fit into --ram-mb (Render instance memory)
+from the master's PSS and the mean worker PSS. Linux only.
+
+Usage:
+  python benchmarks/worker_rss.py --workers 4
+  python benchmarks/worker_rss.py --workers 4 --ram-mb 2048 --output rss.json
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import signal
+import argparse
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ai_stub_server import start_stub_server, StubConfig
+from fixtures import photo_bytes
+from loadtest import worker_pids, wait_for_app
+
+ADMIN_SECRET = 'worker-rss-admin-secret'
+PAGES = ('/', '/pricing', '/features', '/blog', '/login', '/api/health', '/readyz')
+
+
+def smaps_rollup(pid):
+    """RSS, PSS and USS of a process in kB."""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        'rss_kb': values.get('Rss', 0),
+        'pss_kb': values.get('Pss', 0),
+        'uss_kb': values.get('Private_Clean', 0) + values.get('Private_Dirty', 0),
+    }
+
+
+def start_app(port, workers, preload, stub_url, workdir):
+    env = dict(os.environ)
+    env.update({
+        'AI_BACKEND': 'stub',
+        'AI_STUB_URL': stub_url,
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'rss.db')}",
+        'ADMIN_SECRET_KEY': ADMIN_SECRET,
+        'STRIPE_SECRET_KEY': 'sk_test_worker_rss',
+        'SECRET_KEY': 'worker-rss-secret',
+        'FLASK_DEBUG': 'False',
+        'PROMETHEUS_MULTIPROC_DIR': os.path.join(workdir, 'prometheus'),
+        'AUTO_MIGRATE': 'True',
+        'GUNICORN_PRELOAD': 'True' if preload else 'False',
+        'WEB_CONCURRENCY': str(workers),
+    })
+    command = [
+        sys.executable, '-m', 'gunicorn', 'app:app',
+        '--bind', f'127.0.0.1:{port}',
+        '--config', os.path.join(REPO_ROOT, 'gunicorn.conf.py'),
+        '--chdir', workdir,
+        '--pythonpath', REPO_ROOT,
+        '--log-level', 'warning',
+    ]
+    log = open(os.path.join(workdir, 'app.log'), 'w')
+    process = subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return process, f"http://127.0.0.1:{port}"
+
+
+def warm_up(base_url, image):
+    """One visitor: browse, sign up, enhance, view the gallery and preview, check out."""
+    session = requests.Session()
+    for page in PAGES:
+        session.get(f"{base_url}{page}", timeout=60)
+    username = f"rss_{uuid.uuid4().hex[:10]}"
+    session.post(f"{base_url}/signup", json={
+        'username': username, 'email': f"{username}@example.com",
+        'password': 'worker-rss-pass', 'confirm_password': 'worker-rss-pass',
+    }, timeout=60)
+    session.post(f"{base_url}/api/admin/set-free-access", json={'username': username, 'has_free_access': True},
+                 headers={'X-Admin-Secret': ADMIN_SECRET}, timeout=60)
+    response = session.post(f"{base_url}/api/enhance", files={'image': ('rss.jpg', image, 'image/jpeg')},
+                            data={'change_intensity': 'moderate', 'detail_level': 'moderate'}, timeout=120)
+    photo_id = response.json().get('image_id') if response.status_code == 200 else None
+    session.get(f"{base_url}/api/photos", timeout=60)
+    if photo_id:
+        session.get(f"{base_url}/api/photos/{photo_id}/preview", timeout=60)
+        session.post(f"{base_url}/api/payment/create-checkout-session", json={'photo_ids': [photo_id]}, timeout=60)
+
+
+def measure(args, preload, stub_url, image):
+    workdir = tempfile.mkdtemp(prefix='worker_rss_')
+    process = None
+    try:
+        process, base_url = start_app(args.port, args.workers, preload, stub_url, workdir)
+        if not wait_for_app(base_url):
+            raise RuntimeError(f"App did not start; see {os.path.join(workdir, 'app.log')}")
+        # Enough concurrent visitors that every worker serves several of them
+        with ThreadPoolExecutor(max_workers=args.workers * 2) as pool:
+            list(pool.map(lambda _: warm_up(base_url, image), range(args.workers * args.visitors)))
+        time.sleep(0.5)
+
+        master = smaps_rollup(process.pid)
+        workers = [smaps_rollup(pid) for pid in worker_pids(process.pid)]
+        return {
+            'preload': preload,
+            'master': master,
+            'workers': workers,
+            'worker_mean': {key: statistics.mean(w[key] for w in workers) for key in ('rss_kb', 'pss_kb', 'uss_kb')},
+            'total_pss_kb': master['pss_kb'] + sum(w['pss_kb'] for w in workers),
+        }
+    finally:
+        if process:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_result(result, ram_mb):
+    mode = 'preload' if result['preload'] else 'no preload'
+    mean = result['worker_mean']
+    fits = int((ram_mb * 1024 - result['master']['pss_kb']) // mean['pss_kb']) if mean['pss_kb'] else 0
+    print(f"== {mode}: {len(result['workers'])} workers")
+    print(f"   master      RSS {result['master']['rss_kb'] / 1024:7.1f} MB  PSS {result['master']['pss_kb'] / 1024:7.1f} MB")
+    print(f"   per worker  RSS {mean['rss_kb'] / 1024:7.1f} MB  PSS {mean['pss_kb'] / 1024:7.1f} MB  "
+          f"USS {mean['uss_kb'] / 1024:7.1f} MB")
+    print(f"   total PSS {result['total_pss_kb'] / 1024:.1f} MB; about {fits} workers fit in {ram_mb} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-worker RSS/PSS with and without preload_app')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--visitors', type=int, default=3, help='Warm-up visitors per worker')
+    parser.add_argument('--port', type=int, default=5057)
+    parser.add_argument('--ram-mb', type=int, default=512, help='Instance memory for the capacity estimate')
+    parser.add_argument('--output', default=None, help='Write results JSON here')
+    args = parser.parse_args()
+
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        print('worker_rss.py needs Linux /proc/<pid>/smaps_rollup')
+        return 1
+
+    stub = start_stub_server(config=StubConfig(latency_median=0.05, latency_sigma=0.1))
+    stub_url = f"http://127.0.0.1:{stub.server_address[1]}"
+    image = photo_bytes(1600, 1200, 'JPEG', seed=7)
+    try:
+        results = [measure(args, preload, stub_url, image) for preload in (False, True)]
+    finally:
+        stub.shutdown()
+
+    for result in results:
+        print_result(result, args.ram_mb)
+    before, after = (r['worker_mean']['pss_kb'] for r in results)
+    if before:
+        print(f"\nMean worker PSS: {before / 1024:.1f} MB -> {after / 1024:.1f} MB ({(1 - after / before) * 100:.0f}% less)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'timestamp': datetime.utcnow().isoformat(), 'workers': args.workers, 'results': results}, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Time to first byte, throughput and memory of /api/photos/download-zip.
+
+Seeds a user with free access and --counts photos (each a --size MP JPEG), then streams
+the ZIP of all of them through the Flask test client without buffering. For each count
+it reports time to the first chunk, total time, archive size, and peak Python heap
+(tracemalloc) while streaming. The peak should stay flat as the count grows. The last
+archive is then downloaded again and checked with zipfile.
+
+Usage:
+  python benchmarks/zip_download.py
+  python benchmarks/zip_download.py --counts 10,100,400 --size 6 --output zip.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import zipfile
+import argparse
+import tempfile
+import tracemalloc
+from io import BytesIO
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import photo_bytes, megapixel_size
+
+
+def load_app(workdir):
+    """Import the app against a throwaway SQLite DB with the stub AI backend."""
+    os.chdir(workdir)
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['AI_BACKEND'] = 'stub'
+    os.environ['MAX_ZIP_PHOTOS'] = '100000'
+    logging.basicConfig(level=logging.ERROR)
+    import app as app_module
+    return app_module
+
+
+def create_owner(app_module, client, size):
+    """Sign up the owner (free access) and write the photo file every row points at."""
+    from models import db, User
+    width, height = megapixel_size(size)
+    with open('enhanced/zip.jpg', 'wb') as f:
+        f.write(photo_bytes(width, height, 'JPEG', seed=21, quality=95))
+    response = client.post('/signup', json={
+        'username': 'zip_owner', 'email': 'zip_owner@example.com',
+        'password': 'zip-secret', 'confirm_password': 'zip-secret',
+    })
+    assert response.status_code == 200, response.get_data(as_text=True)[:200]
+    with app_module.app.app_context():
+        User.query.filter_by(username='zip_owner').first().has_free_access = True
+        db.session.commit()
+
+
+def seed_photos(app_module, count):
+    """Replace the owner's photos with `count` rows."""
+    from models import db, User, EnhancedImage
+    with app_module.app.app_context():
+        owner = User.query.filter_by(username='zip_owner').first()
+        EnhancedImage.query.filter_by(user_id=owner.id).delete()
+        db.session.add_all(EnhancedImage(
+            user_id=owner.id, original_filename=f'IMG_{i:05d}.jpg', original_path='uploads/missing.jpg',
+            enhanced_filename=f'enhanced_IMG_{i:05d}.jpg', enhanced_path='enhanced/zip.jpg',
+        ) for i in range(count))
+        db.session.commit()
+
+
+def stream(client):
+    tracemalloc.start()
+    start = time.perf_counter()
+    response = client.get('/api/photos/download-zip', buffered=False)
+    assert response.status_code == 200, response.status_code
+    first_byte = None
+    total = 0
+    for chunk in response.response:
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+        total += len(chunk)
+    response.close()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'ttfb_ms': round(first_byte * 1000, 1), 'seconds': round(elapsed, 2), 'bytes': total,
+            'mb_per_s': round(total / elapsed / 1e6, 1), 'peak_heap_kb': round(peak / 1024)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Streaming ZIP download benchmark')
+    parser.add_argument('--counts', default='10,50,200', help='Photos per archive')
+    parser.add_argument('--size', type=int, default=6, help='Photo size in megapixels')
+    parser.add_argument('--output', default=None, help='Write results JSON here')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='zip_download_')
+    cwd = os.getcwd()
+    results = []
+    try:
+        app_module = load_app(workdir)
+        client = app_module.app.test_client()
+        create_owner(app_module, client, args.size)
+        for count in (int(value) for value in args.counts.split(',')):
+            seed_photos(app_module, count)
+            results.append({'photos': count, **stream(client)})
+        # Check the last archive is one unzip tools accept
+        archive = zipfile.ZipFile(BytesIO(client.get('/api/photos/download-zip').data))
+        assert archive.testzip() is None and len(archive.namelist()) == results[-1]['photos']
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{'photos':>7} {'MB':>9} {'TTFB ms':>9} {'seconds':>9} {'MB/s':>7} {'peak heap KB':>13}")
+    print('-' * 59)
+    for r in results:
+        print(f"{r['photos']:>7} {r['bytes'] / 1e6:>9.1f} {r['ttfb_ms']:>9} {r['seconds']:>9} "
+              f"{r['mb_per_s']:>7} {r['peak_heap_kb']:>13}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'timestamp': datetime.utcnow().isoformat(), 'size_mp': args.size, 'results': results},
+                      f, indent=2)
+        print(f"\nResults written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
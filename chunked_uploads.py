@@ -0,0 +1,335 @@
+"""
+Resumable uploads sent in chunks, for large originals on unreliable connections.
+
+A multipart POST to /api/enhance sends the whole file at once. If the connection drops at
+90%, the transfer starts over, and the request holds a worker the whole time. Instead,
+a client can:
+
+    POST /api/uploads                      {"filename", "size", "sha256"?} -> upload_id
+    PUT  /api/uploads/<id>                 Upload-Offset: N, body = the next chunk
+    GET  /api/uploads/<id>                 current offset, to resume after a failure
+    POST /api/uploads/<id>/finalize        form fields of /api/enhance + "operation"
+
+Each PUT holds a worker only while that chunk arrives. It is appended straight to
+CHUNKED_UPLOAD_DIR/<id>.part, so the part file's size is the upload's offset, visible
+to every worker. A chunk is accepted only at the current offset. After a failure the
+client asks for the offset and resends from there. Metadata that never changes
+(filename, size, declared digest, owner) sits next to it in <id>.json.
+
+The whole-file SHA-256 is updated as chunks are appended. hashlib state cannot be
+shared between processes, so each process keeps the running hash of uploads whose
+chunks it received in order. finalize hashes the file again only when the chunks were
+spread over several workers.
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import storage
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent PUTs to one upload are not serialized
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CHUNKED_UPLOAD_DIR = os.getenv('CHUNKED_UPLOAD_DIR', 'partial_uploads')
+CHUNKED_UPLOAD_MAX_MB = int(os.getenv('CHUNKED_UPLOAD_MAX_MB', '200'))
+# Largest chunk accepted per PUT; also the size clients are told to send
+UPLOAD_CHUNK_MB = int(os.getenv('UPLOAD_CHUNK_MB', '4'))
+UPLOAD_EXPIRY_HOURS = float(os.getenv('UPLOAD_EXPIRY_HOURS', '24'))
+
+_READ_SIZE = 64 * 1024
+# Running hashes kept per process; the oldest is dropped (and rehashed at finalize)
+_MAX_RUNNING_HASHES = 64
+# Expired uploads are swept from create() at most this often per process
+_PURGE_INTERVAL = 600
+
+_hashes = OrderedDict()
+_hashes_lock = threading.Lock()
+_last_purge = 0.0
+
+os.makedirs(CHUNKED_UPLOAD_DIR, exist_ok=True)
+
+
+class UploadError(Exception):
+    """The upload request was refused; `status` is the HTTP status to answer with."""
+
+    status = 400
+
+    def details(self):
+        return {}
+
+
+class UploadNotFound(UploadError):
+    status = 404
+
+
+class UploadOffsetMismatch(UploadError):
+    status = 409
+
+    def __init__(self, message, offset):
+        super().__init__(message)
+        self.offset = offset
+
+    def details(self):
+        return {'offset': self.offset}
+
+
+class UploadTooLarge(UploadError):
+    status = 413
+
+
+class UploadIncomplete(UploadError):
+    status = 409
+
+    def __init__(self, message, offset):
+        super().__init__(message)
+        self.offset = offset
+
+    def details(self):
+        return {'offset': self.offset}
+
+
+class UploadChecksumMismatch(UploadError):
+    status = 422
+
+
+def chunk_bytes():
+    return max(1, UPLOAD_CHUNK_MB) * 1024 * 1024
+
+
+def max_upload_bytes():
+    return max(1, CHUNKED_UPLOAD_MAX_MB) * 1024 * 1024
+
+
+def _valid_id(upload_id):
+    return len(upload_id) == 32 and all(c in '0123456789abcdef' for c in upload_id)
+
+
+def _lock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+class ChunkedUpload:
+    """An upload in CHUNKED_UPLOAD_DIR. Passed to the enhance endpoints in place of a FileStorage."""
+
+    def __init__(self, upload_id, filename, size, sha256, user_id, created_at):
+        self.upload_id = upload_id
+        self.filename = filename
+        self.size = size
+        self.sha256 = sha256
+        self.user_id = user_id
+        self.created_at = created_at
+
+    @property
+    def data_path(self):
+        return os.path.join(CHUNKED_UPLOAD_DIR, f"{self.upload_id}.part")
+
+    @property
+    def meta_path(self):
+        return os.path.join(CHUNKED_UPLOAD_DIR, f"{self.upload_id}.json")
+
+    @property
+    def expires_at(self):
+        return self.created_at + UPLOAD_EXPIRY_HOURS * 3600
+
+    @property
+    def offset(self):
+        try:
+            return os.path.getsize(self.data_path)
+        except FileNotFoundError:
+            return 0
+
+    def status(self):
+        offset = self.offset
+        return {
+            'upload_id': self.upload_id,
+            'filename': self.filename,
+            'size': self.size,
+            'offset': offset,
+            'complete': offset == self.size,
+            'chunk_size': chunk_bytes(),
+            'expires_at': int(self.expires_at),
+        }
+
+    def append(self, offset, stream, content_length, chunk_sha256=None):
+        """Append one chunk read from `stream` at `offset`. Returns the new offset.
+
+        The chunk is written only if `offset` is the current size of the part file. A chunk
+        that arrives incomplete or does not match `chunk_sha256` (hex) is cut off again, so
+        the client can resend it from the same offset.
+        """
+        if content_length is None:
+            raise UploadError('Content-Length is required')
+        if content_length > chunk_bytes():
+            raise UploadTooLarge(f'Chunks may be at most {UPLOAD_CHUNK_MB} MB')
+
+        with open(self.data_path, 'ab') as f:
+            _lock_file(f)
+            current = f.seek(0, os.SEEK_END)
+            if offset != current:
+                raise UploadOffsetMismatch(f'Expected offset {current}', current)
+            if current + content_length > self.size:
+                raise UploadTooLarge('Chunk extends past the declared upload size')
+
+            chunk_hash = hashlib.sha256()
+            with _hashes_lock:
+                running = _hashes.pop(self.upload_id, None)
+            file_hash = running[1] if running and running[0] == current else None
+            if file_hash is None and current == 0:
+                file_hash = hashlib.sha256()
+
+            written = 0
+            try:
+                while written < content_length:
+                    block = stream.read(min(_READ_SIZE, content_length - written))
+                    if not block:
+                        break
+                    f.write(block)
+                    chunk_hash.update(block)
+                    if file_hash is not None:
+                        file_hash.update(block)
+                    written += len(block)
+                if written != content_length:
+                    raise UploadIncomplete('Chunk ended early; resend it', current)
+                if chunk_sha256 and chunk_hash.hexdigest() != chunk_sha256.lower():
+                    raise UploadChecksumMismatch('Chunk checksum does not match')
+                f.flush()
+            except BaseException:
+                f.truncate(current)
+                raise
+
+        new_offset = current + written
+        if file_hash is not None:
+            with _hashes_lock:
+                _hashes[self.upload_id] = (new_offset, file_hash)
+                while len(_hashes) > _MAX_RUNNING_HASHES:
+                    _hashes.popitem(last=False)
+        return new_offset
+
+    def digest(self):
+        """Hex SHA-256 of the complete upload, from the running hash when this process has it."""
+        with _hashes_lock:
+            running = _hashes.get(self.upload_id)
+        if running and running[0] == self.size:
+            return running[1].hexdigest()
+        file_hash = hashlib.sha256()
+        with open(self.data_path, 'rb') as f:
+            while block := f.read(1024 * 1024):
+                file_hash.update(block)
+        return file_hash.hexdigest()
+
+    def verify(self):
+        """Raise unless every byte has arrived and matches the digest declared at creation."""
+        offset = self.offset
+        if offset != self.size:
+            raise UploadIncomplete(f'Upload has {offset} of {self.size} bytes', offset)
+        if self.sha256 and self.digest() != self.sha256:
+            raise UploadChecksumMismatch('Upload does not match the declared sha256')
+
+    def save(self, dst):
+        """Place the uploaded bytes at `dst`, the way FileStorage.save() would.
+
+        The part file is hard-linked, not copied, and stays in place until discard(). If
+        the enhancement fails, finalize can be retried without uploading again.
+        """
+        with storage.atomic_path(dst) as tmp_path:
+            try:
+                os.link(self.data_path, tmp_path)
+            except OSError:  # Different filesystem, or no hard links
+                shutil.copyfile(self.data_path, tmp_path)
+
+    def discard(self):
+        with _hashes_lock:
+            _hashes.pop(self.upload_id, None)
+        for path in (self.data_path, self.meta_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def create(filename, size, sha256=None, user_id=None):
+    """Start an upload of `size` bytes and return it."""
+    if size <= 0:
+        raise UploadError('size must be a positive number of bytes')
+    if size > max_upload_bytes():
+        raise UploadTooLarge(f'File too large. Maximum upload size is {CHUNKED_UPLOAD_MAX_MB} MB.')
+    if sha256 and (len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256.lower())):
+        raise UploadError('sha256 must be 64 hex digits')
+
+    _purge_periodically()
+    upload = ChunkedUpload(uuid.uuid4().hex, filename, size, sha256.lower() if sha256 else None,
+                           user_id, time.time())
+    open(upload.data_path, 'wb').close()
+    tmp_path = f"{upload.meta_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'filename': filename, 'size': size, 'sha256': upload.sha256,
+                   'user_id': user_id, 'created_at': upload.created_at}, f)
+    os.replace(tmp_path, upload.meta_path)
+    return upload
+
+
+def load(upload_id):
+    """The upload with this id, or raise UploadNotFound (also once it has expired)."""
+    if not _valid_id(upload_id):
+        raise UploadNotFound('Upload not found')
+    try:
+        with open(os.path.join(CHUNKED_UPLOAD_DIR, f"{upload_id}.json")) as f:
+            meta = json.load(f)
+    except (FileNotFoundError, ValueError):
+        raise UploadNotFound('Upload not found') from None
+    upload = ChunkedUpload(upload_id, meta['filename'], meta['size'], meta.get('sha256'),
+                           meta.get('user_id'), meta['created_at'])
+    if time.time() > upload.expires_at:
+        upload.discard()
+        raise UploadNotFound('Upload expired')
+    return upload
+
+
+def expired_files(now=None):
+    """Paths of part and metadata files in CHUNKED_UPLOAD_DIR older than UPLOAD_EXPIRY_HOURS."""
+    cutoff = (now or time.time()) - UPLOAD_EXPIRY_HOURS * 3600
+    for entry in os.scandir(CHUNKED_UPLOAD_DIR):
+        try:
+            if entry.stat().st_mtime < cutoff:
+                yield entry.path
+        except FileNotFoundError:
+            continue
+
+
+def purge_expired(now=None):
+    """Delete uploads older than UPLOAD_EXPIRY_HOURS. Returns how many were removed."""
+    removed = 0
+    for path in list(expired_files(now)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        if path.endswith('.json'):
+            removed += 1
+    if removed:
+        logger.info(f"Removed {removed} expired chunked uploads")
+    return removed
+
+
+def _purge_periodically():
+    global _last_purge
+    now = time.time()
+    if now - _last_purge < _PURGE_INTERVAL:
+        return
+    _last_purge = now
+    try:
+        purge_expired(now)
+    except OSError as e:
+        logger.warning(f"Could not purge expired uploads: {e}")
@@ -0,0 +1,182 @@
+"""
+Cold storage for the image payloads of old photos.
+
+Every photo keeps base64 copies of its original and enhanced images in the database, so it
+survives deploys that wipe the local disk. After the first few days those copies are rarely
+read, but they stay in the primary database and make up most of its size.
+
+archive.py moves the payloads of photos that are old and no longer viewed into pack files
+on a cold storage backend, then clears the database columns. A pack holds images back
+to back, each zlib-compressed from its raw bytes (not base64). The archived_payload table
+records, for each photo and source, the pack and the byte range that hold it, so one
+image is fetched with a single ranged read.
+
+read_photo_bytes() in app.py reads an archived image back through read() the first time
+it is requested and writes it to local disk again, like any other database restore.
+
+Backends (COLD_STORAGE_BACKEND):
+
+  local  Pack files under COLD_STORAGE_DIR, sharded like uploads/ (storage.py). Use a
+         volume that outlives deploys.
+  s3     Any S3-compatible store: COLD_STORAGE_BUCKET and COLD_STORAGE_PREFIX, plus
+         COLD_STORAGE_ENDPOINT_URL for MinIO, R2 and similar. Needs boto3; credentials
+         come from the usual AWS_* environment variables.
+"""
+
+import os
+import uuid
+import zlib
+import shutil
+import logging
+import tempfile
+import threading
+
+import metrics
+import storage
+
+try:
+    import boto3
+except ImportError:  # Only needed for COLD_STORAGE_BACKEND=s3
+    boto3 = None
+
+logger = logging.getLogger(__name__)
+
+COLD_STORAGE_BACKEND = os.getenv('COLD_STORAGE_BACKEND', 'local')
+COLD_STORAGE_DIR = os.getenv('COLD_STORAGE_DIR', 'cold_storage')
+COLD_STORAGE_BUCKET = os.getenv('COLD_STORAGE_BUCKET', '')
+COLD_STORAGE_PREFIX = os.getenv('COLD_STORAGE_PREFIX', 'packs/')
+COLD_STORAGE_ENDPOINT_URL = os.getenv('COLD_STORAGE_ENDPOINT_URL', '')
+# A pack is closed and uploaded once it reaches this size
+COLD_PACK_MB = int(os.getenv('COLD_PACK_MB', '256'))
+COLD_COMPRESS_LEVEL = int(os.getenv('COLD_COMPRESS_LEVEL', '6'))
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+class ColdStorageError(Exception):
+    """An archived payload could not be read back, or a pack could not be stored."""
+
+
+class LocalBackend:
+    """Pack files in a local directory."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(storage.shard_dir(self.root, key), key)
+
+    def put(self, key, src_path):
+        with storage.atomic_path(self._path(key)) as tmp_path:
+            shutil.copyfile(src_path, tmp_path)
+
+    def size(self, key):
+        return os.path.getsize(self._path(key))
+
+    def read(self, key, offset, length):
+        with open(self._path(key), 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+
+class S3Backend:
+    """Pack files as objects in an S3-compatible bucket; reads are ranged GETs."""
+
+    def __init__(self, bucket, prefix='', endpoint_url=None):
+        if boto3 is None:
+            raise ColdStorageError('COLD_STORAGE_BACKEND=s3 needs boto3 (pip install boto3)')
+        if not bucket:
+            raise ColdStorageError('COLD_STORAGE_BACKEND=s3 needs COLD_STORAGE_BUCKET')
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client('s3', endpoint_url=endpoint_url or None)
+
+    def put(self, key, src_path):
+        self.client.upload_file(src_path, self.bucket, self.prefix + key)
+
+    def size(self, key):
+        return self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)['ContentLength']
+
+    def read(self, key, offset, length):
+        response = self.client.get_object(Bucket=self.bucket, Key=self.prefix + key,
+                                          Range=f'bytes={offset}-{offset + length - 1}')
+        return response['Body'].read()
+
+
+def get_backend():
+    """The configured backend, created on first use in each process."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if COLD_STORAGE_BACKEND == 's3':
+                _backend = S3Backend(COLD_STORAGE_BUCKET, COLD_STORAGE_PREFIX, COLD_STORAGE_ENDPOINT_URL)
+            elif COLD_STORAGE_BACKEND == 'local':
+                _backend = LocalBackend(COLD_STORAGE_DIR)
+            else:
+                raise ColdStorageError(f'Unknown COLD_STORAGE_BACKEND: {COLD_STORAGE_BACKEND}')
+        return _backend
+
+
+class PackWriter:
+    """Builds one pack in a local temporary file, then stores it on the backend.
+
+    add() returns where the payload will sit in the pack. Nothing refers to the pack until
+    store() has returned, so a failed run leaves at most an unreferenced pack behind.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or get_backend()
+        self.key = f"{uuid.uuid4().hex}.pack"
+        fd, self.path = tempfile.mkstemp(prefix='pack_', suffix='.tmp')
+        self._file = os.fdopen(fd, 'wb')
+        self.size = 0
+
+    def add(self, image_bytes):
+        """Append one image. Returns (offset, length) of its compressed entry."""
+        entry = zlib.compress(image_bytes, COLD_COMPRESS_LEVEL)
+        offset = self.size
+        self._file.write(entry)
+        self.size += len(entry)
+        return offset, len(entry)
+
+    @property
+    def full(self):
+        return self.size >= COLD_PACK_MB * 1024 * 1024
+
+    def store(self):
+        """Upload the pack and check the stored size. Returns the pack key."""
+        self._file.close()
+        try:
+            self.backend.put(self.key, self.path)
+            stored = self.backend.size(self.key)
+            if stored != self.size:
+                raise ColdStorageError(f'Pack {self.key} stored with {stored} of {self.size} bytes')
+        finally:
+            self.discard()
+        return self.key
+
+    def discard(self):
+        if not self._file.closed:
+            self._file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def read(entry):
+    """Bytes of the image an ArchivedPayload row points at. Raises ColdStorageError."""
+    with metrics.time_histogram(metrics.COLD_STORAGE_READ_SECONDS):
+        try:
+            image_bytes = zlib.decompress(get_backend().read(entry.pack, entry.pack_offset, entry.length))
+            if len(image_bytes) != entry.size:
+                raise ColdStorageError(f'{entry.pack}@{entry.pack_offset} holds {len(image_bytes)} bytes, '
+                                       f'expected {entry.size}')
+        except Exception as e:
+            metrics.COLD_STORAGE_READS.labels('error').inc()
+            if isinstance(e, ColdStorageError):
+                raise
+            raise ColdStorageError(f'Could not read {entry.pack}@{entry.pack_offset}: {e}') from e
+    metrics.COLD_STORAGE_READS.labels('ok').inc()
+    return image_bytes
@@ -0,0 +1,60 @@
+"""
+Gunicorn settings shared by every deployment. Gunicorn reads this file automatically
+from the working directory; command-line flags in the Procfile still take precedence.
+
+Each worker is a separate process, so Prometheus metrics are written to mmap files in
+PROMETHEUS_MULTIPROC_DIR and merged by /metrics at scrape time.
+
+With preload_app (GUNICORN_PRELOAD, on by default) the master imports the app once,
+warms templates and fonts, and forks the workers from it. Workers share that memory
+copy-on-write instead of each importing everything again; post_fork resets the DB pool
+and network clients in each worker.
+"""
+
+import gc
+import os
+import shutil
+
+from dotenv import load_dotenv
+
+# The settings here, and the app modules preloaded by the master, read the environment at import
+load_dotenv()
+
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/elevance_prometheus')
+# With preload_app the master imports the app (and creates its metric files) before on_starting
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+# Imported here rather than in child_exit: importing inside the SIGCHLD handler can re-enter
+# itself when several workers exit at once
+from prometheus_client import multiprocess  # noqa: E402
+
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True').lower() == 'true'
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+
+
+def on_starting(server):
+    # Samples left over from a previous master would be summed into the new counters
+    multiproc_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    import app as app_module
+    app_module.prepare_for_fork()
+    # Move everything allocated so far out of the collector's reach, so GC passes in the
+    # workers do not write to (and un-share) the preloaded objects
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        import app as app_module
+        app_module.reinit_after_fork()
+
+
+def child_exit(server, worker):
+    # Drop live gauges (in-flight AI calls, pool connections) owned by the dead worker
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,10 +1,13 @@
-import os
 import logging
+import threading
 from io import BytesIO
 from PIL import Image
-from google import genai
-from google.genai import types
-from typing import Dict, Tuple
+from typing import Dict, Optional, Tuple
+import image_pool
+import metrics
+import storage
+from ai_backends import AIBackend, AIRateLimitError, configured_backend, create_backend
+from request_timing import span
 
 logger = logging.getLogger(__name__)
 
@@ -12,12 +15,37 @@ logger = logging.getLogger(__name__)
 class ImageEnhancer:
     """Simple image enhancer using AI."""
     
-    def __init__(self, api_key: str = None):
-        self.api_key = api_key or os.getenv('GEMINI_API_KEY') or os.getenv('GOOGLE_API_KEY')
-        if not self.api_key:
-            raise ValueError("GEMINI_API_KEY is required")
-        self.client = genai.Client(api_key=self.api_key)
-        self.model_name = "gemini-3-pro-image-preview"
+    def __init__(self, api_key: str = None, backend: AIBackend = None):
+        self._api_key = api_key
+        self._backend = backend
+        # A backend passed in by the caller is kept; one built from the environment is ours
+        self._owns_backend = backend is None
+        self._backend_lock = threading.Lock()
+        if backend is not None:
+            self.backend_name, self.model_name = backend.name, backend.model_name
+        else:
+            # Validates the configuration now; the client (and google.genai) loads on first use
+            self.backend_name, self.model_name = configured_backend(api_key)
+
+    @property
+    def backend(self) -> AIBackend:
+        """The AI backend, created on first access (thread-safe)."""
+        if self._backend is None:
+            with self._backend_lock:
+                if self._backend is None:
+                    self._backend = create_backend(self._api_key)
+                    self.model_name = self._backend.model_name
+        return self._backend
+
+    @property
+    def backend_initialized(self) -> bool:
+        return self._backend is not None
+
+    def reset_backend(self):
+        """Drop the backend so the next call builds a new client (after a fork)."""
+        self._backend_lock = threading.Lock()
+        if self._owns_backend:
+            self._backend = None
     
     def enhance_image(self, image_path: str, filename: str, change_intensity: str = "moderate", detail_level: str = "moderate") -> Tuple[str, Dict]:
         """Enhance image using AI.
@@ -28,16 +56,8 @@ class ImageEnhancer:
             change_intensity: "minimal" or "extensive" - how much to change the photo
             detail_level: "minimal" or "extensive" - how many details to add
         """
-        # Load image
-        image = Image.open(image_path)
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Convert to bytes
-        buffer = BytesIO()
-        image.save(buffer, format='JPEG', quality=95)
-        buffer.seek(0)
-        image_bytes = buffer.read()
+        with span('ai_encode'):
+            image, image_bytes = image_pool.run('ai_encode', self._encode_request_image, image_path)
         
         # Build prompt based on user preferences
         prompt = self._build_enhancement_prompt(change_intensity, detail_level)
@@ -45,54 +65,7 @@ class ImageEnhancer:
         # Send to AI service
         logger.info(f"Sending image for processing: {filename}")
         logger.info(f"Enhancement settings: change_intensity={change_intensity}, detail_level={detail_level}")
-        try:
-            image_part = types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg")
-            
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=[
-                    prompt,
-                    image_part
-                ]
-            )
-            
-            # Get response - check for image data first
-            response_text = ""
-            enhanced_image = None
-            reason = ""
-            
-            if hasattr(response, 'parts'):
-                for part in response.parts:
-                    if hasattr(part, 'inline_data') and part.inline_data:
-                        # AI service returned an enhanced image
-                        logger.info("AI service returned enhanced image data")
-                        try:
-                            image_data = part.inline_data.data
-                            enhanced_image = Image.open(BytesIO(image_data))
-                            if enhanced_image.mode != 'RGB':
-                                enhanced_image = enhanced_image.convert('RGB')
-                            reason = "AI service returned enhanced image"
-                        except Exception as e:
-                            reason = f"AI service returned image data but failed to process: {str(e)}"
-                    elif hasattr(part, 'text') and part.text:
-                        response_text += part.text
-            elif hasattr(response, 'text'):
-                response_text = response.text
-            
-            # Determine reason if no image returned
-            if not enhanced_image:
-                if response_text:
-                    reason = f"AI service returned text response instead of image: {response_text[:100]}"
-                else:
-                    reason = "AI service returned empty response - model may not support image generation/enhancement"
-            
-            logger.info(f"AI service response: {response_text if response_text else '(no text response)'}")
-            logger.info(f"Reason: {reason}")
-        except Exception as e:
-            logger.error(f"Error calling AI service: {e}", exc_info=True)
-            response_text = f"Error: {str(e)}"
-            enhanced_image = None
-            reason = f"Error calling AI API: {str(e)}"
+        enhanced_image, response_text, reason = self._generate(prompt, image_bytes, "enhanced", "enhance")
         
         # Use AI service's enhanced image if available, otherwise return original with reason
         if enhanced_image:
@@ -103,9 +76,10 @@ class ImageEnhancer:
             logger.warning(f"No enhanced image from AI service. Reason: {reason}")
         
         # Save image
-        enhanced_filename = f"enhanced_{filename.rsplit('.', 1)[0]}.jpg"
-        enhanced_path = os.path.join('enhanced', enhanced_filename)
-        final_image.save(enhanced_path, 'JPEG', quality=95)
+        enhanced_path = storage.new_path('enhanced', '.jpg')
+        with span('result_save'):
+            # Already paid for the AI call: wait for a pool thread rather than fail
+            image_pool.run('result_save', self._save_result, final_image, enhanced_path, reject_when_full=False)
         
         return enhanced_path, {
             "response": response_text,
@@ -122,70 +96,15 @@ class ImageEnhancer:
             image_path: Path to the image file
             filename: Original filename
         """
-        # Load image
-        image = Image.open(image_path)
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Convert to bytes
-        buffer = BytesIO()
-        image.save(buffer, format='JPEG', quality=95)
-        buffer.seek(0)
-        image_bytes = buffer.read()
+        with span('ai_encode'):
+            image, image_bytes = image_pool.run('ai_encode', self._encode_request_image, image_path)
         
         # Build night conversion prompt
         prompt = self._build_night_conversion_prompt()
         
         # Send to AI service
         logger.info(f"Converting image to night: {filename}")
-        try:
-            image_part = types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg")
-            
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=[
-                    prompt,
-                    image_part
-                ]
-            )
-            
-            # Get response - check for image data first
-            response_text = ""
-            converted_image = None
-            reason = ""
-            
-            if hasattr(response, 'parts'):
-                for part in response.parts:
-                    if hasattr(part, 'inline_data') and part.inline_data:
-                        # AI service returned a converted image
-                        logger.info("AI service returned night-converted image data")
-                        try:
-                            image_data = part.inline_data.data
-                            converted_image = Image.open(BytesIO(image_data))
-                            if converted_image.mode != 'RGB':
-                                converted_image = converted_image.convert('RGB')
-                            reason = "AI service returned night-converted image"
-                        except Exception as e:
-                            reason = f"AI service returned image data but failed to process: {str(e)}"
-                    elif hasattr(part, 'text') and part.text:
-                        response_text += part.text
-            elif hasattr(response, 'text'):
-                response_text = response.text
-            
-            # Determine reason if no image returned
-            if not converted_image:
-                if response_text:
-                    reason = f"AI service returned text response instead of image: {response_text[:100]}"
-                else:
-                    reason = "AI service returned empty response - model may not support image generation/enhancement"
-            
-            logger.info(f"AI service response: {response_text if response_text else '(no text response)'}")
-            logger.info(f"Reason: {reason}")
-        except Exception as e:
-            logger.error(f"Error calling AI service: {e}", exc_info=True)
-            response_text = f"Error: {str(e)}"
-            converted_image = None
-            reason = f"Error calling AI API: {str(e)}"
+        converted_image, response_text, reason = self._generate(prompt, image_bytes, "night-converted", "night")
         
         # Use AI service's converted image if available, otherwise return original with reason
         if converted_image:
@@ -196,9 +115,9 @@ class ImageEnhancer:
             logger.warning(f"No night-converted image from AI service. Reason: {reason}")
         
         # Save image
-        night_filename = f"night_{filename.rsplit('.', 1)[0]}.jpg"
-        night_path = os.path.join('enhanced', night_filename)
-        final_image.save(night_path, 'JPEG', quality=95)
+        night_path = storage.new_path('enhanced', '.jpg')
+        with span('result_save'):
+            image_pool.run('result_save', self._save_result, final_image, night_path, reject_when_full=False)
         
         return night_path, {
             "response": response_text,
@@ -207,6 +126,89 @@ class ImageEnhancer:
             "conversion_type": "night_conversion"
         }
     
+    def _encode_request_image(self, image_path: str) -> Tuple[Image.Image, bytes]:
+        """Load the image as RGB and encode it as the JPEG payload sent to the AI service."""
+        image = Image.open(image_path)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        
+        buffer = BytesIO()
+        image.save(buffer, format='JPEG', quality=95)
+        return image, buffer.getvalue()
+    
+    def _save_result(self, image: Image.Image, path: str):
+        """Write the result JPEG under a temporary name and rename it into place."""
+        with storage.atomic_path(path) as tmp_path:
+            image.save(tmp_path, 'JPEG', quality=95)
+    
+    def _decode_response_image(self, image_data: bytes) -> Image.Image:
+        """Decode image bytes returned by the AI service into an RGB image."""
+        image = Image.open(BytesIO(image_data))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        return image
+    
+    def _call_backend(self, prompt: str, image_bytes: bytes, operation: str) -> Tuple[Optional[bytes], str]:
+        """Call the backend, recording latency, outcome and payload sizes for /metrics."""
+        model = self.model_name or 'unknown'
+        metrics.AI_PAYLOAD_BYTES.labels(operation, model, 'sent').observe(len(image_bytes))
+        metrics.AI_IN_FLIGHT.inc()
+        outcome = 'error'
+        try:
+            with metrics.time_histogram(metrics.AI_REQUEST_SECONDS, operation, model):
+                image_data, response_text = self.backend.generate_image(prompt, image_bytes, mime_type="image/jpeg")
+            outcome = 'ok' if image_data else 'no_image'
+            if image_data:
+                metrics.AI_PAYLOAD_BYTES.labels(operation, model, 'received').observe(len(image_data))
+            return image_data, response_text
+        except AIRateLimitError:
+            outcome = 'rate_limited'
+            raise
+        finally:
+            metrics.AI_IN_FLIGHT.dec()
+            metrics.AI_REQUESTS.labels(operation, model, outcome).inc()
+    
+    def _generate(self, prompt: str, image_bytes: bytes, label: str, operation: str) -> Tuple[Optional[Image.Image], str, str]:
+        """Call the AI backend and decode its answer.
+        
+        Returns (result_image, response_text, reason). result_image is None when the
+        service failed or did not return an image.
+        """
+        response_text = ""
+        result_image = None
+        reason = ""
+        try:
+            with span('ai_call'):
+                image_data, response_text = self._call_backend(prompt, image_bytes, operation)
+            
+            if image_data:
+                # AI service returned an image
+                logger.info(f"AI service returned {label} image data")
+                try:
+                    with span('ai_decode'):
+                        result_image = image_pool.run('ai_decode', self._decode_response_image, image_data,
+                                                      reject_when_full=False)
+                    reason = f"AI service returned {label} image"
+                except Exception as e:
+                    reason = f"AI service returned image data but failed to process: {str(e)}"
+            
+            # Determine reason if no image returned
+            if not result_image and not reason:
+                if response_text:
+                    reason = f"AI service returned text response instead of image: {response_text[:100]}"
+                else:
+                    reason = "AI service returned empty response - model may not support image generation/enhancement"
+            
+            logger.info(f"AI service response: {response_text if response_text else '(no text response)'}")
+            logger.info(f"Reason: {reason}")
+        except Exception as e:
+            logger.error(f"Error calling AI service: {e}", exc_info=True)
+            response_text = f"Error: {str(e)}"
+            result_image = None
+            reason = f"Error calling AI API: {str(e)}"
+        
+        return result_image, response_text, reason
+    
     def _build_night_conversion_prompt(self) -> str:
         """Build night conversion prompt for converting day photos to night photos."""
         prompt = """Convert this day photo into a realistic night photo. The transformation should be natural and professional.
@@ -0,0 +1,155 @@
+"""
+Shared, bounded thread pool for CPU-heavy Pillow work done inside requests.
+
+Pillow releases the GIL while it decodes, resizes and encodes, so with threaded serving
+(asgi.py, gthread workers) image work on a few pool threads overlaps with requests that
+are waiting on I/O. The bound is what matters under load. At most IMAGE_POOL_THREADS
+operations run at once per process and at most IMAGE_POOL_QUEUE wait behind them. A
+burst of previews then gets ImagePoolBusy (HTTP 503) instead of pinning every CPU and
+starving the rest of the app.
+
+    result = image_pool.run('watermark', add_watermark, image_bytes)
+
+Functions run in a copy of the caller's context, so request_timing spans still work.
+"""
+
+import os
+import time
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# 0 runs every operation inline in the calling thread (no bound, no offload)
+IMAGE_POOL_THREADS = int(os.getenv('IMAGE_POOL_THREADS', str(min(4, _available_cpus()))))
+# Operations allowed to wait for a thread before new ones are rejected
+IMAGE_POOL_QUEUE = int(os.getenv('IMAGE_POOL_QUEUE', '16'))
+DEFAULT_TIMEOUT = float(os.getenv('IMAGE_OP_TIMEOUT_SECONDS', '60'))
+
+
+def _parse_timeouts(value):
+    """'watermark=10,normalize=45' -> {'watermark': 10.0, 'normalize': 45.0}"""
+    timeouts = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, _, seconds = item.partition('=')
+        try:
+            timeouts[name.strip()] = float(seconds)
+        except ValueError:
+            logger.warning(f"Ignoring invalid IMAGE_OP_TIMEOUTS entry: {item}")
+    return timeouts
+
+
+# Seconds a caller waits for each operation, including time queued
+OPERATION_TIMEOUTS = {
+    'normalize': 60,
+    'watermark': 15,
+    'ai_encode': 30,
+    'ai_decode': 30,
+    'result_save': 30,
+    'rendition': 30,
+    **_parse_timeouts(os.getenv('IMAGE_OP_TIMEOUTS', '')),
+}
+
+
+class ImagePoolError(Exception):
+    """The image operation was not completed; the request should answer 503."""
+
+    retry_after = 2
+
+
+class ImagePoolBusy(ImagePoolError):
+    pass
+
+
+class ImagePoolTimeout(ImagePoolError):
+    pass
+
+
+_executor = None
+_pending = 0
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=IMAGE_POOL_THREADS, thread_name_prefix='image-pool')
+    return _executor
+
+
+def _execute(operation, queued_at, func, args, kwargs):
+    metrics.IMAGE_POOL_WAIT_SECONDS.labels(operation).observe(time.perf_counter() - queued_at)
+    metrics.IMAGE_POOL_QUEUE_DEPTH.dec()
+    metrics.IMAGE_POOL_ACTIVE.inc()
+    _local.in_pool = True
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _local.in_pool = False
+        metrics.IMAGE_POOL_ACTIVE.dec()
+
+
+def _release(_future):
+    global _pending
+    with _lock:
+        _pending -= 1
+
+
+def run(operation, func, *args, timeout=None, reject_when_full=True, **kwargs):
+    """Run func(*args, **kwargs) on the image pool and return its result.
+
+    Raises ImagePoolBusy when the pool and its queue are full (unless reject_when_full is
+    False, for work the request has already paid for, like saving an AI result), and
+    ImagePoolTimeout when the result is not ready within the operation's timeout. A
+    timed-out operation keeps its thread until it finishes.
+    """
+    if IMAGE_POOL_THREADS <= 0 or getattr(_local, 'in_pool', False):
+        # Nested calls run inline: waiting on the pool from a pool thread could deadlock
+        return func(*args, **kwargs)
+
+    global _pending
+    with _lock:
+        if reject_when_full and _pending >= IMAGE_POOL_THREADS + IMAGE_POOL_QUEUE:
+            metrics.IMAGE_POOL_REJECTED.labels(operation, 'busy').inc()
+            raise ImagePoolBusy(f"Image pool is full ({_pending} operations pending)")
+        _pending += 1
+        executor = _get_executor()
+
+    metrics.IMAGE_POOL_QUEUE_DEPTH.inc()
+    context = contextvars.copy_context()
+    future = executor.submit(context.run, _execute, operation, time.perf_counter(), func, args, kwargs)
+    future.add_done_callback(_release)
+
+    wait = timeout if timeout is not None else OPERATION_TIMEOUTS.get(operation, DEFAULT_TIMEOUT)
+    try:
+        return future.result(timeout=wait)
+    except FutureTimeoutError:
+        metrics.IMAGE_POOL_REJECTED.labels(operation, 'timeout').inc()
+        logger.warning(f"Image operation {operation} did not finish within {wait:.0f}s")
+        raise ImagePoolTimeout(f"{operation} timed out after {wait:.0f}s") from None
+
+
+def pending():
+    """Operations queued or running in this process."""
+    return _pending
+
+
+def reset():
+    """Forget the executor and counters (in a freshly forked worker)."""
+    global _executor, _pending, _lock
+    _executor = None
+    _pending = 0
+    _lock = threading.Lock()
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Enforce retention on photo files and anonymous photos, so disk and database size stay bounded.
+
+Files in uploads/ and enhanced/ were only removed when a user deleted a photo. Anonymous
+photos that were never claimed, files left by failed requests and local copies of photos
+that are also stored in the database all stayed forever. Each run handles these retention
+classes (all of them unless --classes is given):
+
+  anonymous  Photos with no owner created more than JANITOR_ANONYMOUS_DAYS ago. Signup and
+             login only claim photos from the last hour. The row, its files and its
+             renditions are deleted.
+  orphans    Files in uploads/ and enhanced/ that no row references. These come from
+             requests that failed after saving (such as a leftover *_work.jpg) and from rows
+             deleted along with their user.
+  temp       *.tmp files left by interrupted atomic writes (storage.atomic_path) in
+             uploads/, enhanced/ and the rendition cache, plus chunked uploads past
+             UPLOAD_EXPIRY_HOURS.
+  local      Files not written for JANITOR_LOCAL_DAYS whose copy is in the database or in
+             cold storage (archive.py). read_photo_bytes() restores a file from there the
+             next time it is requested. Set JANITOR_LOCAL_DAYS=0 to keep local copies.
+
+Files younger than JANITOR_GRACE_HOURS are never touched, so requests still in progress keep
+theirs. Work goes in batches of --batch-size, with --pause seconds between batches, so a
+large backlog does not saturate the disk or hold long transactions. --dry-run reports what
+would be removed and changes nothing.
+
+Deletions and reclaimed bytes are counted in the janitor_* metrics. With the web server's
+PROMETHEUS_MULTIPROC_DIR set, its /metrics includes them. Otherwise --metrics-file writes
+them for a node_exporter textfile collector.
+
+Run it from the app directory, on the host that has uploads/ and enhanced/, for example hourly
+from cron or a Render cron job:
+  python janitor.py --dry-run
+  python janitor.py
+  python janitor.py --classes orphans,temp --batch-size 200 --pause 1
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, or_, select
+from dotenv import load_dotenv
+
+# Add the current directory to the path so we can import app
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# The settings below and in the imported modules are read at import, before app.py would load .env
+load_dotenv()
+
+import metrics  # noqa: E402
+import renditions  # noqa: E402
+import chunked_uploads  # noqa: E402
+from models import ArchivedPayload  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+JANITOR_ANONYMOUS_DAYS = float(os.getenv('JANITOR_ANONYMOUS_DAYS', '14'))
+JANITOR_LOCAL_DAYS = float(os.getenv('JANITOR_LOCAL_DAYS', '30'))
+JANITOR_GRACE_HOURS = float(os.getenv('JANITOR_GRACE_HOURS', '6'))
+JANITOR_BATCH_SIZE = int(os.getenv('JANITOR_BATCH_SIZE', '500'))
+JANITOR_PAUSE_SECONDS = float(os.getenv('JANITOR_PAUSE_SECONDS', '0.5'))
+
+RETENTION_CLASSES = ('anonymous', 'orphans', 'temp', 'local')
+# Signup and login link anonymous photos created within this window
+_CLAIM_WINDOW = timedelta(hours=1)
+
+
+class Janitor:
+    """One run: deletes (or, in a dry run, only counts) what is past retention."""
+
+    def __init__(self, db, photo_model, photo_dirs, classes, dry_run=False, batch_size=JANITOR_BATCH_SIZE,
+                 pause=JANITOR_PAUSE_SECONDS, now=None):
+        self.db = db
+        self.photo_model = photo_model
+        self.photo_dirs = list(photo_dirs)
+        self.classes = set(classes)
+        self.dry_run = dry_run
+        self.batch_size = max(1, batch_size)
+        self.pause = pause
+        self.now = now or time.time()
+        self.totals = {name: {'files': 0, 'rows': 0, 'disk_bytes': 0, 'db_bytes': 0}
+                       for name in RETENTION_CLASSES}
+        # A dry run leaves files in place; count each under the first class that claims it
+        self._dry_run_removed = set()
+
+    def run(self):
+        if 'anonymous' in self.classes:
+            self.purge_anonymous()
+        if self.classes & {'orphans', 'local', 'temp'}:
+            self.sweep_files()
+        if 'temp' in self.classes:
+            for path in list(chunked_uploads.expired_files(self.now)):
+                self.remove_file('temp', path)
+        if not self.dry_run:
+            metrics.JANITOR_LAST_RUN.set(time.time())
+        return self.totals
+
+    def _sleep(self):
+        if self.pause > 0:
+            time.sleep(self.pause)
+
+    def remove_file(self, retention_class, path):
+        if path in self._dry_run_removed:
+            return
+        try:
+            size = os.path.getsize(path)
+            if not self.dry_run:
+                os.remove(path)
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logger.warning(f"Could not remove {path}: {e}")
+            return
+        if self.dry_run:
+            self._dry_run_removed.add(path)
+        totals = self.totals[retention_class]
+        totals['files'] += 1
+        totals['disk_bytes'] += size
+        if not self.dry_run:
+            metrics.JANITOR_DELETED.labels(retention_class, 'file').inc()
+            metrics.JANITOR_RECLAIMED_BYTES.labels(retention_class, 'disk').inc(size)
+
+    def _stored_size(self, column):
+        # pg_column_size reads the TOAST pointer; length() would fetch and decompress the value
+        if self.db.engine.dialect.name == 'postgresql':
+            return func.coalesce(func.pg_column_size(column), 0)
+        return func.coalesce(func.length(column), 0)
+
+    def purge_anonymous(self):
+        """Delete unclaimed anonymous photos past JANITOR_ANONYMOUS_DAYS with their files."""
+        Photo = self.photo_model
+        session = self.db.session
+        retention = max(timedelta(days=JANITOR_ANONYMOUS_DAYS), _CLAIM_WINDOW)
+        cutoff = datetime.utcfromtimestamp(self.now) - retention
+        expired = [Photo.user_id.is_(None), Photo.created_at < cutoff]
+        last_id = 0
+        while True:
+            rows = session.execute(
+                select(Photo.id, Photo.original_path, Photo.enhanced_path,
+                       self._stored_size(Photo.original_image_data)
+                       + self._stored_size(Photo.enhanced_image_data))
+                .where(*expired, Photo.id > last_id)
+                .order_by(Photo.id)
+                .limit(self.batch_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            ids = [row.id for row in rows]
+
+            if not self.dry_run:
+                # Rows go first: if removing a file fails, the orphans class picks it up later
+                claimed = select(Photo.id).where(Photo.id.in_(ids), *expired)
+                session.execute(delete(ArchivedPayload).where(ArchivedPayload.photo_id.in_(claimed)))
+                session.execute(delete(Photo).where(Photo.id.in_(ids), *expired))
+                session.commit()
+                remaining = set(session.scalars(select(Photo.id).where(Photo.id.in_(ids))))
+                rows = [row for row in rows if row.id not in remaining]
+
+            totals = self.totals['anonymous']
+            db_bytes = sum(row[3] for row in rows)
+            totals['rows'] += len(rows)
+            totals['db_bytes'] += db_bytes
+            if not self.dry_run:
+                metrics.JANITOR_DELETED.labels('anonymous', 'row').inc(len(rows))
+                metrics.JANITOR_RECLAIMED_BYTES.labels('anonymous', 'db').inc(db_bytes)
+            for row in rows:
+                self.remove_file('anonymous', row.original_path)
+                self.remove_file('anonymous', row.enhanced_path)
+                if not self.dry_run:
+                    try:
+                        renditions.discard(row.id)
+                    except OSError as e:
+                        logger.warning(f"Failed to delete renditions of photo {row.id}: {e}")
+            logger.info(f"anonymous: {'found' if self.dry_run else 'deleted'} {len(rows)} photos")
+            self._sleep()
+
+    def _references(self, paths):
+        """{path: True if the database or cold storage holds a copy} for the paths some row uses."""
+        Photo = self.photo_model
+        rows = self.db.session.execute(
+            select(Photo.original_path, Photo.enhanced_path,
+                   Photo.archived_at.isnot(None) | Photo.original_image_data.isnot(None),
+                   Photo.archived_at.isnot(None) | Photo.enhanced_image_data.isnot(None))
+            .where(or_(Photo.original_path.in_(paths), Photo.enhanced_path.in_(paths)))
+        ).all()
+        references = {}
+        for original_path, enhanced_path, has_original, has_enhanced in rows:
+            for path, in_db in ((original_path, has_original), (enhanced_path, has_enhanced)):
+                # Near-duplicate reuse can point several rows at one file; keep it unless all have a copy
+                references[path] = references.get(path, True) and bool(in_db)
+        return references
+
+    def sweep_files(self):
+        """Walk the storage directories for temp, orphaned and database-backed files."""
+        grace_cutoff = self.now - JANITOR_GRACE_HOURS * 3600
+        local_cutoff = self.now - JANITOR_LOCAL_DAYS * 86400 if JANITOR_LOCAL_DAYS > 0 else None
+        check_rows = bool(self.classes & {'orphans', 'local'})
+        roots = self.photo_dirs + ([renditions.RENDITION_DIR] if 'temp' in self.classes else [])
+
+        batch = []
+        for root in roots:
+            for dirpath, _, filenames in os.walk(root):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        mtime = os.stat(path).st_mtime
+                    except FileNotFoundError:
+                        continue
+                    if mtime >= grace_cutoff:
+                        continue
+                    if name.endswith('.tmp'):
+                        if 'temp' in self.classes:
+                            self.remove_file('temp', path)
+                    elif check_rows and root in self.photo_dirs:
+                        batch.append((path, mtime))
+                        if len(batch) >= self.batch_size:
+                            self._sweep_batch(batch, local_cutoff)
+                            batch = []
+        if batch:
+            self._sweep_batch(batch, local_cutoff)
+
+    def _sweep_batch(self, batch, local_cutoff):
+        references = self._references([path for path, _ in batch])
+        self.db.session.rollback()  # End the read transaction between batches
+        for path, mtime in batch:
+            if path not in references:
+                if 'orphans' in self.classes:
+                    self.remove_file('orphans', path)
+            elif 'local' in self.classes and references[path] and local_cutoff and mtime < local_cutoff:
+                self.remove_file('local', path)
+        self._sleep()
+
+
+def print_report(totals, dry_run):
+    print(f"{'Would remove' if dry_run else 'Removed'}:")
+    print(f"{'class':<10} {'rows':>8} {'files':>8} {'disk MB':>10} {'db MB':>10}")
+    print('-' * 50)
+    for name, t in totals.items():
+        print(f"{name:<10} {t['rows']:>8} {t['files']:>8} {t['disk_bytes'] / 1e6:>10.1f} {t['db_bytes'] / 1e6:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Delete photo files and anonymous photos past retention')
+    parser.add_argument('--dry-run', action='store_true', help='Report what would be removed, change nothing')
+    parser.add_argument('--classes', default=','.join(RETENTION_CLASSES),
+                        help=f"Comma-separated retention classes to apply (default: all of {', '.join(RETENTION_CLASSES)})")
+    parser.add_argument('--batch-size', type=int, default=JANITOR_BATCH_SIZE, help='Rows or files per batch')
+    parser.add_argument('--pause', type=float, default=JANITOR_PAUSE_SECONDS, help='Seconds to sleep between batches')
+    parser.add_argument('--metrics-file', default=None,
+                        help='Write the janitor metrics here in Prometheus text format (node_exporter textfile collector)')
+    args = parser.parse_args()
+
+    classes = [name.strip() for name in args.classes.split(',') if name.strip()]
+    unknown = sorted(set(classes) - set(RETENTION_CLASSES))
+    if unknown:
+        parser.error(f"unknown retention class: {', '.join(unknown)}")
+
+    # Importing the app must not migrate; migrate.py does that as the release step
+    os.environ['AUTO_MIGRATE'] = 'False'
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    from app import app, db, UPLOAD_FOLDER, ENHANCED_FOLDER
+    from models import EnhancedImage
+
+    with app.app_context():
+        janitor = Janitor(db, EnhancedImage, (UPLOAD_FOLDER, ENHANCED_FOLDER), classes, dry_run=args.dry_run,
+                          batch_size=args.batch_size, pause=args.pause)
+        try:
+            totals = janitor.run()
+        except Exception as e:
+            print(f"Janitor failed: {e}")
+            import traceback
+            traceback.print_exc()
+            return 1
+    print_report(totals, args.dry_run)
+
+    if args.metrics_file and not args.dry_run:
+        import storage
+        from prometheus_client import REGISTRY, generate_latest
+        names = [f'janitor_{name}' for name in ('deleted_total', 'reclaimed_bytes_total', 'last_run_timestamp_seconds')]
+        storage.write_atomic(args.metrics_file, generate_latest(REGISTRY.restricted_registry(names)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
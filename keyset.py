@@ -0,0 +1,152 @@
+"""
+Keyset (cursor) pagination for the photo and user lists.
+
+OFFSET pagination reads and throws away every row before the page it returns, and
+paginate() adds a COUNT(*) over the whole filter for pagination.total. Page 200 of a
+power user's gallery, or of the anonymous photos, cost far more than page 1.
+
+Lists are ordered by (created_at DESC, id DESC) instead, and a page starts right after
+the last row of the page before it:
+
+    WHERE created_at <= :t AND (created_at < :t OR id < :id)
+    ORDER BY created_at DESC, id DESC LIMIT :per_page + 1
+
+With an index ending in (created_at DESC, id DESC) (migration 7) every page is one short
+index range scan, however deep. The extra row tells whether there is a next page.
+Previous pages run the same query in the other direction and reverse the rows.
+
+Cursors are opaque to clients: URL-safe base64 of JSON holding the boundary row, the
+direction and the number of the page it leads to (for "Page 3 of 40" labels). They only
+position a query that is already filtered to what the caller may see, so they are not
+signed. Anything that does not decode raises InvalidCursor.
+
+Totals are optional. count() stops after PAGINATION_COUNT_CAP rows, so it stays cheap on
+the longest lists and is exact for all the others.
+"""
+
+import os
+import json
+import math
+import base64
+import binascii
+from datetime import datetime
+
+from sqlalchemy import func, or_
+
+PAGINATION_COUNT_CAP = int(os.getenv('PAGINATION_COUNT_CAP', '10000'))
+
+
+class InvalidCursor(ValueError):
+    """A cursor parameter that this module did not produce."""
+
+
+class Page:
+    """One page of rows plus the cursors for its neighbours.
+
+    total and total_exact stay None unless the rows were counted.
+    """
+
+    def __init__(self, items, per_page, page=1, has_next=False, has_prev=False,
+                 next_cursor=None, prev_cursor=None, total=None, total_exact=None):
+        self.items = items
+        self.per_page = per_page
+        self.page = page
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+        self.total_exact = total_exact
+
+    @property
+    def pages(self):
+        """Number of pages from total, or None if no total was counted."""
+        if self.total is None:
+            return None
+        return max(1, math.ceil(self.total / self.per_page), self.page)
+
+    def as_dict(self):
+        """The pagination block of an API response."""
+        return {
+            'page': self.page,
+            'per_page': self.per_page,
+            'has_next': self.has_next,
+            'has_prev': self.has_prev,
+            'next_cursor': self.next_cursor,
+            'prev_cursor': self.prev_cursor,
+            'total': self.total,
+            'total_exact': self.total_exact,
+            'pages': self.pages,
+        }
+
+
+def encode_cursor(created_at, row_id, direction, page):
+    payload = json.dumps({'t': created_at.isoformat(), 'id': row_id, 'd': direction, 'p': page},
+                         separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(created_at, id, direction, page) from a cursor. Raises InvalidCursor."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        position = (datetime.fromisoformat(payload['t']), int(payload['id']), payload['d'], int(payload['p']))
+    except (ValueError, TypeError, KeyError, binascii.Error):
+        raise InvalidCursor(f'Invalid cursor: {cursor[:40]!r}')
+    if position[2] not in ('next', 'prev') or position[3] < 1:
+        raise InvalidCursor(f'Invalid cursor: {cursor[:40]!r}')
+    return position
+
+
+def count(query, model, cap=PAGINATION_COUNT_CAP):
+    """(total, exact) for the rows `query` matches, counting at most cap + 1 of them."""
+    limited = query.with_entities(model.id).order_by(None).limit(cap + 1).subquery()
+    total = query.session.query(func.count()).select_from(limited).scalar()
+    return min(total, cap), total <= cap
+
+
+def paginate(query, model, per_page, cursor=None, with_total=False):
+    """The page of `query` that `cursor` points at (the first page if None).
+
+    `query` is filtered but not ordered; `model` needs created_at and id columns.
+    Raises InvalidCursor for a cursor that does not decode.
+    """
+    created_at, row_id = model.created_at, model.id
+    page_number, backwards, position = 1, False, None
+    if cursor:
+        position = decode_cursor(cursor)
+        boundary_time, boundary_id, direction, page_number = position
+        backwards = direction == 'prev'
+        # The first condition alone bounds the index range scan; the second skips ties
+        if backwards:
+            ordered = query.filter(created_at >= boundary_time,
+                                   or_(created_at > boundary_time, row_id > boundary_id))
+        else:
+            ordered = query.filter(created_at <= boundary_time,
+                                   or_(created_at < boundary_time, row_id < boundary_id))
+    else:
+        ordered = query
+    if backwards:
+        ordered = ordered.order_by(created_at.asc(), row_id.asc())
+    else:
+        ordered = ordered.order_by(created_at.desc(), row_id.desc())
+
+    rows = ordered.limit(per_page + 1).all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+        has_prev, has_next = more, bool(rows)
+        if not has_prev:
+            page_number = 1
+    else:
+        has_prev, has_next = position is not None and bool(rows), more
+
+    page = Page(rows, per_page, page=page_number, has_next=has_next, has_prev=has_prev)
+    if has_next:
+        page.next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id, 'next', page_number + 1)
+    if has_prev:
+        page.prev_cursor = encode_cursor(rows[0].created_at, rows[0].id, 'prev', max(1, page_number - 1))
+    if with_total:
+        page.total, page.total_exact = count(query, model)
+    return page
@@ -0,0 +1,188 @@
+import os
+import time
+import logging
+from contextlib import contextmanager
+from functools import wraps
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest
+)
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+# With PROMETHEUS_MULTIPROC_DIR set (gunicorn.conf.py does this), every worker writes its
+# samples to mmap files in that directory and /metrics aggregates them across workers.
+MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+BYTES_BUCKETS = (16e3, 64e3, 256e3, 1e6, 2e6, 4e6, 8e6, 16e6, 32e6)
+
+# HTTP
+HTTP_REQUESTS = Counter(
+    'http_requests_total', 'HTTP requests by endpoint, method and status',
+    ['endpoint', 'method', 'status'])
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by endpoint',
+    ['endpoint', 'method'], buckets=LATENCY_BUCKETS)
+REQUEST_STAGE_SECONDS = Histogram(
+    'request_stage_duration_seconds', 'Duration of instrumented request stages',
+    ['endpoint', 'stage'], buckets=LATENCY_BUCKETS)
+
+# AI backend
+AI_REQUEST_SECONDS = Histogram(
+    'ai_request_duration_seconds', 'AI backend call latency',
+    ['operation', 'model'], buckets=LATENCY_BUCKETS)
+AI_REQUESTS = Counter(
+    'ai_requests_total', 'AI backend calls by outcome (ok, no_image, rate_limited, error)',
+    ['operation', 'model', 'outcome'])
+AI_PAYLOAD_BYTES = Histogram(
+    'ai_payload_bytes', 'Image payload size sent to / received from the AI backend',
+    ['operation', 'model', 'direction'], buckets=BYTES_BUCKETS)
+AI_IN_FLIGHT = Gauge(
+    'ai_in_flight_requests', 'AI backend calls currently waiting for a response',
+    multiprocess_mode='livesum')
+
+# ASGI serving mode (asgi.py)
+ASGI_REQUESTS_IN_FLIGHT = Gauge(
+    'asgi_requests_in_flight', 'Requests running on or waiting for the ASGI request thread pool',
+    multiprocess_mode='livesum')
+
+# Image processing
+IMAGE_OPERATION_SECONDS = Histogram(
+    'image_operation_duration_seconds', 'CPU-bound image operations (normalize, watermark, rendition)',
+    ['operation'], buckets=LATENCY_BUCKETS)
+
+IMAGE_POOL_QUEUE_DEPTH = Gauge(
+    'image_pool_queue_depth', 'Image operations waiting for an image pool thread',
+    multiprocess_mode='livesum')
+IMAGE_POOL_ACTIVE = Gauge(
+    'image_pool_active', 'Image operations running on the image pool',
+    multiprocess_mode='livesum')
+IMAGE_POOL_WAIT_SECONDS = Histogram(
+    'image_pool_wait_seconds', 'Time image operations spent queued for a pool thread',
+    ['operation'], buckets=FAST_BUCKETS)
+IMAGE_POOL_REJECTED = Counter(
+    'image_pool_rejected_total', 'Image operations refused (busy) or abandoned (timeout)',
+    ['operation', 'reason'])
+
+# Database
+DB_POOL_CHECKOUT_WAIT_SECONDS = Histogram(
+    'db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled DB connection',
+    buckets=FAST_BUCKETS)
+DB_POOL_IN_USE = Gauge(
+    'db_pool_connections_in_use', 'DB connections currently checked out of the pool',
+    multiprocess_mode='livesum')
+DB_RETRIES = Counter(
+    'db_retries_total', 'Retries performed by retry_db_operation', ['reason'])
+DB_QUERIES_PER_REQUEST = Histogram(
+    'db_queries_per_request', 'SQL statements issued per request',
+    ['endpoint'], buckets=(1, 2, 3, 5, 10, 20, 50, 100, 250))
+DB_SLOW_QUERIES = Counter(
+    'db_slow_queries_total', 'Statements slower than SLOW_QUERY_MS')
+DB_REPEATED_STATEMENTS = Counter(
+    'db_repeated_statements_total', 'Statement shapes repeated past REPEATED_QUERY_THRESHOLD in one request',
+    ['endpoint'])
+
+# Caches
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', 'Cache lookups by cache and result (hit, miss)', ['cache', 'result'])
+
+# Payments
+PAYMENT_EVENTS = Counter(
+    'payment_events_total', 'Payment lifecycle events', ['event'])
+STRIPE_API_SECONDS = Histogram(
+    'stripe_api_duration_seconds', 'Stripe API call latency', ['operation'], buckets=LATENCY_BUCKETS)
+
+# Cold storage (cold_storage.py, archive.py)
+COLD_STORAGE_READS = Counter(
+    'cold_storage_reads_total', 'Archived images read back from cold storage by outcome (ok, error)',
+    ['outcome'])
+COLD_STORAGE_READ_SECONDS = Histogram(
+    'cold_storage_read_duration_seconds', 'Time to fetch and decompress one archived image',
+    buckets=LATENCY_BUCKETS)
+COLD_STORAGE_ARCHIVED_BYTES = Counter(
+    'cold_storage_archived_bytes_total',
+    'Bytes moved by archive.py by store (db: base64 cleared from the database, pack: written to packs)',
+    ['store'])
+
+# Storage janitor (janitor.py)
+JANITOR_DELETED = Counter(
+    'janitor_deleted_total', 'Files and rows deleted by janitor.py by retention class',
+    ['retention_class', 'kind'])
+JANITOR_RECLAIMED_BYTES = Counter(
+    'janitor_reclaimed_bytes_total', 'Bytes freed by janitor.py by retention class and store (disk, db)',
+    ['retention_class', 'store'])
+JANITOR_LAST_RUN = Gauge(
+    'janitor_last_run_timestamp_seconds', 'When janitor.py last finished a run (dry runs are not recorded)',
+    multiprocess_mode='max')
+
+
+def observe_request(endpoint, method, status, seconds):
+    HTTP_REQUESTS.labels(endpoint, method, str(status)).inc()
+    HTTP_REQUEST_SECONDS.labels(endpoint, method).observe(seconds)
+
+
+def observe_stage(endpoint, stage, seconds):
+    REQUEST_STAGE_SECONDS.labels(endpoint, stage).observe(seconds)
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+@contextmanager
+def time_histogram(histogram, *labels):
+    """Observe the duration of a block on a (labelled) histogram."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        target = histogram.labels(*labels) if labels else histogram
+        target.observe(time.perf_counter() - start)
+
+
+def timed(histogram, *labels):
+    """Decorator form of time_histogram."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with time_histogram(histogram, *labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_WAIT_SECONDS.observe(time.perf_counter() - start)
+
+
+def instrument_engine(engine):
+    """Track checked-out connections on the engine's pool."""
+    @event.listens_for(engine.pool, 'checkout')
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_IN_USE.inc()
+
+    @event.listens_for(engine.pool, 'checkin')
+    def _on_checkin(dbapi_connection, connection_record):
+        DB_POOL_IN_USE.dec()
+
+
+def render_latest():
+    """Return (body, content_type) for the /metrics endpoint."""
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
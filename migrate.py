@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Create missing tables and apply pending schema migrations.
+
+Runs as the release step (Procfile `release:`, or Render's pre-deploy command), so web
+workers only compare the schema version at startup instead of migrating.
+
+Usage:
+  python migrate.py           # apply pending migrations
+  python migrate.py --check   # exit 1 if migrations are pending, change nothing
+"""
+
+import os
+import sys
+import logging
+import argparse
+
+# Add the current directory to the path so we can import app
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply database schema migrations')
+    parser.add_argument('--check', action='store_true', help='Only report whether migrations are pending')
+    args = parser.parse_args()
+
+    # Importing the app runs its startup schema check; keep it read-only so this script does the work
+    os.environ['AUTO_MIGRATE'] = 'False'
+    logging.getLogger('app').addFilter(lambda record: 'migrate.py' not in record.getMessage())
+    from app import app, db
+    import migrations
+
+    with app.app_context():
+        version = migrations.current_version(db.engine)
+        print(f"Schema version: {version} (latest {migrations.LATEST_VERSION})")
+        if args.check:
+            if version < migrations.LATEST_VERSION:
+                print("Migrations pending")
+                return 1
+            print("Schema up to date")
+            return 0
+
+        try:
+            applied = migrations.upgrade(db.engine, db.metadata)
+        except Exception as e:
+            print(f"Migration failed: {e}")
+            import traceback
+            traceback.print_exc()
+            return 1
+        if applied:
+            print(f"Applied migrations: {', '.join(str(v) for v in applied)}")
+        else:
+            print("Nothing to apply")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,222 @@
+"""
+Versioned schema migrations.
+
+Each migration runs once per database and is recorded in the schema_version table.
+Migrations must be idempotent (IF NOT EXISTS, column checks), because databases created
+before this module existed already have some of the changes that the ad-hoc checks
+made at import time.
+
+Add a migration by appending to MIGRATIONS with the next version number. Never
+renumber or edit a migration that has shipped.
+"""
+
+import logging
+from datetime import datetime
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for pg_advisory_lock so only one process migrates at a time
+ADVISORY_LOCK_KEY = 482_113_907
+
+
+def _add_column(conn, table, column, ddl_sqlite, ddl_postgres=None):
+    columns = [col['name'] for col in inspect(conn).get_columns(table)]
+    if column in columns:
+        return
+    logger.info(f"Adding {column} column to {table} table...")
+    if conn.dialect.name == 'postgresql' and ddl_postgres:
+        conn.execute(text(ddl_postgres))
+    else:
+        conn.execute(text(ddl_sqlite))
+
+
+def create_index(conn, name, table, columns, where=None):
+    """CREATE INDEX IF NOT EXISTS, CONCURRENTLY on Postgres so writes are not blocked.
+
+    A failed concurrent build leaves an INVALID index behind. It is dropped and rebuilt.
+    """
+    where_clause = f" WHERE {where}" if where else ""
+    if conn.dialect.name == 'postgresql':
+        invalid = conn.execute(text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ), {'name': name}).first()
+        if invalid:
+            logger.warning(f"Dropping invalid index {name} left by an interrupted build")
+            conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {name}'))
+        conn.execute(text(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON "{table}" ({columns}){where_clause}'))
+    else:
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns}){where_clause}'))
+
+
+def _legacy_columns(conn):
+    """Columns previously added by the import-time inspector checks in app.py."""
+    tables = inspect(conn).get_table_names()
+    if 'user' in tables:
+        _add_column(conn, 'user', 'is_admin',
+                    'ALTER TABLE user ADD COLUMN is_admin BOOLEAN DEFAULT 0',
+                    'ALTER TABLE "user" ADD COLUMN is_admin BOOLEAN DEFAULT FALSE')
+        _add_column(conn, 'user', 'has_free_access',
+                    'ALTER TABLE user ADD COLUMN has_free_access BOOLEAN DEFAULT 0',
+                    'ALTER TABLE "user" ADD COLUMN has_free_access BOOLEAN DEFAULT FALSE')
+    if 'enhanced_image' in tables:
+        _add_column(conn, 'enhanced_image', 'original_image_data',
+                    'ALTER TABLE enhanced_image ADD COLUMN original_image_data TEXT')
+        _add_column(conn, 'enhanced_image', 'enhanced_image_data',
+                    'ALTER TABLE enhanced_image ADD COLUMN enhanced_image_data TEXT')
+        _add_column(conn, 'enhanced_image', 'conversion_type',
+                    'ALTER TABLE enhanced_image ADD COLUMN conversion_type VARCHAR(20) DEFAULT "enhancement"',
+                    'ALTER TABLE "enhanced_image" ADD COLUMN conversion_type VARCHAR(20) DEFAULT \'enhancement\'')
+
+
+def _perceptual_hash(conn):
+    _add_column(conn, 'enhanced_image', 'perceptual_hash',
+                'ALTER TABLE enhanced_image ADD COLUMN perceptual_hash VARCHAR(16)')
+    create_index(conn, 'ix_enhanced_image_user_phash', 'enhanced_image', 'user_id, perceptual_hash')
+
+
+# Indexes for the hottest filters. Payment.stripe_session_id (webhooks, payment_success)
+# is already covered by the unique constraint declared on the column.
+HOT_QUERY_INDEXES = (
+    # /api/photos and the admin user page: WHERE user_id = ? ORDER BY created_at DESC
+    ('ix_enhanced_image_user_created', 'enhanced_image', 'user_id, created_at DESC', None),
+    # Linking anonymous uploads after login / checkout: WHERE user_id IS NULL AND created_at >= ?
+    ('ix_enhanced_image_anonymous_created', 'enhanced_image', 'created_at', 'user_id IS NULL'),
+    # check_photo_payment / check-status: WHERE user_id = ? AND status = ? ORDER BY completed_at DESC
+    ('ix_payment_user_status_completed', 'payment', 'user_id, status, completed_at', None),
+)
+
+
+def _hot_query_indexes(conn):
+    for name, table, columns, where in HOT_QUERY_INDEXES:
+        create_index(conn, name, table, columns, where)
+
+
+def _content_digests(conn):
+    # Left NULL for existing rows; the photo endpoints backfill them on first serve
+    for column in ('original_sha256', 'enhanced_sha256'):
+        _add_column(conn, 'enhanced_image', column,
+                    f'ALTER TABLE enhanced_image ADD COLUMN {column} VARCHAR(64)')
+
+
+def _photo_path_indexes(conn):
+    # janitor.py looks up which rows reference the files it finds on disk
+    create_index(conn, 'ix_enhanced_image_original_path', 'enhanced_image', 'original_path')
+    create_index(conn, 'ix_enhanced_image_enhanced_path', 'enhanced_image', 'enhanced_path')
+
+
+def _cold_storage(conn):
+    # The archived_payload table itself is created by metadata.create_all() in upgrade()
+    _add_column(conn, 'enhanced_image', 'archived_at',
+                'ALTER TABLE enhanced_image ADD COLUMN archived_at TIMESTAMP')
+    _add_column(conn, 'enhanced_image', 'last_accessed_at',
+                'ALTER TABLE enhanced_image ADD COLUMN last_accessed_at TIMESTAMP')
+
+
+# Keyset pagination (keyset.py) orders by (created_at DESC, id DESC). These replace the
+# migration 3 indexes on enhanced_image, which stop at created_at.
+KEYSET_INDEXES = (
+    # /api/photos and the admin user page: WHERE user_id = ? ORDER BY created_at DESC, id DESC
+    ('ix_enhanced_image_user_created_id', 'enhanced_image', 'user_id, created_at DESC, id DESC', None),
+    # Admin anonymous photos, and the anonymous-upload linking range scan
+    ('ix_enhanced_image_anonymous_created_id', 'enhanced_image', 'created_at DESC, id DESC', 'user_id IS NULL'),
+    # Admin dashboard user list
+    ('ix_user_created_id', 'user', 'created_at DESC, id DESC', None),
+)
+SUPERSEDED_INDEXES = ('ix_enhanced_image_user_created', 'ix_enhanced_image_anonymous_created')
+
+
+def _keyset_indexes(conn):
+    # Rows without created_at would drop out of keyset pages; date them to the migration
+    for table in ('enhanced_image', 'user'):
+        conn.execute(text(f'UPDATE "{table}" SET created_at = :now WHERE created_at IS NULL'),
+                     {'now': datetime.utcnow()})
+    for name, table, columns, where in KEYSET_INDEXES:
+        create_index(conn, name, table, columns, where)
+    concurrently = ' CONCURRENTLY' if conn.dialect.name == 'postgresql' else ''
+    for name in SUPERSEDED_INDEXES:
+        conn.execute(text(f'DROP INDEX{concurrently} IF EXISTS {name}'))
+
+
+def _duplicate_lookup_index(conn):
+    # find_near_duplicate() filters on the user and the enhancement settings and reads
+    # (id, perceptual_hash); with id last, this index answers it without reading the table
+    create_index(conn, 'ix_enhanced_image_user_settings_phash', 'enhanced_image',
+                 'user_id, conversion_type, change_intensity, detail_level, perceptual_hash, id')
+    concurrently = ' CONCURRENTLY' if conn.dialect.name == 'postgresql' else ''
+    conn.execute(text(f'DROP INDEX{concurrently} IF EXISTS ix_enhanced_image_user_phash'))
+
+
+# (version, name, function). Functions receive an autocommit connection.
+MIGRATIONS = [
+    (1, 'legacy_columns', _legacy_columns),
+    (2, 'perceptual_hash', _perceptual_hash),
+    (3, 'hot_query_indexes', _hot_query_indexes),
+    (4, 'content_digests', _content_digests),
+    (5, 'photo_path_indexes', _photo_path_indexes),
+    (6, 'cold_storage', _cold_storage),
+    (7, 'keyset_indexes', _keyset_indexes),
+    (8, 'duplicate_lookup_index', _duplicate_lookup_index),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_version ('
+        'version INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, applied_at TIMESTAMP NOT NULL)'
+    ))
+
+
+def current_version(engine):
+    """Highest applied migration version, or 0 if none (or no schema_version table).
+
+    A single round trip, cheap enough to run on every worker start.
+    """
+    try:
+        with engine.connect() as conn:
+            return conn.execute(text('SELECT MAX(version) FROM schema_version')).scalar() or 0
+    except (OperationalError, ProgrammingError):
+        # Table does not exist yet
+        return 0
+
+
+def run_migrations(engine):
+    """Apply pending migrations in order. Returns the list of versions applied."""
+    applied_now = []
+    # Autocommit: CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        is_postgres = conn.dialect.name == 'postgresql'
+        if is_postgres:
+            conn.execute(text('SELECT pg_advisory_lock(:key)'), {'key': ADVISORY_LOCK_KEY})
+        try:
+            _ensure_version_table(conn)
+            applied = {row[0] for row in conn.execute(text('SELECT version FROM schema_version'))}
+            for version, name, migrate in MIGRATIONS:
+                if version in applied:
+                    continue
+                logger.info(f"Applying migration {version} ({name})...")
+                migrate(conn)
+                try:
+                    conn.execute(
+                        text('INSERT INTO schema_version (version, name, applied_at) VALUES (:v, :n, :t)'),
+                        {'v': version, 'n': name, 't': datetime.utcnow()}
+                    )
+                except IntegrityError:
+                    # Another process (SQLite has no advisory lock) recorded it first
+                    pass
+                applied_now.append(version)
+                logger.info(f"Applied migration {version} ({name})")
+        finally:
+            if is_postgres:
+                conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': ADVISORY_LOCK_KEY})
+    return applied_now
+
+
+def upgrade(engine, metadata):
+    """Create missing tables, then apply pending migrations. Returns the versions applied."""
+    metadata.create_all(engine)
+    return run_migrations(engine)
@@ -20,6 +20,11 @@ class User(UserMixin, db.Model):
     # Relationship to enhanced images
     enhanced_images = db.relationship('EnhancedImage', backref='user', lazy=True, cascade='all, delete-orphan')
     
+    # Created on existing databases by migrations.py (version 7)
+    __table_args__ = (
+        db.Index('ix_user_created_id', created_at.desc(), id.desc()),
+    )
+    
     def __repr__(self):
         return f'<User {self.username}>'
 
@@ -51,9 +56,33 @@ class EnhancedImage(db.Model):
     enhancement_settings = db.Column(db.Text)  # JSON string of enhancement details
     ai_analysis = db.Column(db.Text)  # AI analysis/response from AI service
     
+    # SHA-256 (hex) of the stored original and enhanced files; strong ETags for the photo endpoints.
+    # Filled at creation, and on first serve for rows created before migration 4
+    original_sha256 = db.Column(db.String(64), nullable=True)
+    enhanced_sha256 = db.Column(db.String(64), nullable=True)
+    
+    # Perceptual hash (dHash, hex) of the processed upload, used to find near-duplicate re-uploads
+    perceptual_hash = db.Column(db.String(16), nullable=True)
+    
+    # Cold storage (archive.py): when the base64 payloads were moved to pack files and cleared
+    # here, and when an image of the photo was last served (stamped at most once a day)
+    archived_at = db.Column(db.DateTime, nullable=True)
+    last_accessed_at = db.Column(db.DateTime, nullable=True)
+    
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Created on existing databases by migrations.py (versions 5, 7 and 8)
+    __table_args__ = (
+        db.Index('ix_enhanced_image_user_settings_phash', 'user_id', 'conversion_type', 'change_intensity',
+                 'detail_level', 'perceptual_hash', 'id'),
+        db.Index('ix_enhanced_image_user_created_id', 'user_id', created_at.desc(), id.desc()),
+        db.Index('ix_enhanced_image_anonymous_created_id', created_at.desc(), id.desc(),
+                 postgresql_where=user_id.is_(None), sqlite_where=user_id.is_(None)),
+        db.Index('ix_enhanced_image_original_path', 'original_path'),
+        db.Index('ix_enhanced_image_enhanced_path', 'enhanced_path'),
+    )
+    
     def to_dict(self):
         """Convert model to dictionary for JSON serialization"""
         return {
@@ -77,6 +106,23 @@ class EnhancedImage(db.Model):
         return f'<EnhancedImage {self.original_filename} -> {self.enhanced_filename}>'
 
 
+class ArchivedPayload(db.Model):
+    """Where an image moved out of EnhancedImage by archive.py sits in cold storage"""
+    photo_id = db.Column(db.Integer, db.ForeignKey('enhanced_image.id', ondelete='CASCADE'), primary_key=True)
+    source = db.Column(db.String(10), primary_key=True)  # 'original' or 'enhanced'
+    
+    # Pack file key on the cold storage backend, and the compressed entry's byte range in it
+    pack = db.Column(db.String(100), nullable=False)
+    pack_offset = db.Column(db.BigInteger, nullable=False)
+    length = db.Column(db.Integer, nullable=False)
+    size = db.Column(db.Integer, nullable=False)  # uncompressed bytes
+    
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ArchivedPayload {self.photo_id}/{self.source} in {self.pack}>'
+
+
 class Payment(db.Model):
     """Model to track Stripe payments for photo downloads"""
     id = db.Column(db.Integer, primary_key=True)
@@ -94,6 +140,11 @@ class Payment(db.Model):
     # Relationship
     user = db.relationship('User', backref='payments')
     
+    # Created on existing databases by migrations.py (version 3)
+    __table_args__ = (
+        db.Index('ix_payment_user_status_completed', 'user_id', 'status', 'completed_at'),
+    )
+    
     def to_dict(self):
         """Convert model to dictionary for JSON serialization"""
         return {
@@ -0,0 +1,30 @@
+from PIL import Image
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> str:
+    """Compute a difference hash (dHash) for an image.
+
+    The image is shrunk to (hash_size + 1) x hash_size grayscale pixels and each bit
+    records whether a pixel is brighter than its right neighbour. Re-compressed or
+    resized copies of the same photo produce hashes a few bits apart.
+
+    Returns the hash as a zero-padded hex string (16 chars for the default size).
+    """
+    if image.mode not in ('L', 'RGB', 'RGBA'):
+        image = image.convert('RGB')
+    small = image.resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    pixels = list(small.convert('L').getdata())
+
+    bits = 0
+    row_width = hash_size + 1
+    for row in range(hash_size):
+        offset = row * row_width
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+
+    return f'{bits:0{hash_size * hash_size // 4}x}'
+
+
+def hamming_distance(hash_a: str, hash_b: str) -> int:
+    """Number of differing bits between two hex-encoded hashes."""
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count('1')
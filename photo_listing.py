@@ -0,0 +1,63 @@
+"""
+Slim rows for photo listings (/api/photos).
+
+EnhancedImage.to_dict() works on a full ORM instance. For a listing that means loading
+every column of every row, the base64 payloads included, parsing enhancement_settings as
+JSON, and returning ai_analysis (the model's whole text response) and the server file
+paths, none of which the gallery shows.
+
+The listing selects LISTING_FIELDS as plain row tuples instead, plus what the
+availability check needs: enhanced_path, archived_at, and whether there is a database
+copy as an IS NOT NULL expression, so the payload itself is never read. to_dicts() turns
+the tuples into dicts in one pass. OPTIONAL_FIELDS are selected, and
+enhancement_settings parsed, only when a client names them in fields=.
+"""
+
+import json
+
+from models import EnhancedImage
+
+# In every listing row, in this order
+LISTING_FIELDS = (
+    'id', 'original_filename', 'original_file_size', 'enhanced_filename', 'enhanced_file_size',
+    'conversion_type', 'change_intensity', 'detail_level', 'created_at',
+)
+# Only when requested with fields=
+OPTIONAL_FIELDS = ('enhancement_settings', 'ai_analysis')
+
+
+class UnknownField(ValueError):
+    """A fields= value that names something other than OPTIONAL_FIELDS."""
+
+
+def parse_fields(value):
+    """The OPTIONAL_FIELDS named in a comma-separated fields= value. Raises UnknownField."""
+    names = [name.strip() for name in (value or '').split(',') if name.strip()]
+    unknown = [name for name in names if name not in OPTIONAL_FIELDS]
+    if unknown:
+        raise UnknownField(f"Unknown fields: {', '.join(unknown)} (allowed: {', '.join(OPTIONAL_FIELDS)})")
+    return tuple(name for name in OPTIONAL_FIELDS if name in names)
+
+
+def columns(extra=()):
+    """What a listing selects: the fields first, then enhanced_path, archived_at and has_payload."""
+    return [getattr(EnhancedImage, name) for name in LISTING_FIELDS + tuple(extra)] + [
+        EnhancedImage.enhanced_path,
+        EnhancedImage.archived_at,
+        EnhancedImage.enhanced_image_data.isnot(None).label('has_payload'),
+    ]
+
+
+def to_dicts(rows, extra=()):
+    """JSON-ready dicts for rows selected with columns(extra)."""
+    names = LISTING_FIELDS + tuple(extra)
+    parse_settings = 'enhancement_settings' in extra
+    photos = []
+    for row in rows:
+        photo = dict(zip(names, row))
+        if photo['created_at'] is not None:
+            photo['created_at'] = photo['created_at'].isoformat()
+        if parse_settings and photo['enhancement_settings']:
+            photo['enhancement_settings'] = json.loads(photo['enhancement_settings'])
+        photos.append(photo)
+    return photos
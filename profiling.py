@@ -0,0 +1,225 @@
+import os
+import io
+import re
+import time
+import uuid
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+from datetime import datetime
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+# Oldest runs are deleted once the directory holds more than this many
+PROFILE_MAX_RUNS = int(os.getenv('PROFILE_MAX_RUNS', '50'))
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'True').lower() == 'true'
+
+MODES = ('cpu', 'memory')
+RUN_ID_PATTERN = re.compile(r'^[0-9]{8}T[0-9]{6}_[A-Za-z0-9_-]+_[0-9a-f]{8}$')
+FILE_SUFFIXES = {
+    'cpu': ('.pstats', '.collapsed'),
+    'memory': ('.tracemalloc.txt', '.tracemalloc'),
+}
+
+# cProfile and tracemalloc are process-wide; profile one request at a time per worker
+_profile_lock = threading.Lock()
+_is_allowed = None
+
+
+def requested_mode():
+    """Profiling mode asked for by the X-Profile header or the __profile query param, or None."""
+    value = (request.headers.get('X-Profile') or request.args.get('__profile') or '').strip().lower()
+    if not value:
+        return None
+    if value in ('1', 'true', 'yes'):
+        return 'cpu'
+    return value if value in MODES else None
+
+
+def collapsed_stacks(stats):
+    """Convert cProfile stats to flamegraph.pl / speedscope "collapsed" lines.
+
+    cProfile only records caller->callee edges, not full stacks, so each path's time
+    is estimated by splitting a function's cumulative time across its callers in
+    proportion to the edge times. Weights are microseconds.
+    """
+    raw = stats.stats
+    children = {}
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller, edge in callers.items():
+            children.setdefault(caller, []).append((func, edge[3]))
+
+    def label(func):
+        filename, line, name = func
+        return f"{name} ({os.path.basename(filename)}:{line})".replace(';', ':')
+
+    lines = {}
+
+    def walk(func, stack, share):
+        self_time = raw[func][2]
+        stack = stack + [label(func)]
+        weight = int(self_time * share * 1_000_000)
+        if weight > 0:
+            key = ';'.join(stack)
+            lines[key] = lines.get(key, 0) + weight
+        if len(stack) >= 64:
+            return
+        for child, edge_cumulative in children.get(func, ()):
+            if child not in raw or label(child) in stack or raw[child][3] <= 0:
+                continue
+            walk(child, stack, share * edge_cumulative / raw[child][3])
+
+    roots = [func for func, value in raw.items() if not value[4]]
+    for root in roots:
+        walk(root, [], 1.0)
+    return '\n'.join(f"{stack} {weight}" for stack, weight in sorted(lines.items())) + '\n'
+
+
+def _run_id():
+    endpoint = re.sub(r'[^A-Za-z0-9_-]', '_', request.endpoint or 'unknown')
+    return f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}_{endpoint}_{uuid.uuid4().hex[:8]}"
+
+
+def _start_profile():
+    if not PROFILING_ENABLED:
+        return
+    mode = requested_mode()
+    if mode is None or _is_allowed is None or not _is_allowed():
+        return
+    if not _profile_lock.acquire(blocking=False):
+        g._profile_skipped = 'busy'
+        return
+    if mode == 'memory' and tracemalloc.is_tracing():
+        _profile_lock.release()
+        g._profile_skipped = 'tracemalloc already active'
+        return
+
+    g._profile = {'mode': mode, 'run_id': _run_id(), 'start': time.perf_counter()}
+    if mode == 'cpu':
+        profiler = cProfile.Profile()
+        g._profile['profiler'] = profiler
+        profiler.enable()
+    else:
+        tracemalloc.start(25)
+
+
+def _stop_profile():
+    """Stop the active profiler, if any. Returns the profile state or None."""
+    state = g.pop('_profile', None)
+    if state is None:
+        return None
+    try:
+        state['duration'] = time.perf_counter() - state['start']
+        if state['mode'] == 'cpu':
+            state['profiler'].disable()
+        else:
+            state['snapshot'] = tracemalloc.take_snapshot()
+            state['current'], state['peak'] = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    finally:
+        _profile_lock.release()
+    return state
+
+
+def _write_profile(state, status):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, state['run_id'])
+    if state['mode'] == 'cpu':
+        stats = pstats.Stats(state['profiler'])
+        stats.dump_stats(base + '.pstats')
+        with open(base + '.collapsed', 'w') as f:
+            f.write(collapsed_stacks(stats))
+    else:
+        snapshot = state['snapshot']
+        snapshot.dump(base + '.tracemalloc')
+        report = io.StringIO()
+        report.write(f"# {request.method} {request.full_path} -> {status}\n")
+        report.write(f"# duration_ms={state['duration'] * 1000:.1f}\n")
+        report.write(f"# peak_kb={state['peak'] / 1024:.1f} current_kb={state['current'] / 1024:.1f}\n\n")
+        for stat in snapshot.statistics('lineno')[:50]:
+            report.write(f"{stat}\n")
+        with open(base + '.tracemalloc.txt', 'w') as f:
+            f.write(report.getvalue())
+    _rotate()
+
+
+def _rotate():
+    runs = list_runs()
+    for run in runs[PROFILE_MAX_RUNS:]:
+        for filename in run['files']:
+            try:
+                os.remove(os.path.join(PROFILE_DIR, filename))
+            except OSError:
+                pass
+
+
+def _finish_profile(response):
+    skipped = g.pop('_profile_skipped', None)
+    if skipped:
+        response.headers['X-Profile-Skipped'] = skipped
+    state = _stop_profile()
+    if state is None:
+        return response
+    try:
+        _write_profile(state, response.status_code)
+        response.headers['X-Profile-Id'] = state['run_id']
+        logger.info(f"Saved {state['mode']} profile {state['run_id']} ({state['duration'] * 1000:.1f} ms)")
+    except Exception as e:
+        logger.error(f"Failed to save profile {state['run_id']}: {e}", exc_info=True)
+    return response
+
+
+def _teardown_profile(exc):
+    # after_request is skipped when the response itself fails; never leave a profiler running
+    _stop_profile()
+
+
+def list_runs():
+    """Saved runs, newest first: dicts with run_id, mode, endpoint, created_at, size and files."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    runs = {}
+    for filename in os.listdir(PROFILE_DIR):
+        run_id = filename.split('.', 1)[0]
+        if not RUN_ID_PATTERN.match(run_id):
+            continue
+        path = os.path.join(PROFILE_DIR, filename)
+        run = runs.setdefault(run_id, {'run_id': run_id, 'files': [], 'size': 0, 'mode': 'cpu'})
+        run['files'].append(filename)
+        run['size'] += os.path.getsize(path)
+        if filename.endswith('.tracemalloc') or filename.endswith('.tracemalloc.txt'):
+            run['mode'] = 'memory'
+    for run in runs.values():
+        stamp, rest = run['run_id'].split('_', 1)
+        run['endpoint'] = rest.rsplit('_', 1)[0]
+        run['created_at'] = datetime.strptime(stamp, '%Y%m%dT%H%M%S')
+        run['files'].sort()
+    return sorted(runs.values(), key=lambda run: run['run_id'], reverse=True)
+
+
+def profile_path(filename):
+    """Absolute path of a saved profile file, or None if the name is not one of ours."""
+    run_id = filename.split('.', 1)[0]
+    if not RUN_ID_PATTERN.match(run_id) or os.path.basename(filename) != filename:
+        return None
+    if not any(filename.endswith(suffix) for suffixes in FILE_SUFFIXES.values() for suffix in suffixes):
+        return None
+    path = os.path.abspath(os.path.join(PROFILE_DIR, filename))
+    return path if os.path.isfile(path) else None
+
+
+def init_app(app, is_allowed):
+    """Register the profiling hooks. `is_allowed()` decides whether the current user may profile.
+
+    Register last so the profiler starts after the other before_request hooks and wraps
+    only the view.
+    """
+    global _is_allowed
+    _is_allowed = is_allowed
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    app.teardown_request(_teardown_profile)
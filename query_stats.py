@@ -0,0 +1,154 @@
+import os
+import re
+import time
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import metrics
+from request_timing import record_span
+
+logger = logging.getLogger(__name__)
+
+# Statements slower than this are logged with their parameters redacted
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+# The same statement shape this many times in one request is reported as a likely N+1
+REPEATED_QUERY_THRESHOLD = int(os.getenv('REPEATED_QUERY_THRESHOLD', '5'))
+
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\?|:\w+")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+# Open query_budget() blocks, innermost last
+_budgets = ContextVar('query_budgets', default=())
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def statement_shape(statement):
+    """Normalise a statement so calls that differ only in bound values compare equal.
+
+    Placeholders of every DB-API paramstyle become '?' and expanded IN lists collapse to '(?)'.
+    """
+    shape = _PLACEHOLDER.sub('?', statement)
+    shape = _PLACEHOLDER_LIST.sub('(?)', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+def redact_parameters(parameters):
+    """Replace bound values with their type (and length for strings/bytes) for logging."""
+    def redact(value):
+        if value is None:
+            return None
+        if isinstance(value, (str, bytes)):
+            return f"<{type(value).__name__}:{len(value)}>"
+        return f"<{type(value).__name__}>"
+
+    if isinstance(parameters, dict):
+        return {key: redact(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            # executemany: summarise instead of listing every row
+            return f"<{len(parameters)} parameter sets>"
+        return [redact(value) for value in parameters]
+    return redact(parameters)
+
+
+def _request_stats():
+    if not has_request_context():
+        return None
+    stats = g.get('_query_stats')
+    if stats is None:
+        stats = g._query_stats = {'count': 0, 'seconds': 0.0, 'shapes': Counter()}
+    return stats
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('_query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+
+    stats = _request_stats()
+    if stats is not None:
+        stats['count'] += 1
+        stats['seconds'] += elapsed
+        stats['shapes'][statement_shape(statement)] += 1
+
+    for budget in _budgets.get():
+        budget['count'] += 1
+        budget['statements'].append(statement_shape(statement))
+
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        metrics.DB_SLOW_QUERIES.inc()
+        logger.warning(
+            f"Slow query ({elapsed * 1000:.1f} ms) on "
+            f"{request.endpoint if has_request_context() else 'no request'}: "
+            f"{_WHITESPACE.sub(' ', statement).strip()} params={redact_parameters(parameters)}"
+        )
+
+
+def _on_error(exception_context):
+    # after_cursor_execute does not fire for failed statements
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('_query_start'):
+        conn.info['_query_start'].pop()
+
+
+def _finish_request(response):
+    stats = g.get('_query_stats')
+    if not stats:
+        return response
+    endpoint = request.endpoint or 'unknown'
+    # Shows up in Server-Timing and the request_timing log line next to the other stages
+    record_span('db', stats['seconds'])
+    metrics.DB_QUERIES_PER_REQUEST.labels(endpoint).observe(stats['count'])
+
+    repeated = {shape: n for shape, n in stats['shapes'].items() if n >= REPEATED_QUERY_THRESHOLD}
+    for shape, n in repeated.items():
+        metrics.DB_REPEATED_STATEMENTS.labels(endpoint).inc()
+        logger.warning(f"Possible N+1 on {endpoint}: statement ran {n} times in one request: {shape[:300]}")
+    return response
+
+
+@contextmanager
+def query_budget(max_queries):
+    """Fail if the enclosed block issues more than `max_queries` SQL statements.
+
+    Works with the Flask test client, which runs requests in the calling thread:
+
+        with query_budget(4):
+            client.get('/api/photos')
+    """
+    budget = {'count': 0, 'statements': []}
+    token = _budgets.set(_budgets.get() + (budget,))
+    try:
+        yield budget
+    finally:
+        _budgets.reset(token)
+    if budget['count'] > max_queries:
+        shapes = Counter(budget['statements']).most_common(5)
+        detail = '; '.join(f"{n}x {shape[:120]}" for shape, n in shapes)
+        raise QueryBudgetExceeded(f"{budget['count']} queries issued, budget was {max_queries}. Most frequent: {detail}")
+
+
+def init_app(app):
+    """Attach the query listeners to every engine and the per-request summary to the app.
+
+    Register after request_timing.init_app so the 'db' span is recorded before the
+    Server-Timing header is written (after_request hooks run in reverse order).
+    """
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _on_error)
+    app.after_request(_finish_request)
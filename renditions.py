@@ -0,0 +1,202 @@
+"""
+Resized copies of photos for grids and thumbnails, cached on disk.
+
+The galleries used to load full-size originals and 1200px previews just to draw cards a
+few hundred pixels wide. /api/photos/<id>/rendition serves a copy at one of
+RENDITION_WIDTHS in WebP or JPEG instead. Each variant is generated once and cached
+under RENDITION_DIR, one file per (photo, source, width, format, watermark).
+Files are sharded by photo id (storage.keyed_path), so all variants of a photo share a
+directory. The cache is shared by all workers on the machine and evicted least recently
+used once it grows past RENDITION_CACHE_MB. A hit refreshes the file's access time, so eviction
+works across workers without any shared state.
+
+Photos never change after they are created, so a cached file only goes stale when the
+photo is deleted (discard()).
+"""
+
+import os
+import zlib
+import time
+import logging
+import threading
+from io import BytesIO
+
+from PIL import Image
+
+import metrics
+import storage
+
+logger = logging.getLogger(__name__)
+
+RENDITION_DIR = os.getenv('RENDITION_DIR', 'renditions')
+RENDITION_CACHE_MB = int(os.getenv('RENDITION_CACHE_MB', '512'))
+# Requested widths are rounded up to one of these so the cache holds a few variants per photo
+RENDITION_WIDTHS = (160, 480, 1200)
+DEFAULT_WIDTH = 480
+
+# fmt query value -> (Pillow format, mimetype, file extension, save options)
+FORMATS = {
+    'webp': ('WEBP', 'image/webp', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'image/jpeg', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Eviction stops once the cache is back under this share of the budget, so it does not
+# rescan the directory on every write
+_EVICT_TO = 0.9
+# Rescan the directory at least this often, so writes from other workers are counted
+_RESCAN_EVERY = 200
+# Access times are refreshed at most this often per file
+_TOUCH_INTERVAL = 60
+
+_lock = threading.Lock()
+_cached_bytes = None
+_stores_since_scan = 0
+
+os.makedirs(RENDITION_DIR, exist_ok=True)
+
+
+def standard_width(requested):
+    """Smallest standard width at least as wide as `requested` (the largest if none is)."""
+    if not requested or requested <= 0:
+        return DEFAULT_WIDTH
+    for width in RENDITION_WIDTHS:
+        if width >= requested:
+            return width
+    return RENDITION_WIDTHS[-1]
+
+
+def negotiate_format(requested, accept_header):
+    """fmt query value, or WebP when the Accept header names it. None for an unknown format."""
+    if requested:
+        requested = requested.lower()
+        if requested == 'jpg':
+            requested = 'jpeg'
+        return requested if requested in FORMATS else None
+    # Browsers list image/webp explicitly; */* alone (curl, old clients) gets JPEG
+    return 'webp' if 'image/webp' in (accept_header or '') else 'jpeg'
+
+
+def mimetype(fmt):
+    return FORMATS[fmt][1]
+
+
+def cache_path(photo_id, source, width, fmt, watermarked):
+    suffix = '_wm' if watermarked else ''
+    return storage.keyed_path(RENDITION_DIR, photo_id, f"{photo_id}_{source}_{width}{suffix}.{FORMATS[fmt][2]}")
+
+
+def open_cached(path):
+    """The cached rendition opened for reading, or None. Marks it as recently used.
+
+    An open file rather than a yes/no: evict() in another worker, or the janitor, may delete
+    the file at any moment, and an open handle still reads it to the end.
+    """
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        metrics.record_cache('rendition', False)
+        return None
+    metrics.record_cache('rendition', True)
+    stat = os.fstat(f.fileno())
+    now = time.time()
+    if now - stat.st_atime > _TOUCH_INTERVAL:
+        try:
+            # Only atime changes: mtime feeds the ETag/Last-Modified validators
+            os.utime(path, (now, stat.st_mtime))
+        except OSError:
+            pass
+    return f
+
+
+def etag(path, mtime, size):
+    """The ETag send_file() gives a response for `path`, so validators stay the same for clients."""
+    return f"{mtime}-{size}-{zlib.adler32(path.encode('utf-8')) & 0xFFFFFFFF}"
+
+
+@metrics.timed(metrics.IMAGE_OPERATION_SECONDS, 'rendition')
+def render(source, width, fmt, watermark=None):
+    """Encode `source` (a path or file object) at `width` pixels wide as `fmt` bytes.
+
+    Images narrower than `width` are not upscaled. `watermark`, if given, is called with
+    the resized RGB image and returns the image to encode.
+    """
+    pil_format, _, _, options = FORMATS[fmt]
+    with Image.open(source) as img:
+        if img.width > width:
+            # JPEG: let libjpeg decode at 1/2, 1/4 or 1/8 scale instead of full size
+            img.draft('RGB', (width, max(1, img.height * width // img.width)))
+        image = img.convert('RGB')
+    if image.width > width:
+        image = image.resize((width, max(1, round(image.height * width / image.width))), Image.Resampling.LANCZOS)
+    if watermark is not None:
+        image = watermark(image)
+    output = BytesIO()
+    image.save(output, format=pil_format, **options)
+    return output.getvalue()
+
+
+def store(path, data):
+    """Write a rendition atomically (concurrent requests may render the same one)."""
+    global _cached_bytes, _stores_since_scan
+    storage.write_atomic(path, data)
+
+    with _lock:
+        _stores_since_scan += 1
+        if _cached_bytes is not None:
+            _cached_bytes += len(data)
+        needs_scan = (_cached_bytes is None or _stores_since_scan >= _RESCAN_EVERY
+                      or _cached_bytes > RENDITION_CACHE_MB * 1024 * 1024)
+    if needs_scan:
+        evict()
+
+
+def evict():
+    """Measure the cache and delete least recently used renditions while over budget."""
+    global _cached_bytes, _stores_since_scan
+    entries = []
+    for directory, _, filenames in os.walk(RENDITION_DIR):
+        for name in filenames:
+            if name.endswith('.tmp'):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue  # Evicted by another worker meanwhile
+            entries.append((stat.st_atime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    budget = RENDITION_CACHE_MB * 1024 * 1024
+
+    removed = 0
+    if total > budget:
+        target = budget * _EVICT_TO
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        logger.info(f"Evicted {removed} renditions; cache is {total / (1024 * 1024):.1f} MB")
+
+    with _lock:
+        _cached_bytes = total
+        _stores_since_scan = 0
+    return removed
+
+
+def discard(photo_id):
+    """Delete every cached rendition of a photo."""
+    prefix = f"{photo_id}_"
+    try:
+        entries = list(os.scandir(storage.keyed_dir(RENDITION_DIR, photo_id)))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.name.startswith(prefix):
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
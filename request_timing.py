@@ -0,0 +1,73 @@
+import os
+import json
+import time
+import logging
+from contextlib import contextmanager
+from flask import g, request, has_request_context
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', 'True').lower() == 'true'
+
+
+def record_span(name, seconds):
+    """Attach a stage duration to the current request. No-op outside a request."""
+    if not has_request_context():
+        return
+    spans = g.get('_timing_spans')
+    if spans is None:
+        spans = g._timing_spans = {}
+    spans[name] = spans.get(name, 0.0) + seconds
+
+
+@contextmanager
+def span(name):
+    """Time a block as a named stage of the current request.
+
+    Repeated spans with the same name within one request are summed.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+
+def _start_request_timer():
+    g._timing_start = time.perf_counter()
+
+
+def _finish_request_timer(response):
+    start = g.get('_timing_start')
+    if start is None:
+        return response
+    total = time.perf_counter() - start
+    spans = g.get('_timing_spans') or {}
+    endpoint = request.endpoint or 'unknown'
+
+    metrics.observe_request(endpoint, request.method, response.status_code, total)
+    for name, seconds in spans.items():
+        metrics.observe_stage(endpoint, name, seconds)
+
+    if SERVER_TIMING_ENABLED:
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in spans.items()]
+        entries.append(f"total;dur={total * 1000:.1f}")
+        response.headers['Server-Timing'] = ', '.join(entries)
+
+    if spans:
+        # One JSON line per instrumented request so log tooling can index the fields
+        logger.info("request_timing %s", json.dumps({
+            'endpoint': endpoint,
+            'method': request.method,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'stages_ms': {name: round(seconds * 1000, 1) for name, seconds in spans.items()},
+        }))
+    return response
+
+
+def init_app(app):
+    """Register the request timer hooks on the Flask app."""
+    app.before_request(_start_request_timer)
+    app.after_request(_finish_request_timer)
@@ -17,8 +17,11 @@ let paginationState = {
     perPage: 10,
     totalPages: 0,
     totalPhotos: 0,
+    totalExact: true,
     hasNext: false,
-    hasPrev: false
+    hasPrev: false,
+    // cursors[i] is the /api/photos cursor for page i + 1 (null for the first page)
+    cursors: [null]
 };
 
 // Initialize
@@ -121,7 +124,8 @@ function loadEnhancedImagesFromStorage() {
     }
 }
 
-// Load user's previously enhanced photos from database with pagination
+// Load user's previously enhanced photos from database with pagination.
+// Pages are keyset cursors, so only page 1 and pages already reached by Next can be loaded.
 async function loadUserPhotosFromDatabase(page = 1) {
     console.log(`Loading user photos from database (page ${page})...`);
     
@@ -134,8 +138,26 @@ async function loadUserPhotosFromDatabase(page = 1) {
         return;
     }
     
+    if (page === 1) {
+        // New photos shift every page, so cursors from an earlier listing are stale
+        paginationState.cursors = [null];
+    }
+    const cursor = paginationState.cursors[page - 1];
+    if (cursor === undefined) {
+        console.warn(`No cursor for page ${page}`);
+        return;
+    }
+    
+    const params = new URLSearchParams({ per_page: paginationState.perPage });
+    if (cursor) {
+        params.set('cursor', cursor);
+    } else {
+        // Count once per listing; later pages keep this total
+        params.set('total', '1');
+    }
+    
     try {
-        const response = await fetch(`/api/photos?page=${page}&per_page=${paginationState.perPage}`);
+        const response = await fetch(`/api/photos?${params}`);
         if (!response.ok) {
             console.error('Failed to load photos from database:', response.status);
             return;
@@ -149,11 +171,17 @@ async function loadUserPhotosFromDatabase(page = 1) {
         
         // Update pagination state
         if (data.pagination) {
-            paginationState.currentPage = data.pagination.page;
-            paginationState.totalPages = data.pagination.pages;
-            paginationState.totalPhotos = data.pagination.total;
+            paginationState.currentPage = page;
             paginationState.hasNext = data.pagination.has_next;
             paginationState.hasPrev = data.pagination.has_prev;
+            if (data.pagination.next_cursor) {
+                paginationState.cursors[page] = data.pagination.next_cursor;
+            }
+            if (data.pagination.total !== null) {
+                paginationState.totalPages = data.pagination.pages;
+                paginationState.totalPhotos = data.pagination.total;
+                paginationState.totalExact = data.pagination.total_exact;
+            }
         }
         
         if (!data.photos || data.photos.length === 0) {
@@ -174,7 +202,9 @@ async function loadUserPhotosFromDatabase(page = 1) {
             originalName: photo.original_filename,
             originalUrl: `/api/photos/${photo.id}/original`,
             enhancedUrl: `/api/photos/${photo.id}/enhanced`,
-            enhancements: photo.enhancement_settings || {},
+            // Grid thumbnails; the comparison modal still loads the full images
+            originalThumbUrl: `/api/photos/${photo.id}/rendition?src=original&w=480`,
+            enhancedThumbUrl: `/api/photos/${photo.id}/rendition?w=480`,
             createdAt: photo.created_at,
             selected: false
         }));
@@ -208,19 +238,22 @@ function updatePaginationControls() {
     }
     
     // Show pagination only if there are multiple pages
-    if (paginationState.totalPages > 1) {
+    if (paginationState.hasNext || paginationState.hasPrev) {
         paginationContainer.style.display = 'flex';
         
         // Update info text
         const start = (paginationState.currentPage - 1) * paginationState.perPage + 1;
-        const end = Math.min(paginationState.currentPage * paginationState.perPage, paginationState.totalPhotos);
-        paginationInfo.textContent = `Showing ${start}-${end} of ${paginationState.totalPhotos} photos`;
+        const end = Math.max(start, Math.min(paginationState.currentPage * paginationState.perPage, paginationState.totalPhotos));
+        const total = `${paginationState.totalPhotos}${paginationState.totalExact ? '' : '+'}`;
+        paginationInfo.textContent = `Showing ${start}-${end} of ${total} photos`;
         
-        // Update page numbers
+        // Page numbers, up to the furthest page we hold a cursor for
         let pageNumbers = '';
         const maxVisiblePages = 5;
+        const lastReachable = Math.min(paginationState.cursors.length,
+                                       Math.max(paginationState.totalPages, paginationState.currentPage));
         let startPage = Math.max(1, paginationState.currentPage - Math.floor(maxVisiblePages / 2));
-        let endPage = Math.min(paginationState.totalPages, startPage + maxVisiblePages - 1);
+        let endPage = Math.min(lastReachable, startPage + maxVisiblePages - 1);
         
         if (endPage - startPage < maxVisiblePages - 1) {
             startPage = Math.max(1, endPage - maxVisiblePages + 1);
@@ -241,11 +274,14 @@ function updatePaginationControls() {
             }
         }
         
-        if (endPage < paginationState.totalPages) {
-            if (endPage < paginationState.totalPages - 1) {
+        if (endPage < lastReachable) {
+            if (endPage < lastReachable - 1) {
                 pageNumbers += `<span class="pagination-ellipsis">...</span>`;
             }
-            pageNumbers += `<button class="pagination-page-btn" onclick="goToPage(${paginationState.totalPages})">${paginationState.totalPages}</button>`;
+            pageNumbers += `<button class="pagination-page-btn" onclick="goToPage(${lastReachable})">${lastReachable}</button>`;
+        }
+        if (paginationState.hasNext && lastReachable < paginationState.totalPages) {
+            pageNumbers += `<span class="pagination-ellipsis">...</span>`;
         }
         
         paginationPages.innerHTML = pageNumbers;
@@ -260,7 +296,7 @@ function updatePaginationControls() {
 
 // Navigation functions
 function goToPage(page) {
-    if (page >= 1 && page <= paginationState.totalPages && page !== paginationState.currentPage) {
+    if (page >= 1 && page <= paginationState.cursors.length && page !== paginationState.currentPage) {
         loadUserPhotosFromDatabase(page);
     }
 }
@@ -416,10 +452,18 @@ async function handleFiles(files) {
             
             updateProgress(progressItem, processingMessage, 40);
             
-            const response = await fetch(endpoint, {
-                method: 'POST',
-                body: formData
-            });
+            const response = typeof postPhotoForm === 'function'
+                ? await postPhotoForm(endpoint, formData, (fraction) => {
+                    if (fraction < 1) {
+                        updateProgress(progressItem, 'Uploading...', 20 + Math.round(fraction * 20));
+                    } else {
+                        updateProgress(progressItem, processingMessage, 40);
+                    }
+                })
+                : await fetch(endpoint, {
+                    method: 'POST',
+                    body: formData
+                });
 
             if (!response.ok) {
                 const errorData = await response.json().catch(() => ({ error: 'Unknown error' }));
@@ -521,13 +565,13 @@ function displayResults() {
                 <div class="comparison-side">
                     <div class="comparison-label-small">${image.conversionType === 'night_conversion' ? 'Day' : 'Before'}</div>
                     <div class="result-image-container">
-                        <img src="${image.originalUrl}" alt="${image.conversionType === 'night_conversion' ? 'Original day property photo' : 'Original'}" class="result-image" loading="lazy">
+                        <img src="${image.originalThumbUrl || image.originalUrl}" alt="${image.conversionType === 'night_conversion' ? 'Original day property photo' : 'Original'}" class="result-image" loading="lazy">
                     </div>
                 </div>
                 <div class="comparison-side">
                     <div class="comparison-label-small">${image.conversionType === 'night_conversion' ? 'Night' : 'After'}</div>
                     <div class="result-image-container">
-                        <img src="${image.id ? `/api/photos/${image.id}/preview` : image.enhancedUrl}" alt="${image.conversionType === 'night_conversion' ? 'Night-converted property photo with lights on' : 'Enhanced'}" class="result-image" loading="lazy" oncontextmenu="return false;" draggable="false">
+                        <img src="${image.enhancedThumbUrl || (image.id ? `/api/photos/${image.id}/preview` : image.enhancedUrl)}" alt="${image.conversionType === 'night_conversion' ? 'Night-converted property photo with lights on' : 'Enhanced'}" class="result-image" loading="lazy" oncontextmenu="return false;" draggable="false">
                     </div>
                 </div>
             </div>
@@ -582,6 +626,18 @@ function downloadImage(url, filename) {
         });
 }
 
+/**
+ * Download saved photos as a single ZIP. A plain link lets the browser stream the
+ * archive to disk instead of collecting it in a blob.
+ */
+function downloadZip(photoIds) {
+    const link = document.createElement('a');
+    link.href = `/api/photos/download-zip?ids=${photoIds.join(',')}`;
+    document.body.appendChild(link);
+    link.click();
+    document.body.removeChild(link);
+}
+
 function showComparison(index) {
     const image = enhancedImages[index];
     const modal = document.getElementById('comparisonModal');
@@ -735,6 +791,13 @@ if (downloadAllBtn) {
         }
         
         // Payment completed or not required (preview photos) - proceed with download
+        // Several saved photos: one ZIP streamed by the server straight to the browser's
+        // download manager (nothing is buffered in page memory)
+        if (photoIds.length > 1 && photoIds.length === selectedImages.length) {
+            downloadZip(photoIds);
+            return;
+        }
+        
         // Sequential downloads with delay: browsers block multiple programmatic downloads
         // in one gesture unless each is triggered one-after-another with a short gap.
         for (const image of selectedImages) {
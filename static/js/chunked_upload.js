@@ -0,0 +1,133 @@
+(function (global) {
+    // Files above this size go through /api/uploads in resumable chunks
+    const CHUNKED_UPLOAD_THRESHOLD = 4 * 1024 * 1024;
+    const MAX_CHUNK_RETRIES = 8;
+
+    const OPERATIONS = {
+        '/api/enhance': 'enhance',
+        '/api/convert-to-night': 'night',
+    };
+
+    function sleep(ms) {
+        return new Promise(function (resolve) {
+            setTimeout(resolve, ms);
+        });
+    }
+
+    async function errorFrom(response) {
+        var data = await response.json().catch(function () {
+            return {};
+        });
+        var error = new Error(data.error || 'Upload failed (HTTP ' + response.status + ')');
+        error.response = response;
+        error.data = data;
+        return error;
+    }
+
+    async function chunkChecksum(chunk) {
+        // crypto.subtle only exists on HTTPS pages (and localhost)
+        if (!global.crypto || !global.crypto.subtle) {
+            return null;
+        }
+        var digest = await global.crypto.subtle.digest('SHA-256', await chunk.arrayBuffer());
+        return Array.from(new Uint8Array(digest))
+            .map(function (b) {
+                return b.toString(16).padStart(2, '0');
+            })
+            .join('');
+    }
+
+    async function serverOffset(uploadId) {
+        var response = await fetch('/api/uploads/' + uploadId, { cache: 'no-store' });
+        if (!response.ok) {
+            throw await errorFrom(response);
+        }
+        return (await response.json()).offset;
+    }
+
+    async function sendChunks(upload, file, onProgress) {
+        var offset = upload.offset || 0;
+        var failures = 0;
+        while (offset < file.size) {
+            var chunk = file.slice(offset, offset + upload.chunk_size);
+            try {
+                var headers = { 'Upload-Offset': String(offset), 'Content-Type': 'application/octet-stream' };
+                var checksum = await chunkChecksum(chunk);
+                if (checksum) {
+                    headers['Upload-Checksum'] = 'sha256 ' + checksum;
+                }
+                var response = await fetch('/api/uploads/' + upload.upload_id, {
+                    method: 'PUT',
+                    headers: headers,
+                    body: chunk,
+                });
+                if (response.ok || response.status === 409) {
+                    // 409: the server has a different offset (a retried chunk had arrived)
+                    var data = await response.json();
+                    if (typeof data.offset !== 'number') {
+                        throw await errorFrom(response);
+                    }
+                    offset = data.offset;
+                    failures = 0;
+                    if (onProgress) {
+                        onProgress(offset / file.size);
+                    }
+                    continue;
+                }
+                if (response.status < 500 && response.status !== 422) {
+                    throw await errorFrom(response);
+                }
+                throw new Error('Chunk upload failed (HTTP ' + response.status + ')');
+            } catch (e) {
+                if (e.response && e.response.status < 500) {
+                    throw e;
+                }
+                failures += 1;
+                if (failures > MAX_CHUNK_RETRIES) {
+                    throw e;
+                }
+                console.warn('Chunk upload failed, resuming:', e);
+                await sleep(Math.min(30000, 1000 * Math.pow(2, failures - 1)));
+                offset = await serverOffset(upload.upload_id).catch(function () {
+                    return offset;
+                });
+            }
+        }
+    }
+
+    // Send formData (an `image` file plus settings) to /api/enhance or /api/convert-to-night.
+    // Large files are uploaded in chunks that resume after network errors, then finalized
+    // with the same settings. Resolves to the endpoint's Response either way.
+    async function postPhotoForm(endpoint, formData, onProgress) {
+        var file = formData.get('image');
+        var operation = OPERATIONS[endpoint];
+        if (!operation || !(file instanceof Blob) || file.size <= CHUNKED_UPLOAD_THRESHOLD) {
+            return fetch(endpoint, { method: 'POST', body: formData });
+        }
+
+        var created = await fetch('/api/uploads', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: file.name, size: file.size }),
+        });
+        if (!created.ok) {
+            return created;
+        }
+        var upload = await created.json();
+        await sendChunks(upload, file, onProgress);
+
+        var finalizeData = new FormData();
+        formData.forEach(function (value, key) {
+            if (key !== 'image') {
+                finalizeData.append(key, value);
+            }
+        });
+        finalizeData.append('operation', operation);
+        return fetch('/api/uploads/' + upload.upload_id + '/finalize', {
+            method: 'POST',
+            body: finalizeData,
+        });
+    }
+
+    global.postPhotoForm = postPhotoForm;
+})(typeof window !== 'undefined' ? window : globalThis);
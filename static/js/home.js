@@ -491,10 +491,18 @@ async function handleFiles(files) {
             
             updateProgress(progressItem, processingMessage, 40);
             
-            const response = await fetch(endpoint, {
-                method: 'POST',
-                body: formData
-            });
+            const response = typeof postPhotoForm === 'function'
+                ? await postPhotoForm(endpoint, formData, (fraction) => {
+                    if (fraction < 1) {
+                        updateProgress(progressItem, 'Uploading...', 20 + Math.round(fraction * 20));
+                    } else {
+                        updateProgress(progressItem, processingMessage, 40);
+                    }
+                })
+                : await fetch(endpoint, {
+                    method: 'POST',
+                    body: formData
+                });
 
             if (!response.ok) {
                 const errorData = await response.json().catch(() => ({ error: 'Unknown error' }));
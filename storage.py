@@ -0,0 +1,71 @@
+"""
+On-disk layout for photo files: unique names in sharded directories, written atomically.
+
+Uploads used to be saved as uploads/<filename> and results as
+enhanced/enhanced_<name>.jpg. Two users uploading IMG_0001.jpg at the same time
+overwrote each other's files in the middle of a request. Both directories were flat and
+grew without bound.
+
+New files get a random key instead. The first two byte pairs of the key pick the
+directory:
+
+    uploads/3f/a2/3fa2c9...e1.jpg
+
+That gives 65,536 directories, so even millions of files leave each one small. Every
+file is written to a temporary name in its final directory and renamed into place, so
+readers see either no file or the complete one. The display names users see
+(original_filename, enhanced_filename) are kept in the database.
+
+Existing rows keep their flat paths; those files are read from where they are.
+"""
+
+import os
+import uuid
+import hashlib
+from contextlib import contextmanager
+
+
+def shard_dir(root, key):
+    """root/ab/cd for a key beginning with abcd (a hex string)."""
+    return os.path.join(root, key[:2], key[2:4])
+
+
+def new_path(root, suffix=''):
+    """A path under `root` that no other file uses: root/ab/cd/<random key><suffix>."""
+    key = uuid.uuid4().hex
+    return os.path.join(shard_dir(root, key), f"{key}{suffix}")
+
+
+def keyed_dir(root, key):
+    """Shard directory for a key that is not random, like a photo id: sharded by its hash."""
+    return shard_dir(root, hashlib.sha1(str(key).encode()).hexdigest())
+
+
+def keyed_path(root, key, name):
+    return os.path.join(keyed_dir(root, key), name)
+
+
+@contextmanager
+def atomic_path(path):
+    """Yield a temporary path next to `path`; it is renamed to `path` if the block succeeds.
+
+    Creates the shard directory if needed. On failure the temporary file is removed and
+    `path` is left as it was.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def write_atomic(path, data):
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
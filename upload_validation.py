@@ -0,0 +1,169 @@
+"""
+Header checks for uploaded photos, made before the file is stored or decoded.
+
+An upload used to be written to uploads/ in full and then decoded by
+normalize_saved_upload(). A file that was not an image, or one whose header claims
+50,000 x 50,000 pixels, was only noticed at decode time. By then the worker might be
+allocating gigabytes. If normalize failed, the exception was logged and the raw file
+went on to the AI encoder, which decoded it again.
+
+save_stream() copies an upload into place while it checks the header bytes. The format
+comes from the leading magic bytes. Width and height come from the header: Pillow opens
+images lazily, and WebP is parsed here because Pillow needs the whole WebP file. The
+file is refused as soon as the header shows it is unsupported or over
+UPLOAD_MAX_MEGAPIXELS, before the rest is written.
+
+Image.MAX_IMAGE_PIXELS is set to the same budget, so any decode in this process stops
+with DecompressionBombError at twice the budget, whether or not it came through here.
+"""
+
+import os
+import io
+import struct
+import logging
+import warnings
+from collections import namedtuple
+
+from PIL import Image
+
+import storage
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_MAX_MEGAPIXELS = float(os.getenv('UPLOAD_MAX_MEGAPIXELS', '60'))
+MAX_PIXELS = int(UPLOAD_MAX_MEGAPIXELS * 1_000_000)
+# JPEG metadata (EXIF, ICC, XMP) comes before the frame header. Headers not found within
+# this many bytes are checked once the whole file is written, still before any decode.
+SNIFF_BYTES = 256 * 1024
+SUPPORTED_FORMATS = {'JPEG', 'MPO', 'PNG', 'GIF', 'WEBP'}
+
+_COPY_SIZE = 64 * 1024
+
+Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+
+ImageInfo = namedtuple('ImageInfo', 'format width height')
+
+
+class UploadRejected(Exception):
+    """The upload is not an image this app accepts; `status` is the HTTP status to answer with."""
+
+    status = 400
+
+
+class ImageTooLarge(UploadRejected):
+    status = 413
+
+
+def _magic_format(head):
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'JPEG'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'PNG'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'GIF'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
+
+
+def _webp_size(head):
+    """(width, height) from a WebP header, or None if `head` is too short."""
+    if len(head) < 30:
+        return None
+    chunk = head[12:16]
+    if chunk == b'VP8 ':
+        if head[23:26] != b'\x9d\x01\x2a':
+            raise UploadRejected('The image file is corrupt')
+        width, height = struct.unpack('<HH', head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L':
+        if head[20] != 0x2F:
+            raise UploadRejected('The image file is corrupt')
+        bits = int.from_bytes(head[21:25], 'little')
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X':
+        return int.from_bytes(head[24:27], 'little') + 1, int.from_bytes(head[27:30], 'little') + 1
+    raise UploadRejected('The image file is corrupt')
+
+
+def _check(info):
+    if info.format not in SUPPORTED_FORMATS:
+        raise UploadRejected(f'Unsupported image format: {info.format}')
+    if info.width <= 0 or info.height <= 0:
+        raise UploadRejected('The image file is corrupt')
+    if info.width * info.height > MAX_PIXELS:
+        raise ImageTooLarge(
+            f'Image is too large ({info.width} x {info.height} pixels). '
+            f'The maximum is {UPLOAD_MAX_MEGAPIXELS:g} megapixels.'
+        )
+    return info
+
+
+def _open_header(fp, complete):
+    """ImageInfo read lazily by Pillow (no pixel data is decoded), or None if incomplete."""
+    try:
+        with warnings.catch_warnings():
+            # Over-budget sizes are reported by _check, not as a warning
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            with Image.open(fp) as img:
+                return ImageInfo(img.format, img.width, img.height)
+    except Image.DecompressionBombError:
+        raise ImageTooLarge(f'Image is too large. The maximum is {UPLOAD_MAX_MEGAPIXELS:g} megapixels.') from None
+    except Exception:
+        if complete:
+            raise UploadRejected('The image file is corrupt') from None
+        return None
+
+
+def sniff(head, complete=False):
+    """Checked ImageInfo from the first bytes of a file, or None if more bytes are needed.
+
+    `complete` means `head` is the whole file. Raises UploadRejected (ImageTooLarge for
+    over-budget dimensions) as soon as the bytes show the file is not acceptable.
+    """
+    if len(head) < 12 and not complete:
+        return None
+    image_format = _magic_format(head)
+    if image_format is None:
+        raise UploadRejected('Unsupported file type. Please upload a JPEG, PNG, GIF or WebP image.')
+    if image_format == 'WEBP':
+        size = _webp_size(head)
+        if size is None:
+            if complete:
+                raise UploadRejected('The image file is corrupt')
+            return None
+        return _check(ImageInfo(image_format, *size))
+    info = _open_header(io.BytesIO(head), complete)
+    return _check(info) if info else None
+
+
+def check_file(path, complete=True):
+    """sniff() for a file on disk. With `complete`, a header past SNIFF_BYTES is read too."""
+    with open(path, 'rb') as f:
+        head = f.read(SNIFF_BYTES)
+        info = sniff(head, complete=complete and len(head) < SNIFF_BYTES)
+        if info is None and complete:
+            f.seek(0)
+            info = _open_header(f, True)
+            info = _check(info)
+    return info
+
+
+def save_stream(stream, dst):
+    """Copy an upload stream to `dst`, checking its header on the way. Returns its ImageInfo.
+
+    The copy is written under a temporary name and renamed at the end, so a rejected or
+    interrupted upload leaves nothing at `dst`.
+    """
+    head = b''
+    info = None
+    with storage.atomic_path(dst) as tmp_path:
+        with open(tmp_path, 'wb') as out:
+            while block := stream.read(_COPY_SIZE):
+                if info is None and len(head) < SNIFF_BYTES:
+                    head += block
+                    info = sniff(head)
+                out.write(block)
+        if info is None:
+            info = check_file(tmp_path)
+    return info
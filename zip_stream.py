@@ -0,0 +1,132 @@
+"""
+Streaming ZIP writer for photo downloads.
+
+stream_zip() yields an archive chunk by chunk while it reads each file, so a download of
+any number of photos needs only one read buffer and a small central directory.
+Entries are stored, not deflated: JPEGs do not compress further, and storing keeps the
+CPU cost to a CRC pass.
+
+zipfile can write to a non-seekable stream, but it then puts the CRC and sizes in a data
+descriptor after each entry. Stored entries with data descriptors break streaming
+unzippers. Instead, each file is read twice here: once for its CRC, then again for its
+bytes. The local header therefore carries the real CRC and sizes. The second read comes
+from the page cache. ZIP64 records are added only when the archive passes 4 GB.
+"""
+
+import os
+import struct
+import zlib
+from datetime import datetime
+
+CHUNK_SIZE = 1024 * 1024
+
+_ZIP64_LIMIT = 0xFFFFFFFF
+# Placed in 32-bit fields whose real value is in the ZIP64 records
+_ZIP64_MARKER = 0xFFFFFFFF
+_UTF8_FLAG = 0x0800
+_VERSION = 20
+_VERSION_ZIP64 = 45
+
+
+def _dos_datetime(modified):
+    modified = max(modified or datetime.utcnow(), datetime(1980, 1, 1))
+    dos_time = (modified.hour << 11) | (modified.minute << 5) | (modified.second // 2)
+    dos_date = ((modified.year - 1980) << 9) | (modified.month << 5) | modified.day
+    return dos_time, dos_date
+
+
+def _open(source):
+    """A binary file object for a path, or the object itself (BytesIO)."""
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, 'rb')
+    source.seek(0)
+    return source
+
+
+def _crc_and_size(source, chunk_size):
+    crc = 0
+    size = 0
+    f = _open(source)
+    try:
+        while chunk := f.read(chunk_size):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+    finally:
+        if f is not source:
+            f.close()
+    return crc, size
+
+
+def stream_zip(entries, chunk_size=CHUNK_SIZE):
+    """Yield a stored ZIP archive of `entries`, an iterable of (name, source, modified).
+
+    `source` is a path or a seekable binary file object. It may also be a callable
+    returning one, which is resolved when the entry is reached. `modified` is a naive
+    UTC datetime or None. Entries whose source resolves to None are skipped. Names must
+    be unique.
+    """
+    offset = 0
+    directory = []
+    for name, source, modified in entries:
+        if callable(source):
+            source = source()
+        if source is None:
+            continue
+        name_bytes = name.encode('utf-8')
+        crc, size = _crc_and_size(source, chunk_size)
+        if size >= _ZIP64_LIMIT:
+            raise ValueError(f"{name} is too large for a stored ZIP entry")
+        dos_time, dos_date = _dos_datetime(modified)
+
+        header_offset = offset
+        header = struct.pack(
+            '<IHHHHHIIIHH', 0x04034B50, _VERSION, _UTF8_FLAG, 0, dos_time, dos_date,
+            crc, size, size, len(name_bytes), 0,
+        ) + name_bytes
+        yield header
+        offset += len(header)
+
+        f = _open(source)
+        try:
+            written = 0
+            while chunk := f.read(chunk_size):
+                written += len(chunk)
+                yield chunk
+        finally:
+            if f is not source:
+                f.close()
+        if written != size:
+            raise IOError(f"{name} changed while it was being archived")
+        offset += size
+        directory.append((name_bytes, crc, size, dos_time, dos_date, header_offset))
+
+    directory_offset = offset
+    for name_bytes, crc, size, dos_time, dos_date, header_offset in directory:
+        extra = b''
+        version = _VERSION
+        if header_offset >= _ZIP64_LIMIT:
+            extra = struct.pack('<HHQ', 0x0001, 8, header_offset)
+            header_offset = _ZIP64_MARKER
+            version = _VERSION_ZIP64
+        record = struct.pack(
+            '<IHHHHHHIIIHHHHHII', 0x02014B50, (3 << 8) | version, version, _UTF8_FLAG, 0,
+            dos_time, dos_date, crc, size, size, len(name_bytes), len(extra), 0, 0, 0,
+            0o100644 << 16, header_offset,
+        ) + name_bytes + extra
+        yield record
+        offset += len(record)
+
+    count = len(directory)
+    directory_size = offset - directory_offset
+    if count >= 0xFFFF or directory_offset >= _ZIP64_LIMIT or directory_size >= _ZIP64_LIMIT:
+        zip64_end_offset = offset
+        yield struct.pack(
+            '<IQHHIIQQQQ', 0x06064B50, 44, (3 << 8) | _VERSION_ZIP64, _VERSION_ZIP64, 0, 0,
+            count, count, directory_size, directory_offset,
+        )
+        yield struct.pack('<IIQI', 0x07064B50, 0, zip64_end_offset, 1)
+    yield struct.pack(
+        '<IHHHHIIH', 0x06054B50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+        directory_size if directory_size < _ZIP64_LIMIT else _ZIP64_MARKER,
+        directory_offset if directory_offset < _ZIP64_LIMIT else _ZIP64_MARKER, 0,
+    )